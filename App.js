@@ -69,10 +69,11 @@ function App(){
   async function book(doctor){
     if(!selectedHospital){ alert('Select a hospital first'); return; }
     if(!confirm(`Book appointment with ${doctor.name}?`)) return;
-    const dt = new Date().toISOString();
     try{
-      // Send minimal payload: hospital_id and scheduled_at (user_id and doctor_id are not required)
-      const resp = await fetch('/api/book',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hospital_id:selectedHospital.id, scheduled_at:dt})});
+      // bookings must start a free slot: take this doctor's next one
+      const avail = await (await fetch(`/api/doctor/${doctor.id}/availability`)).json();
+      if(!avail.next_free_slot){ alert(avail.error || 'No free slot in the next weeks'); return; }
+      const resp = await fetch('/api/book',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hospital_id:selectedHospital.id, doctor_id:doctor.id, scheduled_at:avail.next_free_slot})});
       const data = await resp.json();
       if(resp.ok) alert('Booked — id:'+ (data.appointment_id || data.id || 'unknown'));
       else alert(JSON.stringify(data));
@@ -1,19 +1,36 @@
 # app.py
-from flask import Flask, request, jsonify, render_template, send_from_directory, redirect, url_for, make_response
+from flask import Flask, request, jsonify, render_template, send_from_directory, redirect, url_for, make_response, Response, stream_with_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import csv
-import shutil
 import traceback
 from pathlib import Path
-from functools import lru_cache
 import argparse
-import random
+import threading
+import time
+import hashlib
+from collections import OrderedDict
+from storage import make_storage, ensure_csv, USERS_HEADER, APPTS_HEADER
+from backups import BackupManager
+from filecache import FileCache
+from sequences import Sequence
+from slots import SlotCalendar, SlotTaken, parse_when
+from search import HospitalSearchIndex
+from doctorsearch import DoctorFacetIndex
+from geo import GeoGrid
+from directory import parse_doctors_csv, parse_hospitals_csv
+from snapshot import SnapshotTable, load_snapshot
+from passwords import PasswordHasher, PasswordsBusy
+from sessions import SessionTokens
+from namegen import placeholder_doctor
+from listing import BadRequest, cursor_int, decode_cursor, encode_cursor, json_array_chunks, ndjson_lines, parse_fields, parse_limit, project
+from writecoord import WriteCoordinator
 
 CACHE_DIR = Path('.')
-DB_FILE = 'hospital.db'  # legacy path (no longer used for storage)
+DB_FILE = os.environ.get('SQLITE_DB', 'hospital.db')  # used when STORAGE_ENGINE=sqlite
+# 'csv' (default, users.csv/appointments.csv) or 'sqlite' (DB_FILE in WAL mode)
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'csv')
 app = Flask(__name__, static_folder='react_app/build', template_folder='templates')
 CORS(app)
 app.secret_key = os.environ.get('APP_SECRET', 'dev-secret-key')
@@ -27,228 +44,346 @@ USERS_CSV = Path('users.csv')
 APPTS_CSV = Path('appointments.csv')
 
 
-# CSV loaders with simple caching
-@lru_cache(maxsize=1)
+# CSV loaders. Parsed rows are cached per file and re-parsed only when the
+# file's (mtime, size, inode) changes; see filecache.py. Rows are compact
+# records (see directory.py) that answer .get() like dicts.
+FILE_CACHE = FileCache()
+
+
+# With DIRECTORY_SNAPSHOTS on (default), the directories are read from binary
+# snapshots next to the CSVs (see snapshot.py), rebuilt when a CSV changes.
+DIRECTORY_SNAPSHOTS = os.environ.get('DIRECTORY_SNAPSHOTS', '1') not in ('0', 'false', 'no')
+
+
+def _directory_loader(kind, parse):
+    def load(path):
+        if DIRECTORY_SNAPSHOTS and path.exists():
+            try:
+                return load_snapshot(path, kind)
+            except OSError as e:
+                # e.g. read-only data directory: parse in-process instead
+                print(f"Warning: directory snapshot for {path} unavailable: {e}")
+        return parse(path)
+    return load
+
+
+_load_hospitals = _directory_loader('hospitals', parse_hospitals_csv)
+_load_doctors = _directory_loader('doctors', parse_doctors_csv)
+
+
 def load_hospitals_csv():
-    if not HOSPITALS_CSV.exists():
-        return []
-    with HOSPITALS_CSV.open(newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-    # Normalize keys for easier access
-    cleaned = []
-    for r in rows:
-        # pick sensible fields if available
-        hosp_id = r.get('Sr_No') or r.get('SrNo') or r.get('id')
-        name = r.get('Hospital_Name') or r.get('Hospital_Name'.lower()) or r.get('HospitalName') or r.get('Hospital') or r.get('Hospital_Name')
-        locality = r.get('Town') or r.get('Location') or r.get('Subdistrict') or r.get('District') or ''
-        address = r.get('Address_Original_First_Line') or r.get('Address') or r.get('Address_Original') or ''
-        cleaned.append({'id': int(hosp_id) if hosp_id and str(hosp_id).isdigit() else hosp_id, 'name': name, 'locality': locality, 'address': address, 'raw': r})
-    return cleaned
-
-
-@lru_cache(maxsize=1)
-def load_doctors_csv():
+    return FILE_CACHE.get(HOSPITALS_CSV, _load_hospitals)
+
+
+def doctors_source():
     # prefer persisted shuffled file if present
-    source = DOCTORS_SHUFFLED if DOCTORS_SHUFFLED.exists() else DOCTORS_CSV
-    if not source.exists():
-        return []
-    with source.open(newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-    cleaned = []
-    for r in rows:
-        # keep types conservative; many fields may be strings
-        try:
-            doc_id = int(r.get('id')) if r.get('id') else None
-        except Exception:
-            doc_id = r.get('id')
-        try:
-            hosp_id = int(r.get('hospital_id')) if r.get('hospital_id') else None
-        except Exception:
-            hosp_id = r.get('hospital_id')
-        cleaned.append({
-            'id': doc_id,
-            'hospital_id': hosp_id,
-            'name': r.get('name'),
-            'specialty': r.get('specialty'),
-            'is_available': True if str(r.get('is_available')).strip() in ('1','True','true','t','yes') else False,
-            'ward': None,
-            'qualification': r.get('qualification'),
-            'experience_years': int(r.get('experience_years')) if r.get('experience_years') and str(r.get('experience_years')).isdigit() else (None if not r.get('experience_years') else r.get('experience_years')),
-            'email': r.get('email'),
-            'phone': r.get('phone')
-        })
-    return cleaned
+    return DOCTORS_SHUFFLED if DOCTORS_SHUFFLED.exists() else DOCTORS_CSV
+
+
+def load_doctors_csv():
+    # each source is cached separately, so when doctors_shuffled.csv appears the
+    # next call switches over to its (fully parsed) rows in one step
+    return FILE_CACHE.get(doctors_source(), _load_doctors)
+
+
+def norm_id(value):
+    """Normalize an id for index lookups: digit strings/ints become int, other
+    values are compared as stripped strings."""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    return int(text) if text.isdigit() else text
+
+
+# Lookup tables over the cached directory lists. Rebuilt (and swapped in as a
+# whole) whenever one of the loaders returns a different list object.
+_DIRECTORY_INDEX = {}
+
+
+def directory_index():
+    """Return the index dict for the current hospital/doctor lists:
+
+    - 'hospitals_by_id': norm_id -> hospital row
+    - 'doctors_by_id': norm_id -> doctor row
+    - 'doctors_by_hospital': norm_id(hospital_id) -> [doctor rows] (file order)
+
+    The lookups are dicts, or read-only views with .get() over a snapshot.
+    - 'max_doctor_id': largest integer doctor id (0 if none)
+    """
+    global _DIRECTORY_INDEX
+    hospitals = load_hospitals_csv()
+    doctors = load_doctors_csv()
+    idx = _DIRECTORY_INDEX
+    if idx.get('hospitals') is hospitals and idx.get('doctors') is doctors:
+        return idx
+    # snapshots carry sorted-key indexes: use them as read-only mappings
+    # instead of building dicts over every row
+    hospitals_by_id = hospitals.index('id', unique=True) if isinstance(hospitals, SnapshotTable) else None
+    if hospitals_by_id is None:
+        hospitals_by_id = {}
+        for h in hospitals:
+            hospitals_by_id.setdefault(norm_id(h.get('id')), h)
+    doctors_by_id = doctors_by_hospital = None
+    if isinstance(doctors, SnapshotTable):
+        doctors_by_id = doctors.index('id', unique=True)
+        doctors_by_hospital = doctors.index('hospital_id')
+        max_doctor_id = doctors.meta['max_id']
+    if doctors_by_id is None or doctors_by_hospital is None:
+        doctors_by_id = {}
+        doctors_by_hospital = {}
+        max_doctor_id = 0
+        for d in doctors:
+            did = norm_id(d.get('id'))
+            doctors_by_id.setdefault(did, d)
+            doctors_by_hospital.setdefault(norm_id(d.get('hospital_id')), []).append(d)
+            if isinstance(did, int) and did > max_doctor_id:
+                max_doctor_id = did
+    idx = {
+        'hospitals': hospitals,
+        'doctors': doctors,
+        'hospitals_by_id': hospitals_by_id,
+        'doctors_by_id': doctors_by_id,
+        'doctors_by_hospital': doctors_by_hospital,
+        'max_doctor_id': max_doctor_id,
+    }
+    _DIRECTORY_INDEX = idx
+    return idx
+
+
+# Ranked hospital search (see search.py), rebuilt with the hospital list.
+_SEARCH_INDEX = None
+
+
+def hospital_search_index():
+    global _SEARCH_INDEX
+    hospitals = load_hospitals_csv()
+    idx = _SEARCH_INDEX
+    if idx is None or idx.hospitals is not hospitals:
+        idx = _SEARCH_INDEX = HospitalSearchIndex(hospitals)
+    return idx
+
+
+# Nearest-hospital grid (see geo.py) over hospitals with coordinates.
+_GEO_INDEX = None
+
+
+def hospital_geo_index():
+    global _GEO_INDEX
+    hospitals = load_hospitals_csv()
+    idx = _GEO_INDEX
+    if idx is None or idx[0] is not hospitals:
+        grid = GeoGrid((h['lat'], h['lon'], h) for h in hospitals if h.get('lat') is not None)
+        idx = _GEO_INDEX = (hospitals, grid)
+    return idx[1]
+
+
+# Faceted doctor search (see doctorsearch.py), rebuilt with the directory index.
+_FACET_INDEX = None
+
+
+def doctor_facet_index():
+    global _FACET_INDEX
+    directory = directory_index()
+    idx = _FACET_INDEX
+    if idx is None or idx[0] is not directory:
+        idx = _FACET_INDEX = (directory, DoctorFacetIndex(directory['doctors'], directory['hospitals_by_id'], norm_id))
+    return idx[1]
+
+
+# ids for doctor rows appended at runtime (guest-doctor in /api/book)
+DOCTOR_IDS = Sequence(Path('doctors.seq'), seed=lambda: directory_index()['max_doctor_id'])
+
+
+_DOCTOR_WRITERS = {}
+
+
+def doctors_writer(path):
+    """Return the WriteCoordinator for a doctors file (one per path)."""
+    return _DOCTOR_WRITERS.setdefault(str(path), WriteCoordinator(path))
+
+
+def get_hospital(hospital_id):
+    return directory_index()['hospitals_by_id'].get(norm_id(hospital_id))
+
+
+def get_doctor(doctor_id):
+    """Doctor row by id; ids in the placeholder range resolve to the generated
+    placeholder (see ensure_min_doctors)."""
+    doc = directory_index()['doctors_by_id'].get(norm_id(doctor_id))
+    if doc is None:
+        doc = get_placeholder_doctor(doctor_id)
+    return doc
+
+
+def doctors_for_hospital(hospital_id):
+    return directory_index()['doctors_by_hospital'].get(norm_id(hospital_id), [])
 
 
-def ensure_min_doctors(hospital_id, doctors_list, target=10):
+# Hospitals with fewer than MIN_DOCTORS_PER_HOSPITAL doctors are padded with
+# generated placeholder doctors. Placeholder ids come from a reserved range,
+# PLACEHOLDER_ID_BASE + hospital_id * PLACEHOLDER_SLOTS + n, so a placeholder
+# keeps its id while doctors.csv grows and can be booked like a real doctor.
+MIN_DOCTORS_PER_HOSPITAL = 10
+PLACEHOLDER_ID_BASE = int(os.environ.get('PLACEHOLDER_ID_BASE', '900000000'))
+PLACEHOLDER_SLOTS = 16
+# generated lists per hospital, kept until its real doctors change
+PLACEHOLDER_CACHE_SIZE = int(os.environ.get('PLACEHOLDER_CACHE_SIZE', '4096'))
+
+_PLACEHOLDERS = OrderedDict()  # hospital_id -> (real doctor ids, generated doctors)
+_PLACEHOLDERS_LOCK = threading.Lock()
+
+
+def placeholder_doctor_id(hospital_id, n):
+    return PLACEHOLDER_ID_BASE + hospital_id * PLACEHOLDER_SLOTS + n
+
+
+def _generate_placeholders(hospital_id, count):
+    # seeded from a digest of the hospital id (namegen.py): the same doctors
+    # in every worker and after restarts
+    return [placeholder_doctor(hospital_id, i, placeholder_doctor_id(hospital_id, i)) for i in range(count)]
+
+
+def ensure_min_doctors(hospital_id, doctors_list, target=MIN_DOCTORS_PER_HOSPITAL):
     """Return a list with at least `target` doctors for the given hospital_id.
-    If there are fewer than `target` doctors in `doctors_list`, generate
-    deterministic placeholder doctors (in-memory only) and return the combined list.
+    If there are fewer than `target` doctors in `doctors_list`, append
+    deterministic placeholder doctors (in-memory only, generated once per
+    hospital and cached until its real doctors change).
     """
     if len(doctors_list) >= target:
         return doctors_list
+    hospital_id = norm_id(hospital_id)
+    if not isinstance(hospital_id, int) or hospital_id < 0:
+        return doctors_list  # no reserved ids for it
+    if target > PLACEHOLDER_SLOTS:
+        raise ValueError(f'at most {PLACEHOLDER_SLOTS} doctors per hospital can be placeholders')
+    real_ids = tuple(d.get('id') for d in doctors_list)
+    with _PLACEHOLDERS_LOCK:
+        cached = _PLACEHOLDERS.get(hospital_id)
+        if cached is not None and cached[0] == real_ids and len(real_ids) + len(cached[1]) == target:
+            _PLACEHOLDERS.move_to_end(hospital_id)
+            return doctors_list + cached[1]
+    generated = _generate_placeholders(hospital_id, target - len(doctors_list))
+    with _PLACEHOLDERS_LOCK:
+        _PLACEHOLDERS[hospital_id] = (real_ids, generated)
+        _PLACEHOLDERS.move_to_end(hospital_id)
+        while len(_PLACEHOLDERS) > PLACEHOLDER_CACHE_SIZE:
+            _PLACEHOLDERS.popitem(last=False)
+    return doctors_list + generated
 
-    # Compute a starting id that won't collide with existing integer ids
-    all_docs = load_doctors_csv()
-    existing_ids = [d.get('id') for d in all_docs if isinstance(d.get('id'), int)]
-    max_id = max(existing_ids) if existing_ids else 0
-    next_id = max_id + 1
-
-    # small name lists for deterministic realistic generation
-    FIRST_NAMES = ['Priya','Amit','Suman','Neha','Karan','Pooja','Vikram','Anita','Ritu','Siddharth','Isha','Rahul','Meera','Kavita','Ramesh']
-    LAST_NAMES = ['Sharma','Singh','Patel','Iyer','Nair','Bose','Kumar','Verma','Reddy','Desai','Kapoor','Das','Menon','Chopra','Gupta']
-    specialties = ['General', 'Cardiology', 'ENT', 'Orthopedics', 'Dermatology', 'Pediatrics', 'Gynecology', 'Neurology']
-    qualifications = ['MBBS', 'MD', 'DNB', 'MS', 'DM']
-
-    generated = []
-    i = 0
-    while len(doctors_list) + len(generated) < target:
-        idx = i + 1
-        # deterministic seed per hospital and index
-        seed = (hash(str(hospital_id)) & 0xffffffff) + idx
-        rnd = random.Random(seed)
-        fn = rnd.choice(FIRST_NAMES)
-        ln = rnd.choice(LAST_NAMES)
-        name = f"Dr. {fn} {ln}"
-        specialty = specialties[(seed) % len(specialties)]
-        qualification = qualifications[(seed) % len(qualifications)]
-        experience = (seed % 30) + 1
-        email = f"{fn.lower()}.{ln.lower()}{next_id}@example.com"
-        phone = f"90000{(next_id % 100000):05d}"
-        gen = {
-            'id': next_id,
-            'hospital_id': hospital_id,
-            'name': name,
-            'specialty': specialty,
-            'is_available': True,
-            'ward': None,
-            'qualification': qualification,
-            'experience_years': experience,
-            'email': email,
-            'phone': phone,
-        }
-        generated.append(gen)
-        next_id += 1
-        i += 1
 
-    return doctors_list + generated
+def get_placeholder_doctor(doctor_id):
+    """The placeholder doctor with this id, if its hospital currently lists it."""
+    doctor_id = norm_id(doctor_id)
+    if not isinstance(doctor_id, int) or doctor_id < PLACEHOLDER_ID_BASE:
+        return None
+    hospital_id, _ = divmod(doctor_id - PLACEHOLDER_ID_BASE, PLACEHOLDER_SLOTS)
+    if not get_hospital(hospital_id):
+        return None
+    docs = ensure_min_doctors(hospital_id, doctors_for_hospital(hospital_id))
+    return next((d for d in docs if d.get('id') == doctor_id), None)
 
 # -----------------------
-# CSV-backed users & appointments
+# Users & appointments (via the configured storage engine, see storage.py)
 # -----------------------
 
-def ensure_csv(path: Path, headers):
-    if not path.exists():
-        with path.open('w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
+# ids reserved per process at a time (1 = strictly increasing ids across workers)
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', '1'))
+# group commit for appointment appends: wait up to GROUP_COMMIT_MS (0 = off) or
+# until GROUP_COMMIT_MAX_ROWS bookings are queued, then write + fsync once
+GROUP_COMMIT_MS = float(os.environ.get('GROUP_COMMIT_MS', '0'))
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS', '64'))
+# cancels/deletions are logged to appointments.changes.csv; fold them into
+# appointments.csv in the background once this many have accumulated
+COMPACT_THRESHOLD = int(os.environ.get('COMPACT_THRESHOLD', '1000'))
+# snapshots of appointments.csv taken before each rewrite (see backups.py)
+# (BACKUP_KEEP_LAST, BACKUP_HOURLY, BACKUP_DAILY, BACKUP_COMPRESS, BACKUP_MODE, BACKUP_DIR)
+BACKUPS = BackupManager.from_env(APPTS_CSV)
+# /api/hospitals page size (?limit=), default and upper bound
+HOSPITALS_PAGE_SIZE = int(os.environ.get('HOSPITALS_PAGE_SIZE', '50'))
+HOSPITALS_MAX_PAGE_SIZE = int(os.environ.get('HOSPITALS_MAX_PAGE_SIZE', '500'))
+# largest radius (km) /api/hospitals/nearby accepts
+NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', '500'))
+# bookings occupy SLOT_MINUTES slots within WORK_HOURS; one booking per doctor per slot
+SLOT_MINUTES = int(os.environ.get('SLOT_MINUTES', '30'))
+WORK_HOURS = os.environ.get('WORK_HOURS', '09:00-17:00')
+
+
+def _minutes(hhmm):
+    h, m = hhmm.strip().split(':')
+    return int(h) * 60 + int(m)
+
+
+CALENDAR = SlotCalendar(slot_minutes=SLOT_MINUTES,
+                        day_start=_minutes(WORK_HOURS.split('-')[0]),
+                        day_end=_minutes(WORK_HOURS.split('-')[1]))
+STORAGE = make_storage(STORAGE_ENGINE, users_csv=USERS_CSV, appts_csv=APPTS_CSV, db_path=DB_FILE,
+                       cache=FILE_CACHE, id_block_size=ID_BLOCK_SIZE,
+                       group_window=GROUP_COMMIT_MS / 1000.0, group_max_rows=GROUP_COMMIT_MAX_ROWS,
+                       compact_threshold=COMPACT_THRESHOLD, backups=BACKUPS, calendar=CALENDAR)
+
+# scrypt hashing/checking runs in a process pool (passwords.py); beyond
+# PASSWORD_WORKERS running + PASSWORD_QUEUE waiting, logins get a quick 503
+PASSWORDS = PasswordHasher(workers=int(os.environ.get('PASSWORD_WORKERS', '2')),
+                           queue=int(os.environ.get('PASSWORD_QUEUE', '16')),
+                           admit_wait=float(os.environ.get('PASSWORD_ADMIT_WAIT_MS', '0')) / 1000.0,
+                           profile=os.environ.get('PASSWORD_PROFILE', 'default'))
+
+# signed session tokens issued by /api/login (sessions.py); clients send them
+# back in the session_token cookie or an `Authorization: Bearer` header
+SESSION_COOKIE = 'session_token'
+SESSIONS = SessionTokens(app.secret_key, load_user=STORAGE.find_user_by_id,
+                         max_age=int(os.environ.get('SESSION_MAX_AGE', str(7 * 24 * 3600))),
+                         cache_size=int(os.environ.get('SESSION_CACHE_SIZE', '10000')))
+
+
+def session_token():
+    auth = request.headers.get('Authorization', '')
+    if auth[:7].lower() == 'bearer ':
+        return auth[7:].strip()
+    return request.cookies.get(SESSION_COOKIE)
+
+
+def current_session():
+    """The verified session of this request, or None."""
+    return SESSIONS.verify(session_token())
 
 
 def load_users():
-    if not USERS_CSV.exists():
-        return []
-    with USERS_CSV.open(newline='', encoding='utf-8') as f:
-        first = f.readline()
-        f.seek(0)
-        # if file has header (contains 'username' or 'id'), use DictReader
-        if 'username' in first.lower() or 'id' in first.lower():
-            reader = csv.DictReader(f)
-            users = list(reader)
-        else:
-            # no header - fall back to positional columns: id,username,password_hash,full_name,phone
-            reader = csv.reader(f)
-            users = []
-            for row in reader:
-                if not row:
-                    continue
-                # pad row
-                while len(row) < 5:
-                    row.append('')
-                users.append({'id': row[0], 'username': row[1], 'password_hash': row[2], 'full_name': row[3], 'phone': row[4]})
-    # normalize ids
-    for u in users:
-        try:
-            u['id'] = int(u.get('id')) if u.get('id') and str(u.get('id')).isdigit() else u.get('id')
-        except Exception:
-            pass
-    return users
+    return STORAGE.load_users()
 
 
 def find_user_by_username(username):
-    users = load_users()
-    for u in users:
-        if u.get('username') == username:
-            return u
-    return None
+    return STORAGE.find_user_by_username(username)
 
 
 def create_user(username, password_hash, full_name='', phone=''):
-    users = load_users()
-    # compute next numeric id safely (ignore non-numeric ids)
-    numeric_ids = [int(u.get('id')) for u in users if u.get('id') and str(u.get('id')).isdigit()]
-    next_id = (max(numeric_ids) + 1) if numeric_ids else 1
-    row = {'id': next_id, 'username': username, 'password_hash': password_hash, 'full_name': full_name, 'phone': phone}
-    # ensure header exists
-    ensure_csv(USERS_CSV, ['id', 'username', 'password_hash', 'full_name', 'phone'])
-    with USERS_CSV.open('a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([row['id'], row['username'], row['password_hash'], row['full_name'], row['phone']])
-    return row
+    return STORAGE.create_user(username, password_hash, full_name=full_name, phone=phone)
 
 
 def load_appointments():
-    if not APPTS_CSV.exists():
-        return []
-    with APPTS_CSV.open(newline='', encoding='utf-8') as f:
-        first = f.readline()
-        f.seek(0)
-        if 'user_id' in first.lower() or 'id' in first.lower():
-            reader = csv.DictReader(f)
-            appts = list(reader)
-        else:
-            reader = csv.reader(f)
-            appts = []
-            for row in reader:
-                if not row:
-                    continue
-                while len(row) < 7:
-                    row.append('')
-                appts.append({'id': row[0], 'user_id': row[1], 'doctor_id': row[2], 'hospital_id': row[3], 'scheduled_at': row[4], 'status': row[5], 'created_at': row[6]})
-    for a in appts:
-        try:
-            a['id'] = int(a.get('id')) if a.get('id') and str(a.get('id')).isdigit() else a.get('id')
-        except Exception:
-            pass
-        try:
-            a['user_id'] = int(a.get('user_id')) if a.get('user_id') and str(a.get('user_id')).isdigit() else a.get('user_id')
-        except Exception:
-            pass
-        try:
-            a['doctor_id'] = int(a.get('doctor_id')) if a.get('doctor_id') and str(a.get('doctor_id')).isdigit() else a.get('doctor_id')
-        except Exception:
-            pass
-        try:
-            a['hospital_id'] = int(a.get('hospital_id')) if a.get('hospital_id') and str(a.get('hospital_id')).isdigit() else a.get('hospital_id')
-        except Exception:
-            pass
-    return appts
-
-
-def append_appointment(user_id, doctor_id, hospital_id, scheduled_at_iso, status='booked'):
-    appts = load_appointments()
-    # compute next numeric id safely (ignore non-numeric ids)
-    numeric_ids = [int(a.get('id')) for a in appts if a.get('id') and str(a.get('id')).isdigit()]
-    next_id = (max(numeric_ids) + 1) if numeric_ids else 1
-    created_at = datetime.utcnow().isoformat()
-    row = {'id': next_id, 'user_id': user_id, 'doctor_id': doctor_id, 'hospital_id': hospital_id, 'scheduled_at': scheduled_at_iso, 'status': status, 'created_at': created_at}
-    # ensure header exists
-    ensure_csv(APPTS_CSV, ['id', 'user_id', 'doctor_id', 'hospital_id', 'scheduled_at', 'status', 'created_at'])
-    with APPTS_CSV.open('a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([row['id'], row['user_id'], row['doctor_id'], row['hospital_id'], row['scheduled_at'], row['status'], row['created_at']])
-    return row
+    return STORAGE.load_appointments()
+
+
+def guest_user_id():
+    """Id of the shared guest user that anonymous bookings go to (created on first use)."""
+    guest = find_user_by_username('guest')
+    if not guest:
+        guest = create_user('guest', PASSWORDS.hash('guest', admit=False), full_name='Guest User')
+    return guest.get('id')
+
+
+def append_appointment(user_id, doctor_id, hospital_id, scheduled_at_iso, status='booked', require_free_slot=False):
+    return STORAGE.append_appointment(user_id, doctor_id, hospital_id, scheduled_at_iso, status=status,
+                                      require_free_slot=require_free_slot)
+
+
+def save_appointments(appts_list):
+    """Persist appointments list, replacing what the storage engine holds.
+    `appts_list` is a list of dicts with keys matching the header.
+    """
+    STORAGE.save_appointments(appts_list)
 
 # Routes
 @app.route('/')
@@ -262,35 +397,20 @@ def index():
 # User dashboard page (per-user)
 @app.route('/dashboard')
 def user_dashboard():
-    # Expect a user_id query parameter (client sets this after login)
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return redirect(url_for('index'))
-    try:
-        user_id_n = int(user_id) if str(user_id).isdigit() else user_id
-    except Exception:
-        user_id_n = user_id
-    # find user
-    user = None
-    for u in load_users():
-        if u.get('id') == user_id_n or str(u.get('id')) == str(user_id_n):
-            user = u
-            break
-    if not user:
+    # the signed-in user's page (the client's ?user_id= is not trusted)
+    sess = current_session()
+    if not sess:
         return redirect(url_for('index'))
+    user = sess['user']
+    user_id_n = sess['user_id']
 
     # load user's appointments
-    appts = load_appointments()
-    user_appts = [a for a in appts if str(a.get('user_id')) == str(user_id_n)]
+    user_appts = STORAGE.appointments_for_user(user_id_n)
     # augment appointments with doctor/hospital friendly fields
-    doctors = load_doctors_csv()
-    hospitals = load_hospitals_csv()
     enriched = []
     for a in sorted(user_appts, key=lambda x: x.get('created_at') or '', reverse=True):
-        did = a.get('doctor_id')
-        hid = a.get('hospital_id')
-        doc = next((d for d in doctors if d.get('id') == did or str(d.get('id')) == str(did)), None)
-        hosp = next((h for h in hospitals if h.get('id') == hid or str(h.get('id')) == str(hid)), None)
+        doc = get_doctor(a.get('doctor_id'))
+        hosp = get_hospital(a.get('hospital_id'))
         enriched.append({
             'id': a.get('id'),
             'doctor': doc.get('name') if doc else None,
@@ -322,34 +442,131 @@ def register():
         return jsonify({'error': 'username and password required'}), 400
     if find_user_by_username(username):
         return jsonify({'error': 'username already exists'}), 400
-    password_hash = generate_password_hash(password)
+    password_hash = PASSWORDS.hash(password)
     create_user(username, password_hash, full_name=full_name, phone=phone)
     return jsonify({'message': 'registered successfully'})
 
-# User login (simple token: return user id; in production use JWT or sessions)
+# User login: returns a signed session token (also set as an HttpOnly cookie)
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json() or {}
     username = data.get('username')
     password = data.get('password')
     user = find_user_by_username(username)
-    if not user or not check_password_hash(user.get('password_hash', ''), password):
+    if not user or not PASSWORDS.check(user.get('password_hash', ''), password):
         return jsonify({'error': 'invalid credentials'}), 401
-    return jsonify({'message': 'ok', 'user_id': user.get('id'), 'username': user.get('username')})
+    if STORAGE.users_with_id(user.get('id')) > 1:
+        # a session is keyed on the user id, which would also be another user's
+        return jsonify({'error': 'this account shares its user id with another account; '
+                                 'an administrator must run `python sequences.py repair` and '
+                                 'reassign the appointments it lists'}), 409
+    token = SESSIONS.issue(user)
+    resp = jsonify({'message': 'ok', 'user_id': user.get('id'), 'username': user.get('username'), 'token': token})
+    resp.set_cookie(SESSION_COOKIE, token, max_age=SESSIONS.max_age, httponly=True, samesite='Lax',
+                    secure=request.is_secure)
+    return resp
+
+
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    SESSIONS.forget(session_token())
+    resp = jsonify({'message': 'ok'})
+    resp.delete_cookie(SESSION_COOKIE)
+    return resp
 
 # Search hospitals by locality
+# -----------------------
+# List responses: ?fields=a,b projects each row, ?cursor= continues a paged
+# listing (the next cursor is in X-Next-Cursor and a Link rel="next" header),
+# and ?format=ndjson / ?format=stream (or Accept: application/x-ndjson) sends
+# the rows as they are produced instead of building the whole body first.
+# -----------------------
+def _stream_format():
+    fmt = request.args.get('format', '').lower()
+    if not fmt and 'application/x-ndjson' in request.headers.get('Accept', ''):
+        fmt = 'ndjson'
+    if fmt not in ('', 'json', 'ndjson', 'stream'):
+        raise BadRequest('format must be json, ndjson or stream')
+    return fmt if fmt in ('ndjson', 'stream') else None
+
+
+def _list_response(rows, fields=None, next_cursor=None, total=None, stream=None):
+    """`rows` is any iterable of dicts; it is consumed lazily when streaming."""
+    rows = (project(r, fields) for r in rows)
+    dumps = lambda obj: app.json.dumps(obj, separators=(',', ':'))
+    if stream == 'ndjson':
+        resp = Response(stream_with_context(ndjson_lines(rows, dumps)), mimetype='application/x-ndjson')
+    elif stream == 'stream':
+        resp = Response(stream_with_context(json_array_chunks(rows, dumps)), mimetype='application/json')
+    else:
+        resp = jsonify(list(rows))
+        # strong validator: a digest of exactly what is sent (body and paging
+        # headers), answered with 304 when the client already has it
+        tag = hashlib.sha256(resp.get_data())
+        tag.update(f'{total}|{next_cursor}'.encode())
+        resp.set_etag(tag.hexdigest()[:32])
+    if total is not None:
+        resp.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args.pop('offset', None)
+        args['cursor'] = next_cursor
+        resp.headers['Link'] = f'<{url_for(request.endpoint, _external=False, **(request.view_args or {}), **args)}>; rel="next"'
+    if not stream:
+        resp.make_conditional(request)
+    return resp
+
+
+@app.errorhandler(BadRequest)
+def _bad_request(e):
+    return jsonify({'error': str(e)}), 400
+
+
+@app.errorhandler(PasswordsBusy)
+def _passwords_busy(e):
+    resp = jsonify({'error': 'server busy, try again shortly'})
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp, 503
+
+
+HOSPITAL_FIELDS = ('id', 'name', 'locality', 'address')
+DOCTOR_FIELDS = ('id', 'name', 'specialty', 'is_available', 'ward', 'qualification', 'experience_years', 'email', 'phone')
+HISTORY_FIELDS = ('id', 'doctor', 'hospital', 'scheduled_at', 'status', 'created_at')
+NEARBY_FIELDS = HOSPITAL_FIELDS + ('lat', 'lon', 'distance_km')
+SEARCH_DOCTOR_FIELDS = ('id', 'name', 'specialty', 'is_available', 'qualification', 'experience_years',
+                        'hospital_id', 'hospital', 'locality')
+
+
 @app.route('/api/hospitals', methods=['GET'])
 def hospitals():
-    locality = request.args.get('locality', '').strip()
+    # ?locality= (or ?q=) is matched against name, town, district and address:
+    # prefixes and single typos match, results are ranked best first
+    query = (request.args.get('q') or request.args.get('locality') or '').strip()
+    fields = parse_fields(request.args.get('fields'), HOSPITAL_FIELDS)
+    stream = _stream_format()
+    # pages of HOSPITALS_PAGE_SIZE by default; a streamed response may be unbounded
+    limit = parse_limit(request.args.get('limit'), None if stream else HOSPITALS_PAGE_SIZE, HOSPITALS_MAX_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('cursor'))
+    if cursor is not None:
+        # a ranked result has no natural key: the cursor is the position in it
+        if cursor.get('q') != query:
+            raise BadRequest('cursor does not belong to this query')
+        offset = cursor_int(cursor, 'o')
+    else:
+        try:
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            raise BadRequest('offset must be an integer')
     # Prefer CSV-backed hospitals if present
     if HOSPITALS_CSV.exists():
-        hospitals = load_hospitals_csv()
-        if locality:
-            locality_l = locality.lower()
-            hospitals = [h for h in hospitals if (h.get('locality') or '').lower().find(locality_l) != -1 or (h.get('name') or '').lower().find(locality_l) != -1]
+        total, hospitals = hospital_search_index().search(query, limit=limit, offset=offset)
+        next_cursor = None
+        if limit is not None and offset + len(hospitals) < total:
+            next_cursor = encode_cursor({'q': query, 'o': offset + len(hospitals)})
         # Return id, name, locality, address
-        out = [{'id': h.get('id'), 'name': h.get('name'), 'locality': h.get('locality'), 'address': h.get('address')} for h in hospitals]
-        return jsonify(out)
+        out = ({'id': h.get('id'), 'name': h.get('name'), 'locality': h.get('locality'), 'address': h.get('address')} for h in hospitals)
+        return _list_response(out, fields, next_cursor=next_cursor, total=total, stream=stream)
 
     # If CSV is missing, return empty list (no sqlite fallback)
     return jsonify([])
@@ -357,14 +574,26 @@ def hospitals():
 # Get wards and doctors for a hospital
 @app.route('/api/hospital/<int:hospital_id>/doctors', methods=['GET'])
 def hospital_doctors(hospital_id):
+    fields = parse_fields(request.args.get('fields'), DOCTOR_FIELDS)
+    stream = _stream_format()
+    limit = parse_limit(request.args.get('limit'), None, HOSPITALS_MAX_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('cursor'))
     # Prefer CSV-backed doctors if present
     if DOCTORS_CSV.exists():
-        doctors = load_doctors_csv()
-        matched = [d for d in doctors if d.get('hospital_id') == hospital_id or str(d.get('hospital_id')) == str(hospital_id)]
+        matched = doctors_for_hospital(hospital_id)
         # ensure at least 10 doctors are returned (generate placeholders if needed)
-        matched = ensure_min_doctors(hospital_id, matched, target=10)
+        matched = ensure_min_doctors(hospital_id, matched)
+        start = 0
+        if cursor is not None:
+            # file order: continue after the last doctor id returned
+            start = next((i + 1 for i, d in enumerate(matched) if d.get('id') == cursor.get('after')), None)
+            if start is None:
+                raise BadRequest('cursor does not belong to this hospital')
+        end = len(matched) if limit is None else start + limit
+        page = matched[start:end]
+        next_cursor = encode_cursor({'after': page[-1].get('id')}) if page and end < len(matched) else None
         out = []
-        for d in matched:
+        for d in page:
             out.append({
                 'id': d.get('id'),
                 'name': d.get('name'),
@@ -376,25 +605,224 @@ def hospital_doctors(hospital_id):
                 'email': d.get('email'),
                 'phone': d.get('phone'),
             })
-        return jsonify(out)
+        return _list_response(out, fields, next_cursor=next_cursor, total=len(matched), stream=stream)
 
     # If CSV missing return empty list (no sqlite fallback)
     return jsonify([])
 
+def _list_arg(name):
+    """?name=a,b&name=c -> ['a', 'b', 'c']"""
+    return [v.strip() for raw in request.args.getlist(name) for v in raw.split(',') if v.strip()]
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f'{name} must be an integer')
+
+
+# Search doctors across hospitals, e.g.
+#   /api/doctors/search?specialty=Cardiology&locality=Andheri&min_experience=10
+# Filters: specialty, qualification, locality, hospital_id (comma-separated,
+# any of), available (1/0), min_experience / max_experience (years).
+# Returns the matching page, the total and facet counts for each filter.
+@app.route('/api/doctors/search', methods=['GET'])
+def doctors_search():
+    fields = parse_fields(request.args.get('fields'), SEARCH_DOCTOR_FIELDS)
+    limit = parse_limit(request.args.get('limit'), HOSPITALS_PAGE_SIZE, HOSPITALS_MAX_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('cursor'))
+    # -1 is "before the first position"; anything lower would be a negative shift
+    after = cursor_int(cursor, 'after', minimum=-1) if cursor is not None else -1
+    available = request.args.get('available')
+    if available not in (None, ''):
+        available = available.strip().lower() in ('1', 'true', 't', 'yes')
+    else:
+        available = None
+    index = doctor_facet_index()
+    total, page, facets, more = index.search(
+        after=after, limit=limit,
+        specialty=_list_arg('specialty'), qualification=_list_arg('qualification'),
+        is_available=available, min_experience=_int_arg('min_experience'), max_experience=_int_arg('max_experience'),
+        locality=_list_arg('locality'), hospital_id=[norm_id(h) for h in _list_arg('hospital_id')])
+    out = []
+    for pos, d in page:
+        hosp = get_hospital(d.get('hospital_id'))
+        out.append(project({
+            'id': d.get('id'),
+            'name': d.get('name'),
+            'specialty': d.get('specialty'),
+            'is_available': bool(d.get('is_available')),
+            'qualification': d.get('qualification'),
+            'experience_years': d.get('experience_years'),
+            'hospital_id': d.get('hospital_id'),
+            'hospital': hosp.get('name') if hosp else None,
+            'locality': index.localities[pos],
+        }, fields))
+    # the cursor is the position of the last doctor returned
+    next_cursor = encode_cursor({'after': page[-1][0]}) if more else None
+    return jsonify({'total': total, 'doctors': out, 'facets': facets, 'next_cursor': next_cursor})
+
+# Nearest hospitals to a point, e.g. /api/hospitals/nearby?lat=19.13&lon=72.83&k=5
+# radius (km) limits the distance; with radius and no k, every hospital within
+# it is returned (up to HOSPITALS_MAX_PAGE_SIZE). specialty= keeps hospitals
+# with at least one doctor of that specialty.
+@app.route('/api/hospitals/nearby', methods=['GET'])
+def hospitals_nearby():
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+    except (KeyError, ValueError):
+        raise BadRequest('lat and lon are required numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise BadRequest('lat/lon out of range')
+    radius = request.args.get('radius')
+    try:
+        radius = float(radius) if radius not in (None, '') else None
+    except ValueError:
+        raise BadRequest('radius must be a number (km)')
+    if radius is not None and not (0 < radius <= NEARBY_MAX_RADIUS_KM):
+        raise BadRequest(f'radius must be in (0, {NEARBY_MAX_RADIUS_KM:g}] km')
+    k = parse_limit(request.args.get('k'), None if radius is not None else 10, HOSPITALS_MAX_PAGE_SIZE)
+    fields = parse_fields(request.args.get('fields'), NEARBY_FIELDS)
+    accept = None
+    specialty = _list_arg('specialty')
+    if specialty:
+        allowed = doctor_facet_index().hospital_ids(specialty=specialty)
+        accept = lambda h: norm_id(h.get('id')) in allowed
+    grid = hospital_geo_index()
+    if k is None:
+        found = grid.within(lat, lon, radius, accept=accept)[:HOSPITALS_MAX_PAGE_SIZE]
+    else:
+        found = grid.nearest(lat, lon, k=k, radius_km=radius, accept=accept)
+    out = ({'id': h.get('id'), 'name': h.get('name'), 'locality': h.get('locality'), 'address': h.get('address'),
+            'lat': h.get('lat'), 'lon': h.get('lon'), 'distance_km': round(d, 3)} for d, h in found)
+    return _list_response(out, fields)
+
+# free slots between ?from= and ?to= (dates or ISO datetimes), default the next 7 days
+def _availability_range():
+    now = datetime.now().replace(tzinfo=None)
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else now
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=7)
+    except ValueError:
+        raise BadRequest('invalid from/to format, use ISO format')
+    start, end = max(parse_when(start), now), parse_when(end)
+    if end - start > timedelta(days=31):
+        raise BadRequest('range too large (max 31 days)')
+    return now, start, end
+
+
+def _availability_row(doc, avail):
+    nxt = avail['next_free_slot']
+    return {'doctor_id': doc.get('id'), 'is_available': bool(doc.get('is_available')),
+            'booked_count': avail['booked_count'], 'slot_minutes': CALENDAR.slot_minutes,
+            'free_slots': [t.isoformat() for t in avail['free_slots']],
+            'next_free_slot': nxt.isoformat() if nxt else None}
+
+
 # Check doctor availability and existing bookings (simple)
 @app.route('/api/doctor/<int:doctor_id>/availability', methods=['GET'])
 def doctor_availability(doctor_id):
-    doctors = load_doctors_csv()
-    doc = None
-    for d in doctors:
-        if d.get('id') == doctor_id or str(d.get('id')) == str(doctor_id):
-            doc = d
-            break
+    doc = get_doctor(doctor_id)
     if not doc:
         return jsonify({'error': 'doctor not found'}), 404
-    appts = load_appointments()
-    upcoming = sum(1 for a in appts if (a.get('doctor_id') == doctor_id or str(a.get('doctor_id')) == str(doctor_id)) and a.get('status') == 'booked')
-    return jsonify({'doctor_id': doctor_id, 'is_available': bool(doc.get('is_available')), 'booked_count': upcoming})
+    now, start, end = _availability_range()
+    avail = STORAGE.availability_many([doctor_id], start, end, after=now)[doctor_id]
+    return jsonify(_availability_row(doc, avail))
+
+
+# Availability of several doctors in one response: ?ids=1,2,3 or
+# ?hospital_id=<id> (the doctors /api/hospital/<id>/doctors lists), with the
+# same ?from= / ?to= as above. Unknown ids are listed under `not_found`.
+AVAILABILITY_MAX_DOCTORS = 200
+
+
+@app.route('/api/doctors/availability', methods=['GET'])
+def doctors_availability():
+    ids = _list_arg('ids')
+    hospital_id = _int_arg('hospital_id')
+    if bool(ids) == (hospital_id is not None):
+        raise BadRequest('give either ids or hospital_id')
+    not_found = []
+    if hospital_id is not None:
+        if not get_hospital(hospital_id):
+            return jsonify({'error': 'hospital not found'}), 404
+        docs = ensure_min_doctors(hospital_id, doctors_for_hospital(hospital_id))
+    else:
+        docs = []
+        for raw in dict.fromkeys(ids):  # unique, in request order
+            doc = get_doctor(raw)
+            if doc:
+                docs.append(doc)
+            else:
+                not_found.append(norm_id(raw))
+    if len(docs) > AVAILABILITY_MAX_DOCTORS:
+        raise BadRequest(f'at most {AVAILABILITY_MAX_DOCTORS} doctors per request')
+    now, start, end = _availability_range()
+    avail = STORAGE.availability_many([d.get('id') for d in docs], start, end, after=now)
+    return jsonify({'from': start.isoformat(), 'to': end.isoformat(),
+                    'doctors': [_availability_row(d, avail[d.get('id')]) for d in docs],
+                    'not_found': not_found})
+
+
+class BookingRejected(Exception):
+    """A booking that cannot be made; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def check_booking(hospital_id, scheduled_at, doctor_id=None):
+    """Validate one booking for /api/book and /api/book/bulk.
+
+    Returns (hospital, doctor, scheduled datetime); the doctor is None when
+    no doctor_id was given. Raises BookingRejected unless `scheduled_at` is
+    the start of a future slot within WORK_HOURS and the hospital and doctor
+    exist, with the doctor at that hospital.
+    """
+    if not hospital_id or not scheduled_at:
+        raise BookingRejected(400, 'hospital_id and scheduled_at required')
+    hosp = get_hospital(hospital_id)
+    if not hosp:
+        raise BookingRejected(404, 'hospital not found')
+    try:
+        datetime.fromisoformat(str(scheduled_at))
+    except ValueError:
+        raise BookingRejected(400, 'invalid scheduled_at format, use ISO format')
+    if len(str(scheduled_at)) <= 10:
+        raise BookingRejected(400, 'scheduled_at must include a time')
+    # stored as local wall-clock time; an offset, if given, is converted
+    scheduled_dt = parse_when(scheduled_at)
+    # the calendar is keyed on slot starts: 09:10 would not conflict with 09:00
+    if not CALENDAR.is_slot_start(scheduled_dt):
+        raise BookingRejected(400, f'scheduled_at must start a {CALENDAR.slot_minutes}-minute slot within {WORK_HOURS}')
+    if scheduled_dt < datetime.now():
+        raise BookingRejected(400, 'scheduled_at is in the past')
+    doc = None
+    if doctor_id:
+        doc = get_doctor(doctor_id)
+        if not doc:
+            raise BookingRejected(404, 'doctor not found')
+        # placeholder doctors carry the hospital they were generated for
+        if norm_id(doc.get('hospital_id')) != norm_id(hosp.get('id')):
+            raise BookingRejected(400, f"doctor {doc.get('id')} does not work at hospital {hosp.get('id')}")
+    return hosp, doc, scheduled_dt
+
+
+def next_free_doctor(doctor_ids, after):
+    """(doctor id, slot) for the earliest free slot after `after` among
+    `doctor_ids`; the first doctor and None if none is free in the window."""
+    best = (doctor_ids[0], None)
+    for doctor_id in doctor_ids:
+        nxt = STORAGE.next_free_slot(doctor_id, after)
+        if nxt and (best[1] is None or nxt < best[1]):
+            best = (doctor_id, nxt)
+    return best
+
 
 # Book appointment
 @app.route('/api/book', methods=['POST'])
@@ -404,184 +832,255 @@ def book():
         # Booking payload no longer requires user_id or doctor_id.
         # Expect at minimum: hospital_id and scheduled_at (ISO string).
         hospital_id = data.get('hospital_id')
-        scheduled_at = data.get('scheduled_at')  # ISO string
-        if not hospital_id or not scheduled_at:
-            return jsonify({'error': 'hospital_id and scheduled_at required'}), 400
-        # validate hospital exists (CSV)
-        hospitals = load_hospitals_csv()
-        hosp = None
-        for h in hospitals:
-            if h.get('id') == hospital_id or str(h.get('id')) == str(hospital_id):
-                hosp = h
-                break
-        if not hosp:
-            return jsonify({'error': 'hospital not found'}), 404
-        try:
-            scheduled_dt = datetime.fromisoformat(scheduled_at) if scheduled_at else None
-        except Exception:
-            return jsonify({'error': 'invalid scheduled_at format, use ISO format'}), 400
-        # If no user_id provided, use/ensure a guest user in CSV users
-        user_id = data.get('user_id')
+        # book for the signed-in user; else a given user_id, which takes an
+        # admin token (anyone could book in another user's name otherwise),
+        # else a guest user
+        sess = current_session()
+        token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+        admin_ok = token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)
+        if not sess and data.get('user_id') and not admin_ok:
+            return jsonify({'error': 'unauthorized', 'detail': 'sign in to book, or send an admin token '
+                                                                'to book for a given user_id'}), 401
+        hosp, doc, scheduled_dt = check_booking(hospital_id, data.get('scheduled_at'), data.get('doctor_id'))
+        user_id = sess['user_id'] if sess else data.get('user_id')
         if not user_id:
-            guest = find_user_by_username('guest')
-            if not guest:
-                guest = create_user('guest', generate_password_hash('guest'), full_name='Guest User')
-            user_id = guest.get('id')
+            user_id = guest_user_id()
         # Ensure a doctor_id is set so existing DB NOT NULL constraints are satisfied.
         # Prefer any existing doctor for the hospital; if none exists, create a guest-doctor tied to the hospital.
-        doctor_id = data.get('doctor_id')
-        if not doctor_id:
-            # Try to pick an existing doctor for this hospital from CSV
-            doctors = load_doctors_csv()
-            doc = None
-            for d in doctors:
-                if d.get('hospital_id') == hospital_id or str(d.get('hospital_id')) == str(hospital_id):
-                    doc = d
-                    break
-            if not doc:
-                # try find guest-doctor for hospital
-                for d in doctors:
-                    if d.get('hospital_id') == hospital_id and d.get('name') == 'guest-doctor':
-                        doc = d
-                        break
-            if not doc:
-                # append a guest-doctor to doctors.csv
-                # determine fieldnames from existing file or use defaults
-                default_fields = ['id','hospital_id','name','specialty','is_available','ward_id','qualification','experience_years','email','phone']
-                if DOCTORS_CSV.exists():
-                    with DOCTORS_CSV.open(newline='', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        fieldnames = reader.fieldnames or default_fields
-                else:
-                    fieldnames = default_fields
-                # find next id
-                existing = load_doctors_csv()
-                # compute next numeric id safely (ignore non-numeric ids)
-                numeric_ids = [int(d.get('id')) for d in existing if d.get('id') and str(d.get('id')).isdigit()]
-                next_id = (max(numeric_ids) + 1) if numeric_ids else 1
-                guest_row = {k: '' for k in fieldnames}
-                guest_row['id'] = next_id
-                guest_row['hospital_id'] = hospital_id
-                guest_row['name'] = 'guest-doctor'
-                guest_row['specialty'] = 'N/A'
-                guest_row['is_available'] = '0'
-                # append to file
-                with DOCTORS_CSV.open('a', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([guest_row.get(fn, '') for fn in fieldnames])
-                # reload doctors
-                doc = None
-                for d in load_doctors_csv():
-                    if d.get('id') == next_id:
-                        doc = d
-                        break
-            doctor_id = doc.get('id')
+        doctor_ids = [doc.get('id')] if doc else []
+        if doc is None:
+            # Any existing doctor (or a previously created guest-doctor) of this hospital
+            # will do: the storage books the first one free in that slot
+            hospital_docs = doctors_for_hospital(hospital_id)
+            doctor_ids = [d.get('id') for d in hospital_docs]
+            if not doctor_ids:
+                # append a guest-doctor to the doctors file the app reads from
+                doctors_file = doctors_source()
+                writer = doctors_writer(doctors_file)
+                with writer.exclusive():
+                    # another request (or worker) may have added one while we waited
+                    FILE_CACHE.invalidate(doctors_file)
+                    hospital_docs = doctors_for_hospital(hospital_id)
+                    doc = hospital_docs[0] if hospital_docs else None
+                    if not doc:
+                        # determine fieldnames from existing file or use defaults
+                        default_fields = ['id','hospital_id','name','specialty','is_available','ward_id','qualification','experience_years','email','phone']
+                        if doctors_file.exists():
+                            with doctors_file.open(newline='', encoding='utf-8') as f:
+                                reader = csv.DictReader(f)
+                                fieldnames = reader.fieldnames or default_fields
+                        else:
+                            fieldnames = default_fields
+                        writer.header = fieldnames
+                        # find next id
+                        next_id = DOCTOR_IDS.next_id()
+                        guest_row = {k: '' for k in fieldnames}
+                        guest_row['id'] = next_id
+                        guest_row['hospital_id'] = hospital_id
+                        guest_row['name'] = 'guest-doctor'
+                        guest_row['specialty'] = 'N/A'
+                        guest_row['is_available'] = '0'
+                        # append to file
+                        writer.append([[guest_row.get(fn, '') for fn in fieldnames]])
+                        FILE_CACHE.invalidate(doctors_file)
+                        # reload doctors
+                        doc = get_doctor(next_id)
+                    doctor_ids = [doc.get('id')]
         # Create appointment in CSV
-        appt_row = append_appointment(user_id, doctor_id, hospital_id, scheduled_dt.isoformat() if scheduled_dt else '', status='booked')
-        return jsonify({'message': 'appointment booked', 'appointment_id': appt_row.get('id')})
+        appt_row = STORAGE.append_appointments([{'user_id': user_id, 'doctor_ids': doctor_ids,
+                                                 'hospital_id': hospital_id, 'scheduled_at': scheduled_dt.isoformat(),
+                                                 'status': 'booked'}], require_free_slot=True)[0]
+        if isinstance(appt_row, SlotTaken):
+            doctor_id, nxt = next_free_doctor(doctor_ids, scheduled_dt)
+            return jsonify({'error': 'slot already booked', 'detail': str(appt_row), 'doctor_id': doctor_id,
+                            'next_free_slot': nxt.isoformat() if nxt else None}), 409
+        return jsonify({'message': 'appointment booked', 'appointment_id': appt_row.get('id'),
+                        'doctor_id': appt_row.get('doctor_id')})
+    except BookingRejected as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         # Log traceback to server console and return JSON error so clients can parse it
         traceback.print_exc()
         return jsonify({'error': 'internal server error', 'detail': str(e)}), 500
 
+def _history_key(a):
+    appt_id = norm_id(a.get('id'))
+    return (a.get('created_at') or '', appt_id if isinstance(appt_id, int) else -1)
+
+
 # Booking history for a user
 @app.route('/api/history/<int:user_id>', methods=['GET'])
 def history(user_id):
-    appts = load_appointments()
-    filtered = [a for a in appts if a.get('user_id') == user_id or str(a.get('user_id')) == str(user_id)]
-    # sort by created_at desc
-    filtered.sort(key=lambda x: x.get('created_at') or '', reverse=True)
-    doctors = load_doctors_csv()
-    hospitals = load_hospitals_csv()
-    out = []
-    for a in filtered:
-        did = a.get('doctor_id')
-        hid = a.get('hospital_id')
-        doc = next((d for d in doctors if d.get('id') == did or str(d.get('id')) == str(did)), None)
-        hosp = next((h for h in hospitals if h.get('id') == hid or str(h.get('id')) == str(hid)), None)
-        out.append({'id': a.get('id'), 'doctor': doc.get('name') if doc else None, 'hospital': hosp.get('name') if hosp else None, 'scheduled_at': a.get('scheduled_at'), 'status': a.get('status'), 'created_at': a.get('created_at')})
-    return jsonify(out)
-
+    fields = parse_fields(request.args.get('fields'), HISTORY_FIELDS)
+    stream = _stream_format()
+    limit = parse_limit(request.args.get('limit'), None, HOSPITALS_MAX_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('cursor'))
+    filtered = STORAGE.appointments_for_user(user_id)
+    # sort by created_at desc (id desc among equal timestamps)
+    filtered.sort(key=_history_key, reverse=True)
+    if cursor is not None:
+        # keyset: rows strictly older than the last one returned, so rows
+        # booked meanwhile do not shift the next page
+        try:
+            after = (str(cursor['c']), int(cursor['i']))
+        except (KeyError, TypeError, ValueError):
+            raise BadRequest('invalid cursor')
+        filtered = [a for a in filtered if _history_key(a) < after]
+    next_cursor = None
+    if limit is not None and len(filtered) > limit:
+        filtered = filtered[:limit]
+        last = _history_key(filtered[-1])
+        next_cursor = encode_cursor({'c': last[0], 'i': last[1]})
 
-def save_appointments(appts_list):
-    """Persist appointments list back to CSV. Overwrites `appointments.csv`.
-    `appts_list` is a list of dicts with keys matching the header.
-    """
-    hdr = ['id', 'user_id', 'doctor_id', 'hospital_id', 'scheduled_at', 'status', 'created_at']
-    # Create an automatic timestamped backup before overwriting the appointments CSV
-    try:
-        if APPTS_CSV.exists():
-            ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-            # e.g. appointments.bak.20251119T153000Z.csv
-            backup_name = f"{APPTS_CSV.stem}.bak.{ts}{APPTS_CSV.suffix}"
-            backup_path = APPTS_CSV.with_name(backup_name)
-            shutil.copy2(APPTS_CSV, backup_path)
-    except Exception as e:
-        # If backup fails, log and continue to attempt to save (do not silently drop changes)
-        print(f"Warning: failed to create appointments backup: {e}")
-
-    with APPTS_CSV.open('w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(hdr)
-        for a in appts_list:
-            writer.writerow([
-                a.get('id', ''),
-                a.get('user_id', ''),
-                a.get('doctor_id', ''),
-                a.get('hospital_id', ''),
-                a.get('scheduled_at', ''),
-                a.get('status', ''),
-                a.get('created_at', ''),
-            ])
+    def rows():
+        for a in filtered:
+            doc = get_doctor(a.get('doctor_id'))
+            hosp = get_hospital(a.get('hospital_id'))
+            yield {'id': a.get('id'), 'doctor': doc.get('name') if doc else None, 'hospital': hosp.get('name') if hosp else None, 'scheduled_at': a.get('scheduled_at'), 'status': a.get('status'), 'created_at': a.get('created_at')}
+    return _list_response(rows(), fields, next_cursor=next_cursor, stream=stream)
 
 
 @app.route('/api/appointment/<int:appt_id>/cancel', methods=['POST'])
 def cancel_appointment(appt_id):
-    """Mark an appointment as cancelled. Request body should include `user_id` to verify ownership,
+    """Mark an appointment as cancelled. The caller must be signed in as its owner (session token),
     or supply a valid admin token in `X-Admin-Token` header or `admin_token` cookie.
     """
-    data = request.get_json() or {}
-    requester_user_id = data.get('user_id')
+    sess = current_session()
     token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
 
-    appts = load_appointments()
-    target = None
-    for a in appts:
-        if a.get('id') == appt_id or str(a.get('id')) == str(appt_id):
-            target = a
-            break
+    target = STORAGE.get_appointment(appt_id)
     if not target:
         return jsonify({'error': 'appointment not found'}), 404
 
     # Allow cancellation if requester is owner or a valid admin token is provided
-    owner_ok = requester_user_id and str(target.get('user_id')) == str(requester_user_id)
+    owner_ok = sess is not None and str(target.get('user_id')) == str(sess['user_id'])
     admin_ok = token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)
     if not (owner_ok or admin_ok):
         return jsonify({'error': 'unauthorized'}), 401
 
-    target['status'] = 'cancelled'
-    save_appointments(appts)
+    target = STORAGE.set_appointment_status(appt_id, 'cancelled')
     return jsonify({'ok': True, 'appointment_id': target.get('id'), 'status': target.get('status')})
 
 
+# Bulk endpoints for partner imports and admin tooling: up to BULK_MAX_ITEMS
+# items, validated against the directory indexes and stored with one write
+# (one transaction on SQLite). The response has one result per item, in
+# request order: {'index', 'ok', ...} with 'status' and 'error' on failure.
+BULK_MAX_ITEMS = 500
+
+
+def _bulk_items(key):
+    data = request.get_json(silent=True) or {}
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BadRequest(f'{key} must be a non-empty list')
+    if len(items) > BULK_MAX_ITEMS:
+        raise BadRequest(f'at most {BULK_MAX_ITEMS} {key} per request')
+    return items
+
+
+def _item_error(index, status, error, **extra):
+    return dict(extra, index=index, ok=False, status=status, error=error)
+
+
+# Body: {"items": [{"hospital_id", "scheduled_at", "doctor_id"?, "user_id"?}, ...]}.
+# A signed-in user books for themselves; with an admin token items may name
+# any user_id (default: the guest user). As in /api/book a missing doctor_id
+# means the hospital's first doctor free in that slot.
+@app.route('/api/book/bulk', methods=['POST'])
+def book_bulk():
+    sess = current_session()
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    admin_ok = token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)
+    if not (sess or admin_ok):
+        return jsonify({'error': 'unauthorized'}), 401
+    items = _bulk_items('items')
+    results = [None] * len(items)
+    valid = []  # (index, appointment)
+    guest_id = None
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = _item_error(i, 400, 'item must be an object')
+            continue
+        hospital_id = item.get('hospital_id')
+        try:
+            hosp, doc, scheduled_dt = check_booking(hospital_id, item.get('scheduled_at'), item.get('doctor_id'))
+        except BookingRejected as e:
+            results[i] = _item_error(i, e.status, str(e))
+            continue
+        doctor_ids = [doc.get('id')] if doc else [d.get('id') for d in doctors_for_hospital(hospital_id)]
+        if not doctor_ids:
+            results[i] = _item_error(i, 400, 'doctor_id required (hospital has no doctors)')
+            continue
+        if sess:
+            user_id = sess['user_id']
+        elif item.get('user_id'):
+            user_id = item['user_id']
+        else:
+            guest_id = guest_id or guest_user_id()
+            user_id = guest_id
+        valid.append((i, {'user_id': user_id, 'doctor_ids': doctor_ids, 'hospital_id': hosp.get('id'),
+                          'scheduled_at': scheduled_dt.isoformat()}))
+    stored = STORAGE.append_appointments([appt for _, appt in valid], require_free_slot=True) if valid else []
+    for (i, appt), row in zip(valid, stored):
+        if isinstance(row, SlotTaken):
+            doctor_id, nxt = next_free_doctor(appt['doctor_ids'], datetime.fromisoformat(appt['scheduled_at']))
+            results[i] = _item_error(i, 409, 'slot already booked', doctor_id=doctor_id,
+                                     next_free_slot=nxt.isoformat() if nxt else None)
+        else:
+            results[i] = {'index': i, 'ok': True, 'appointment_id': row.get('id'), 'doctor_id': row.get('doctor_id'),
+                          'scheduled_at': appt['scheduled_at']}
+    booked = sum(1 for r in results if r['ok'])
+    return jsonify({'booked': booked, 'failed': len(results) - booked, 'results': results})
+
+
+# Body: {"appointment_ids": [...]}. Admins may cancel any appointment, a
+# signed-in user only their own.
+@app.route('/api/appointments/bulk_cancel', methods=['POST'])
+def bulk_cancel_appointments():
+    sess = current_session()
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    admin_ok = token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)
+    if not (sess or admin_ok):
+        return jsonify({'error': 'unauthorized'}), 401
+    ids = _bulk_items('appointment_ids')
+    results = [None] * len(ids)
+    allowed = []  # (index, appointment id)
+    for i, raw in enumerate(ids):
+        appt_id = norm_id(raw)
+        target = STORAGE.get_appointment(appt_id) if appt_id is not None else None
+        if not target:
+            results[i] = _item_error(i, 404, 'appointment not found', appointment_id=appt_id)
+        elif not (admin_ok or str(target.get('user_id')) == str(sess['user_id'])):
+            results[i] = _item_error(i, 401, 'unauthorized', appointment_id=appt_id)
+        else:
+            allowed.append((i, appt_id))
+    updated = STORAGE.set_appointments_status([appt_id for _, appt_id in allowed], 'cancelled') if allowed else {}
+    for i, appt_id in allowed:
+        row = updated.get(appt_id)
+        if row is None:  # removed in the meantime
+            results[i] = _item_error(i, 404, 'appointment not found', appointment_id=appt_id)
+        else:
+            results[i] = {'index': i, 'ok': True, 'appointment_id': row.get('id'), 'status': row.get('status')}
+    cancelled = sum(1 for r in results if r['ok'])
+    return jsonify({'cancelled': cancelled, 'failed': len(results) - cancelled, 'results': results})
+
+
 # Clear booking history for a user (owner or admin)
 @app.route('/api/history/<int:user_id>/clear', methods=['POST'])
 def clear_user_history(user_id):
-    data = request.get_json() or {}
-    requester_user_id = data.get('user_id')
+    sess = current_session()
     token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
 
-    appts = load_appointments()
-    # verify permission: either owner (requester_user_id matches user_id) or admin token
-    owner_ok = requester_user_id and str(requester_user_id) == str(user_id)
+    # verify permission: either owner (signed in as user_id) or admin token
+    owner_ok = sess is not None and str(sess['user_id']) == str(user_id)
     admin_ok = token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)
     if not (owner_ok or admin_ok):
         return jsonify({'error': 'unauthorized'}), 401
 
     # Remove appointments for the user (keep others). We treat this as deletion.
-    remaining = [a for a in appts if not (str(a.get('user_id')) == str(user_id))]
-    save_appointments(remaining)
-    return jsonify({'ok': True, 'removed_for_user': user_id, 'remaining_count': len(remaining)})
+    remaining_count = STORAGE.delete_appointments_for_user(user_id)
+    return jsonify({'ok': True, 'removed_for_user': user_id, 'remaining_count': remaining_count})
 
 
 # Admin-only: clear all booking history
@@ -590,14 +1089,128 @@ def clear_all_history():
     token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
     if not (token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)):
         return jsonify({'error': 'unauthorized'}), 401
-    # wipe appointments file (keep header)
-    save_appointments([])
+    # wipe appointments (CSV engine keeps the header)
+    STORAGE.clear_appointments()
     return jsonify({'ok': True, 'remaining_count': 0})
 
+# -----------------------
+# Warm-up and health checks. serve.py calls warm_up() in the master before
+# forking workers, so they start with every directory index already built.
+# -----------------------
+_WARMUP = {'ready': False, 'started': False, 'error': None}
+_WARMUP_LOCK = threading.Lock()
+
+
+def warm_up():
+    """Load the directories, build every index over them and let the storage
+    engine load its caches. Idempotent; returns the warm-up state."""
+    with _WARMUP_LOCK:
+        if _WARMUP['ready']:
+            return _WARMUP
+        _WARMUP['started'] = True
+        t0 = time.perf_counter()
+        try:
+            directory = directory_index()
+            hospital_search_index()
+            doctor_facet_index()
+            hospital_geo_index()
+            STORAGE.warm_up()
+        except Exception as e:
+            _WARMUP['error'] = repr(e)
+            traceback.print_exc()
+            raise
+        _WARMUP.update(ready=True, error=None, warmup_ms=round((time.perf_counter() - t0) * 1000.0, 1),
+                       hospitals=len(directory['hospitals']), doctors=len(directory['doctors']))
+        return _WARMUP
+
+
+def _warm_up_in_background():
+    # workers without a preloading master warm themselves up on the first
+    # readiness probe; a failed attempt is retried by the next probe
+    if _WARMUP['started']:
+        return
+    _WARMUP['started'] = True
+
+    def run():
+        try:
+            warm_up()
+        except Exception:
+            _WARMUP['started'] = False  # error recorded and printed by warm_up()
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
+
+
+# Liveness: the process is serving requests.
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'ok': True, 'pid': os.getpid()})
+
+
+# Readiness: 503 until the directories and indexes are built (load balancers
+# should route traffic only to ready workers).
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    state = dict(_WARMUP, pid=os.getpid())
+    if not state['ready']:
+        _warm_up_in_background()
+        return jsonify(state), 503
+    return jsonify(state)
+
+# Admin-only: loader cache hit/miss counters
+@app.route('/api/admin/cache', methods=['GET'])
+def cache_stats():
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    if not (token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)):
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify(FILE_CACHE.stats())
+
+
+# Admin-only: appointment write batching (group commit) histograms
+@app.route('/api/admin/writes', methods=['GET'])
+def write_stats():
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    if not (token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)):
+        return jsonify({'error': 'unauthorized'}), 401
+    writer = getattr(STORAGE, 'appts_writer', None)
+    if writer is None:
+        return jsonify({'engine': STORAGE.name})
+    return jsonify(dict(writer.stats(), engine=STORAGE.name))
+
+
+# Admin-only: password pool admission and latency
+@app.route('/api/admin/passwords', methods=['GET'])
+def password_stats():
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    if not (token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)):
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify(PASSWORDS.stats())
+
+
+# Admin-only: session token cache
+@app.route('/api/admin/sessions', methods=['GET'])
+def session_stats():
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    if not (token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)):
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify(SESSIONS.stats())
+
+
+# Admin-only: booked counts per doctor / hospital / day; ?check=1 also
+# compares them with a full recount of the appointments
+@app.route('/api/admin/bookings', methods=['GET'])
+def booking_stats():
+    token = request.headers.get('X-Admin-Token') or request.cookies.get('admin_token')
+    if not (token and ADMIN_TOKEN and str(token) == str(ADMIN_TOKEN)):
+        return jsonify({'error': 'unauthorized'}), 401
+    out = STORAGE.booking_counters().summary()
+    if request.args.get('check') in ('1', 'true', 'yes'):
+        out['mismatches'] = STORAGE.check_counters()
+    return jsonify(out)
+
 if __name__ == '__main__':
     # Ensure CSV backing files exist with headers
-    ensure_csv(USERS_CSV, ['id', 'username', 'password_hash', 'full_name', 'phone'])
-    ensure_csv(APPTS_CSV, ['id', 'user_id', 'doctor_id', 'hospital_id', 'scheduled_at', 'status', 'created_at'])
+    if STORAGE_ENGINE == 'csv':
+        ensure_csv(USERS_CSV, USERS_HEADER)
+        ensure_csv(APPTS_CSV, APPTS_HEADER)
     # doctors.csv and hospital_directory.csv are expected to be provided by the project
     if not HOSPITALS_CSV.exists():
         print('Warning: hospital_directory.csv not found. /api/hospitals will return empty results until it is provided.')
@@ -605,4 +1218,15 @@ if __name__ == '__main__':
         print('Found doctors_shuffled.csv; app will prefer it for /api/hospital/<id>/doctors')
     elif not DOCTORS_CSV.exists():
         print('Warning: doctors.csv not found. /api/hospital/<id>/doctors will return empty results until it is provided.')
-    app.run(debug=True)
+    parser = argparse.ArgumentParser(description='Run the hospital appointments app')
+    parser.add_argument('--dev', action='store_true', help='Flask debug server (auto-reload, single process)')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '127.0.0.1:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', '0')) or None,
+                        help='worker processes (default: 2 x CPUs + 1)')
+    args = parser.parse_args()
+    if args.dev:
+        app.run(debug=True)
+    else:
+        import sys
+        import serve
+        serve.main(sys.modules[__name__], bind=args.bind, workers=args.workers)
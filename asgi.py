@@ -0,0 +1,269 @@
+# asgi.py
+"""asyncio (ASGI) serving mode for the same API.
+
+The endpoints are still the Flask views in app.py; this module serves them
+from an event loop instead of one blocking thread per connection:
+
+- the loop only parses requests and writes responses, so one process holds
+  thousands of open (idle, slow or streaming) connections;
+- each request's handler, which does the blocking file / database I/O, runs
+  on a bounded thread pool (ASGI_READ_THREADS) -- requests beyond that wait
+  on the loop, not in threads;
+- requests that write (POST/PUT/PATCH/DELETE) go through an asyncio queue
+  instead. A single drain task takes everything queued (up to
+  ASGI_WRITE_BATCH) and starts it together on the write pool
+  (ASGI_WRITE_THREADS), so the appends of one batch reach the storage
+  engine's group commit together and share a write and fsync. Each request
+  is answered as soon as its own write is done, and the next batch starts
+  as soon as threads are free, so one slow write (a bulk booking, an append
+  waiting for compaction) holds up nothing but itself. When the queue
+  (ASGI_WRITE_QUEUE) is full, writes get 503 with Retry-After.
+- streamed responses (format=ndjson / stream) are pulled chunk by chunk from
+  the pool and forwarded as they come.
+
+  python asgi.py --bind 127.0.0.1:8000
+  uvicorn asgi:application --port 8000
+"""
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import app as flask_app
+
+READ_THREADS = int(os.environ.get('ASGI_READ_THREADS', '32'))
+WRITE_THREADS = int(os.environ.get('ASGI_WRITE_THREADS', '8'))
+WRITE_QUEUE = int(os.environ.get('ASGI_WRITE_QUEUE', '1024'))
+WRITE_BATCH = int(os.environ.get('ASGI_WRITE_BATCH', '64'))
+MAX_BODY = int(os.environ.get('ASGI_MAX_BODY', str(1 << 20)))
+
+_READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI http scope."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    env = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', ()):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            env['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            env['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name
+            env[key] = env[key] + ',' + value if key in env else value
+    return env
+
+
+_DONE = object()
+
+
+def _next_chunk(it):
+    # skip empty chunks; _DONE at the end
+    for chunk in it:
+        if chunk:
+            return chunk
+    return _DONE
+
+
+def _call_wsgi(wsgi_app, environ):
+    """Run the WSGI app up to its first body chunk (in a pool thread).
+
+    Returns the context the app ran in as well: later chunks and close() can
+    run on other pool threads, and Flask's streamed responses keep the
+    request context in context variables, so they must resume in it."""
+    ctx = contextvars.copy_context()
+    return ctx.run(_start_wsgi, wsgi_app, environ) + (ctx,)
+
+
+def _start_wsgi(wsgi_app, environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = wsgi_app(environ, start_response)
+    it = iter(result)
+    try:
+        first = _next_chunk(it)
+    except BaseException:
+        _close(result)
+        raise
+    return started['status'], started['headers'], result, it, first
+
+
+def _close(result):
+    close = getattr(result, 'close', None)
+    if close is not None:
+        close()
+
+
+class AsyncServer:
+    """ASGI application serving a WSGI app (the Flask app) as described above."""
+
+    def __init__(self, wsgi_app, warm_up=None, read_threads=READ_THREADS, write_threads=WRITE_THREADS,
+                 write_queue=WRITE_QUEUE, write_batch=WRITE_BATCH):
+        self.wsgi_app = wsgi_app
+        self.warm_up = warm_up
+        self.read_pool = ThreadPoolExecutor(read_threads, thread_name_prefix='asgi-read')
+        self.write_pool = ThreadPoolExecutor(write_threads, thread_name_prefix='asgi-write')
+        self.write_threads = write_threads
+        self.write_queue_size = write_queue
+        self.write_batch = max(1, write_batch)
+        self._writes = None
+        self._write_slots = None
+        self._drain_task = None
+        self.stats = {'write_batches': 0, 'writes': 0, 'writes_rejected': 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"unsupported ASGI scope type {scope['type']!r}")
+
+    # -- lifecycle --------------------------------------------------------
+    def _start(self):
+        if self._writes is None:
+            self._writes = asyncio.Queue(self.write_queue_size)
+            self._write_slots = asyncio.Semaphore(self.write_threads)
+            self._drain_task = asyncio.get_running_loop().create_task(self._drain_writes())
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self._start()
+                    if self.warm_up is not None:
+                        await asyncio.get_running_loop().run_in_executor(self.read_pool, self.warm_up)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': repr(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._drain_task is not None:
+                    self._drain_task.cancel()
+                self.read_pool.shutdown(wait=False)
+                self.write_pool.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # -- requests ---------------------------------------------------------
+    async def _http(self, scope, receive, send):
+        self._start()
+        body = bytearray()
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            more = message.get('more_body', False)
+            if len(body) > MAX_BODY:
+                await self._plain(send, 413, b'request body too large')
+                return
+        environ = _environ(scope, bytes(body))
+        loop = asyncio.get_running_loop()
+        if scope['method'] in _READ_METHODS:
+            call = loop.run_in_executor(self.read_pool, _call_wsgi, self.wsgi_app, environ)
+        else:
+            fut = loop.create_future()
+            try:
+                self._writes.put_nowait((environ, fut))
+            except asyncio.QueueFull:
+                self.stats['writes_rejected'] += 1
+                await self._plain(send, 503, b'too many pending writes', [(b'retry-after', b'1')])
+                return
+            call = fut
+        status, headers, result, it, chunk, ctx = await call
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if chunk is _DONE:
+                await send({'type': 'http.response.body', 'body': b''})
+            while chunk is not _DONE:
+                # fetch the next chunk before sending this one, to flag the last
+                nxt = await loop.run_in_executor(self.read_pool, ctx.run, _next_chunk, it)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': nxt is not _DONE})
+                chunk = nxt
+        finally:
+            await loop.run_in_executor(self.read_pool, ctx.run, _close, result)
+
+    async def _drain_writes(self):
+        while True:
+            batch = [await self._writes.get()]
+            while len(batch) < self.write_batch and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+            self.stats['write_batches'] += 1
+            self.stats['writes'] += len(batch)
+            # start the whole batch at once: concurrent appends are merged by
+            # the storage group commit. Only as many writes as the pool has
+            # threads are started; the rest of the queue waits here.
+            for environ, fut in batch:
+                await self._write_slots.acquire()
+                job = asyncio.get_running_loop().run_in_executor(self.write_pool, _call_wsgi, self.wsgi_app, environ)
+                job.add_done_callback(lambda job, fut=fut: self._write_done(job, fut))
+
+    def _write_done(self, job, fut):
+        self._write_slots.release()
+        if fut.cancelled():  # the client went away
+            if not job.cancelled() and job.exception() is None:
+                _, _, result, _, _, ctx = job.result()
+                try:
+                    self.write_pool.submit(ctx.run, _close, result)
+                except RuntimeError:  # pool shut down
+                    pass
+        elif job.cancelled():
+            fut.cancel()
+        elif job.exception() is not None:
+            fut.set_exception(job.exception())
+        else:
+            fut.set_result(job.result())
+
+    @staticmethod
+    async def _plain(send, status, text, headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')] + list(headers)})
+        await send({'type': 'http.response.body', 'body': text})
+
+
+application = AsyncServer(flask_app.app, warm_up=flask_app.warm_up)
+
+
+def main(argv=None):
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Serve the API from an asyncio event loop (ASGI)')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '127.0.0.1:8000'))
+    args = parser.parse_args(argv)
+    host, _, port = args.bind.rpartition(':')
+    uvicorn.run(application, host=host or '127.0.0.1', port=int(port), lifespan='on', log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+# backups.py
+"""Snapshots of appointments.csv taken before it is rewritten.
+
+`BackupManager.before_rewrite()` is called (under the write locks) right
+before a new appointments.csv is swapped in. It only hardlinks the current
+file to a snapshot name, which is O(1); the rewrite then replaces the data
+file with a new inode, so the linked snapshot is never modified. Everything
+else (gzip compression, computing deltas, pruning) runs on a background
+thread, off the request path.
+
+Cancellations and deletions live in the change log next to the file
+(appointments.changes.csv) until they are folded in, so the log is
+hardlinked along with it (`<stem>.bak.<ts>.changes.csv`, kept as is) and
+restored together with the snapshot. Every rewrite replaces the log too.
+
+Modes:
+- 'hardlink': every snapshot is a full copy of the file (a hardlink, then
+  optionally gzipped).
+- 'delta': every `full_every`-th snapshot is full; the others only store the
+  bytes that differ from the latest full snapshot (the common prefix length
+  plus the remaining bytes), which is small for an append-mostly file.
+
+The hardlink is first named `<stem>.bak.<ts>.pending`; the background
+thread claims it by renaming it to `.finishing.<pid>`, so one process
+finishes it. Snapshots left behind by a process that stopped first (a
+`.pending` file, or `.finishing` of a process that is gone) are finished
+by `recover()`, which the CSV storage runs at startup.
+
+Retention keeps the newest `keep_last` snapshots plus the newest snapshot of
+each of the last `hourly` hours and `daily` days; full snapshots that a kept
+delta still needs are kept as well.
+
+  python backups.py list
+  python backups.py restore appointments.bak.20251119T055703Z.csv
+"""
+import gzip
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_TS_FORMAT = '%Y%m%dT%H%M%S%fZ'
+
+
+def _common_prefix(a, b, chunk=65536):
+    n = 0
+    limit = min(len(a), len(b))
+    # compare whole chunks first (done in C), then bytes within the first differing chunk
+    while n + chunk <= limit and a[n:n + chunk] == b[n:n + chunk]:
+        n += chunk
+    while n < limit and a[n] == b[n]:
+        n += 1
+    return n
+
+
+def change_log_path(path):
+    """The change log kept next to a data file: appointments.changes.csv
+    for appointments.csv."""
+    path = Path(path)
+    return path.with_name(f'{path.stem}.changes{path.suffix}')
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # no hardlinks (other filesystem / platform): fall back to a copy
+        shutil.copy2(src, dst)
+
+
+def _write_atomic(target, data):
+    tmp_path = target.with_name(target.name + '.tmp')
+    with tmp_path.open('wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target)
+
+
+def _pid_alive(pid):
+    if pid == os.getpid() or os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BackupManager:
+    def __init__(self, path, backup_dir=None, keep_last=10, hourly=0, daily=0,
+                 compress=False, mode='hardlink', full_every=10):
+        if mode not in ('hardlink', 'delta'):
+            raise ValueError(f'unknown backup mode: {mode!r}')
+        self.path = Path(path)
+        self.log_path = change_log_path(self.path)
+        self.backup_dir = Path(backup_dir) if backup_dir else self.path.parent
+        self.keep_last = keep_last
+        self.hourly = hourly
+        self.daily = daily
+        self.compress = compress
+        self.mode = mode
+        self.full_every = max(1, int(full_every))
+        # e.g. appointments.bak.20251119T153000Z.csv / .csv.gz / .delta / .delta.gz
+        self._name_re = re.compile(
+            re.escape(self.path.stem) + r'\.bak\.(\d{8}T\d{6})(\d{6})?Z(' + re.escape(self.path.suffix)
+            + r'|\.delta)(\.gz)?$')
+        self._leftover_re = re.compile(
+            re.escape(self.path.stem) + r'\.bak\.(\d{8}T\d{6}(?:\d{6})?Z)\.(?:pending|finishing\.(\d+))$')
+        self._queue = None
+        self._worker = None
+        self._lock = threading.Lock()
+        # snapshots prune() must leave alone, e.g. one being restored
+        self.protected = set()
+
+    @classmethod
+    def from_env(cls, path, backup_dir=None):
+        """Manager configured from the BACKUP_* environment variables, the
+        same way for the app and the command line."""
+        return cls(
+            path,
+            backup_dir=backup_dir or os.environ.get('BACKUP_DIR') or None,
+            keep_last=int(os.environ.get('BACKUP_KEEP_LAST', '10')),
+            hourly=int(os.environ.get('BACKUP_HOURLY', '0')),
+            daily=int(os.environ.get('BACKUP_DAILY', '0')),
+            compress=os.environ.get('BACKUP_COMPRESS', '0') in ('1', 'true', 'yes'),
+            mode=os.environ.get('BACKUP_MODE', 'hardlink'),
+        )
+
+    # -- request path -----------------------------------------------------
+    def before_rewrite(self):
+        """Snapshot the current file and its change log. Call while holding
+        the write locks of both, right before they are replaced."""
+        if not self.path.exists():
+            return None
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        ts = datetime.utcnow().strftime(_TS_FORMAT)
+        if self.log_path.exists():
+            _link(self.log_path, self._log_snapshot(ts))
+        pending = self.backup_dir / f'{self.path.stem}.bak.{ts}.pending'
+        _link(self.path, pending)
+        self._submit(self._finish, pending, ts)
+        return pending
+
+    def _log_snapshot(self, ts):
+        return self.backup_dir / f'{self.path.stem}.bak.{ts}.changes{self.path.suffix}'
+
+    # -- background work --------------------------------------------------
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name='appointments-backup', daemon=True)
+                self._worker.start()
+            self._queue.put((fn, args))
+
+    def _run(self):
+        while True:
+            fn, args = self._queue.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Warning: appointments backup failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until queued backup work is done."""
+        with self._lock:
+            q = self._queue
+        if q is not None:
+            q.join()
+
+    def _claim(self, path):
+        """Rename a pending snapshot to one this process owns; None if
+        another process claimed it first."""
+        stem = path.name.split('.pending')[0].split('.finishing')[0]
+        claimed = path.with_name(f'{stem}.finishing.{os.getpid()}')
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def recover(self):
+        """Finish snapshots whose process stopped before finishing them.
+        Returns the timestamps recovered."""
+        if not self.backup_dir.exists():
+            return []
+        recovered = []
+        for p in sorted(self.backup_dir.iterdir()):
+            m = self._leftover_re.match(p.name)
+            if not m or (m.group(2) and _pid_alive(int(m.group(2)))):
+                continue
+            if self._finish(p, m.group(1)):
+                recovered.append(m.group(1))
+        return recovered
+
+    def _finish(self, pending, ts):
+        pending = self._claim(pending)
+        if pending is None:
+            return False
+        base = self._latest_full() if self.mode == 'delta' else None
+        deltas_since = self._deltas_since(base) if base else 0
+        if base and deltas_since + 1 < self.full_every:
+            name = f'{self.path.stem}.bak.{ts}.delta'
+            data = pending.read_bytes()
+            base_data = self.read_snapshot(base['name'])
+            prefix = _common_prefix(data, base_data)
+            payload = f"base={base['name']} prefix={prefix}\n".encode('utf-8') + data[prefix:]
+            self._write(name, payload)
+            pending.unlink()
+        else:
+            name = f'{self.path.stem}.bak.{ts}{self.path.suffix}'
+            if self.compress:
+                with pending.open('rb') as src, gzip.open(self.backup_dir / (name + '.gz'), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                pending.unlink()
+            else:
+                os.replace(pending, self.backup_dir / name)
+        self.prune()
+        return True
+
+    def _write(self, name, payload):
+        if self.compress:
+            with gzip.open(self.backup_dir / (name + '.gz'), 'wb') as f:
+                f.write(payload)
+        else:
+            (self.backup_dir / name).write_bytes(payload)
+
+    # -- listing / restore ------------------------------------------------
+    def list(self):
+        """Snapshots, newest first: dicts with name, ts, kind, compressed, size."""
+        out = []
+        if not self.backup_dir.exists():
+            return out
+        for p in self.backup_dir.iterdir():
+            m = self._name_re.match(p.name)
+            if not m:
+                continue
+            ts = datetime.strptime(m.group(1) + (m.group(2) or '000000'), '%Y%m%dT%H%M%S%f')
+            log = self._log_snapshot(m.group(1) + (m.group(2) or '') + 'Z')
+            out.append({
+                'name': p.name,
+                'ts': ts,
+                'changes': log.name if log.exists() else None,
+                'kind': 'delta' if m.group(3) == '.delta' else 'full',
+                'compressed': bool(m.group(4)),
+                'size': p.stat().st_size,
+            })
+        out.sort(key=lambda s: (s['ts'], s['name']), reverse=True)
+        return out
+
+    def _latest_full(self):
+        return next((s for s in self.list() if s['kind'] == 'full'), None)
+
+    def _deltas_since(self, base):
+        return sum(1 for s in self.list() if s['kind'] == 'delta' and s['ts'] > base['ts'])
+
+    def _raw(self, name):
+        p = self.backup_dir / name
+        if name.endswith('.gz'):
+            with gzip.open(p, 'rb') as f:
+                return f.read()
+        return p.read_bytes()
+
+    def _delta_base(self, name):
+        header = self._raw(name).split(b'\n', 1)[0].decode('utf-8')
+        fields = dict(part.split('=', 1) for part in header.split())
+        return fields['base'], int(fields['prefix'])
+
+    def read_snapshot(self, name):
+        """Return the full file contents a snapshot represents."""
+        raw = self._raw(name)
+        if '.delta' not in name:
+            return raw
+        header, tail = raw.split(b'\n', 1)
+        base, prefix = self._delta_base(name)
+        return self.read_snapshot(base)[:prefix] + tail
+
+    def restore(self, name, target=None):
+        """Write snapshot `name` to `target` (default: the live file) and
+        its change log next to it."""
+        target = Path(target) if target else self.path
+        m = self._name_re.match(name)
+        log = self._log_snapshot(m.group(1) + (m.group(2) or '') + 'Z') if m else None
+        _write_atomic(target, self.read_snapshot(name))
+        log_target = change_log_path(target)
+        if log is not None and log.exists():
+            _write_atomic(log_target, log.read_bytes())
+        elif log_target.exists():
+            # a snapshot taken without its log: its rows are the whole state,
+            # so keep only the header of the current log
+            with log_target.open('rb') as f:
+                _write_atomic(log_target, f.readline())
+        return target
+
+    # -- retention --------------------------------------------------------
+    def prune(self):
+        snaps = self.list()
+        keep = set(s['name'] for s in snaps[:self.keep_last]) | self.protected
+        now = datetime.utcnow()
+        for count, step, bucket in ((self.hourly, timedelta(hours=1), '%Y%m%d%H'), (self.daily, timedelta(days=1), '%Y%m%d')):
+            if not count:
+                continue
+            seen = set()
+            for s in snaps:
+                if now - s['ts'] > step * count:
+                    break
+                key = s['ts'].strftime(bucket)
+                if key not in seen:
+                    seen.add(key)
+                    keep.add(s['name'])
+        # a kept delta is useless without its base
+        for s in snaps:
+            if s['name'] in keep and s['kind'] == 'delta':
+                keep.add(self._delta_base(s['name'])[0])
+        removed = []
+        for s in snaps:
+            if s['name'] not in keep:
+                (self.backup_dir / s['name']).unlink()
+                if s['changes']:
+                    (self.backup_dir / s['changes']).unlink(missing_ok=True)
+                removed.append(s['name'])
+        return removed
+
+
+def main(argv=None):
+    import argparse
+
+    from storage import CsvStorage
+
+    parser = argparse.ArgumentParser(description='List and restore appointments.csv snapshots '
+                                                 '(with their appointments.changes.csv)')
+    parser.add_argument('--appointments', default='appointments.csv')
+    parser.add_argument('--backup-dir', help='default: BACKUP_DIR, else next to the appointments file')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('list', help='show snapshots, newest first')
+    p_restore = sub.add_parser('restore', help='replace appointments.csv with a snapshot')
+    p_restore.add_argument('name')
+    p_restore.add_argument('--to', help='write to this path (and its change log next to it) instead of the live files')
+    args = parser.parse_args(argv)
+
+    # the app's retention settings: with the defaults instead, recover() and
+    # before_rewrite() below would prune snapshots the app is told to keep
+    manager = BackupManager.from_env(args.appointments, backup_dir=args.backup_dir)
+    if args.cmd == 'restore':
+        if args.name not in {s['name'] for s in manager.list()}:
+            print(f'No snapshot named {args.name} (see `python backups.py list`)')
+            return 1
+        manager.protected.add(args.name)
+    manager.recover()
+    if args.cmd == 'list':
+        for s in manager.list():
+            print(f"{s['name']:60} {s['kind']:5} {s['size']:>10} {s['ts'].isoformat()}")
+    elif args.cmd == 'restore':
+        if args.to:
+            manager.restore(args.name, args.to)
+            print(f'Restored {args.name} to {args.to}')
+            return
+        # take the app's write locks so running workers neither append to
+        # the old file nor apply logged changes meant for it
+        storage = CsvStorage('users.csv', args.appointments)
+        with storage.appts_writer.exclusive(), storage.changes_writer.exclusive():
+            manager.before_rewrite()
+            manager.flush()
+            manager.restore(args.name)
+            storage.appointments.invalidate()
+            storage.changes.invalidate()
+        print(f'Restored {args.name} to {args.appointments} (previous version snapshotted first)')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
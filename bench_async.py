@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Throughput and latency of the Flask app under gunicorn vs the ASGI mode.
+
+Starts both servers on a synthetic directory (see bench_memory.py) in a
+temporary directory -- `app.py` with --flask-workers sync workers and
+`asgi.py` as one process -- then, for each concurrency level, keeps that
+many client connections busy for --seconds on each endpoint:
+
+  search    GET  /api/hospitals?q=<town>&limit=20
+  history   GET  /api/history/<user>
+  book      POST /api/book (distinct doctor/slot pairs, so no 409s; the
+            servers get an ADMIN_TOKEN so bookings may name their user_id)
+
+Each request uses its own connection (gunicorn's sync workers close after
+every response), so the numbers include accepting and holding connections,
+which is where an event loop differs from a worker per request.
+
+  python bench_async.py --concurrency 10 100 1000 --seconds 5
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bench_memory import TOWNS, write_fixtures
+
+HERE = Path(__file__).resolve().parent
+USERS = 50
+FIRST_SLOT = datetime(2031, 1, 1, 9, 0)
+ADMIN_TOKEN = 'bench-admin-token'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+
+def start_server(label, argv, cwd, port, timeout=120):
+    env = dict(os.environ, PYTHONPATH=str(HERE), WEB_CONCURRENCY=os.environ.get('WEB_CONCURRENCY', '1'),
+               ADMIN_TOKEN=ADMIN_TOKEN)
+    proc = subprocess.Popen([sys.executable] + argv + ['--bind', f'127.0.0.1:{port}'], cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'{label} server exited with {proc.returncode}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=2) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{label} server not ready after {timeout}s')
+
+
+async def request(port, method, path, body=None, headers=()):
+    """One request on a fresh connection; returns the status code."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        payload = json.dumps(body).encode() if body is not None else b''
+        head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+        head += ''.join(f'{name}: {value}\r\n' for name, value in headers)
+        if body is not None:
+            head += f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+        writer.write(head.encode() + b'\r\n' + payload)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()  # to EOF (Connection: close)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+class Workload:
+    def __init__(self, hospitals, doctor_hospitals, seed=1):
+        """`doctor_hospitals[i]` is the hospital of doctor i + 1."""
+        self.hospitals = hospitals
+        self.doctor_hospitals = doctor_hospitals
+        self.doctors = len(doctor_hospitals)
+        self.rnd = random.Random(seed)
+        self.booked = 0
+
+    def search(self):
+        return 'GET', f'/api/hospitals?q={self.rnd.choice(TOWNS).split()[0].lower()}&limit=20', None
+
+    def history(self):
+        return 'GET', f'/api/history/{self.rnd.randint(1, USERS)}', None
+
+    def book(self):
+        # walk (doctor, slot) pairs so every booking is for a free slot
+        i = self.booked
+        self.booked += 1
+        doctor = i % self.doctors + 1
+        slot = i // self.doctors
+        day, n = divmod(slot, 16)  # 16 half-hour slots between 09:00 and 17:00
+        when = FIRST_SLOT + timedelta(days=day, minutes=30 * n)
+        return 'POST', '/api/book', {'hospital_id': self.doctor_hospitals[doctor - 1], 'doctor_id': doctor,
+                                     'user_id': i % USERS + 1, 'scheduled_at': when.isoformat()}
+
+
+async def run_level(port, make_request, concurrency, seconds, headers=()):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            method, path, body = make_request()
+            t0 = time.perf_counter()
+            try:
+                status = await request(port, method, path, body, headers)
+            except OSError:
+                status = 0
+            if 200 <= status < 300:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else float('nan')
+    return len(latencies) / elapsed, pct(0.50), pct(0.99), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--flask-workers', type=int, default=1)
+    parser.add_argument('--hospitals', type=int, default=20000)
+    parser.add_argument('--doctors', type=int, default=60000)
+    parser.add_argument('--endpoints', nargs='+', default=['book', 'history', 'search'],
+                        choices=['book', 'history', 'search'], help='booking first gives history rows to read')
+    args = parser.parse_args(argv)
+    _raise_fd_limit()
+
+    servers = (
+        ('flask', ['app.py', '--workers', str(args.flask_workers)]),
+        ('asgi', ['asgi.py']),
+    )
+    print(f"{'server':6} {'endpoint':8} {'conns':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for label, argv in servers:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_fixtures(tmpdir, args.hospitals, args.doctors)
+            port = _free_port()
+            proc = start_server(label, [str(HERE / argv[0])] + argv[1:], tmpdir, port)
+            try:
+                with open(Path(tmpdir) / 'doctors.csv', newline='', encoding='utf-8') as f:
+                    doctor_hospitals = [int(row['hospital_id']) for row in csv.DictReader(f)]
+                workload = Workload(args.hospitals, doctor_hospitals)
+                for endpoint in args.endpoints:
+                    for conns in args.concurrency:
+                        rps, p50, p99, errors = asyncio.run(
+                            run_level(port, getattr(workload, endpoint), conns, args.seconds,
+                                      headers=[('X-Admin-Token', ADMIN_TOKEN)]))
+                        print(f'{label:6} {endpoint:8} {conns:>6} {rps:>9.0f} {p50:>9.1f} {p99:>9.1f} {errors:>7}',
+                              flush=True)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Memory used by the parsed directories: dict rows (previous layout) vs the
+compact records from directory.py.
+
+Generates a synthetic national-format hospital directory and a doctors file
+of the requested sizes, parses each with both layouts and reports the memory
+retained by the result (tracemalloc) and the parse time.
+
+  python bench_memory.py --hospitals 200000 --doctors 600000
+"""
+import argparse
+import csv
+import gc
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from directory import parse_doctors_csv, parse_hospitals_csv
+from geo import parse_coordinates
+
+TOWNS = ['Andheri', 'Bandra', 'Kothrud', 'Saket', 'Adyar', 'Salt Lake', 'Koramangala', 'Gomti Nagar', 'Navrangpura', 'Kankarbagh']
+DISTRICTS = ['Mumbai', 'Mumbai Suburban', 'Pune', 'South Delhi', 'Chennai', 'Kolkata', 'Bengaluru Urban', 'Lucknow', 'Ahmedabad', 'Patna']
+SPECIALTIES = ['General Medicine', 'Cardiology', 'ENT', 'Orthopedics', 'Dermatology', 'Pediatrics', 'Gynecology', 'Neurology', 'Radiology', 'Urology']
+QUALIFICATIONS = ['MBBS', 'MD', 'DNB', 'MS', 'DM', 'MBBS, MD']
+FIRST = ['Priya', 'Amit', 'Suman', 'Neha', 'Karan', 'Pooja', 'Vikram', 'Anita', 'Ritu', 'Rahul']
+LAST = ['Sharma', 'Singh', 'Patel', 'Iyer', 'Nair', 'Bose', 'Kumar', 'Verma', 'Reddy', 'Desai']
+
+
+# -- previous layout (dict per row, hospitals keep the full CSV row in 'raw') --
+def legacy_hospitals(path):
+    with path.open(newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    cleaned = []
+    for r in rows:
+        hosp_id = r.get('Sr_No') or r.get('SrNo') or r.get('id')
+        coords = parse_coordinates(r.get('Location_Coordinates'))
+        cleaned.append({'id': int(hosp_id) if hosp_id and str(hosp_id).isdigit() else hosp_id,
+                        'name': r.get('Hospital_Name'), 'locality': r.get('Town') or '',
+                        'address': r.get('Address_Original_First_Line') or '',
+                        'district': r.get('District') or '', 'pincode': (r.get('Pincode') or '').strip(),
+                        'lat': coords[0] if coords else None, 'lon': coords[1] if coords else None,
+                        'raw': r})
+    return cleaned
+
+
+def legacy_doctors(path):
+    with path.open(newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    cleaned = []
+    for r in rows:
+        exp = r.get('experience_years')
+        cleaned.append({
+            'id': int(r['id']) if r.get('id') else None,
+            'hospital_id': int(r['hospital_id']) if r.get('hospital_id') else None,
+            'name': r.get('name'),
+            'specialty': r.get('specialty'),
+            'is_available': str(r.get('is_available')).strip() in ('1', 'True', 'true', 't', 'yes'),
+            'ward': None,
+            'qualification': r.get('qualification'),
+            'experience_years': int(exp) if exp and exp.isdigit() else None,
+            'email': r.get('email'),
+            'phone': r.get('phone'),
+        })
+    return cleaned
+
+
+def write_fixtures(tmpdir, hospitals, doctors):
+    rnd = random.Random(42)
+    hosp_path = Path(tmpdir) / 'hospital_directory.csv'
+    with hosp_path.open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['Sr_No', 'Location_Coordinates', 'Location', 'Hospital_Name', 'Hospital_Category', 'Hospital_Care_Type',
+                    'Discipline_Systems_of_Medicine', 'Address_Original_First_Line', 'State', 'District', 'Subdistrict',
+                    'Pincode', 'Telephone', 'Mobile_Number', 'Emergency_Num', 'Ambulance_Phone_No', 'Bloodbank_Phone_No',
+                    'Town', 'Total_Num_Beds', 'Number_Doctor', 'Specialties', 'Facilities'])
+        for i in range(1, hospitals + 1):
+            town, district = rnd.choice(TOWNS), rnd.choice(DISTRICTS)
+            w.writerow([i, f'{rnd.uniform(8, 35):.6f}, {rnd.uniform(68, 97):.6f}', town,
+                        f'{rnd.choice(LAST)} {rnd.choice(["Hospital", "Clinic", "Nursing Home"])} {i}',
+                        rnd.choice(['Private', 'Public']), rnd.choice(['Hospital', 'Clinic']), 'Allopathy',
+                        f'{rnd.randint(1, 999)} {rnd.choice(["MG Road", "Station Road", "Link Road"])}', 'Maharashtra',
+                        district, town, f'{rnd.randint(110000, 855999)}', f'0{rnd.randint(10**9, 10**10 - 1)}',
+                        f'9{rnd.randint(10**8, 10**9 - 1)}', '108', '102', '', town, rnd.randint(5, 500),
+                        rnd.randint(1, 80), ', '.join(rnd.sample(SPECIALTIES, 3)), 'OPD, Pharmacy'])
+    doc_path = Path(tmpdir) / 'doctors.csv'
+    with doc_path.open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['id', 'hospital_id', 'name', 'specialty', 'is_available', 'ward_id', 'qualification',
+                    'experience_years', 'email', 'phone'])
+        for i in range(1, doctors + 1):
+            fn, ln = rnd.choice(FIRST), rnd.choice(LAST)
+            w.writerow([i, rnd.randint(1, max(1, hospitals)), f'{fn} {ln}', rnd.choice(SPECIALTIES), rnd.choice('01'), '',
+                        rnd.choice(QUALIFICATIONS), rnd.randint(1, 40), f'{fn.lower()}.{ln.lower()}{i}@example.com',
+                        f'+91{rnd.randint(6 * 10**9, 10**10 - 1)}'])
+    return hosp_path, doc_path
+
+
+def measure(parse, path):
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    rows = parse(path)
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(rows), retained, peak, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hospitals', type=int, default=50000)
+    parser.add_argument('--doctors', type=int, default=150000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hosp_path, doc_path = write_fixtures(tmpdir, args.hospitals, args.doctors)
+        print(f"{'':26} {'rows':>8} {'retained MB':>12} {'peak MB':>9} {'B/row':>7} {'parse s':>8}")
+        for label, parse, path in (
+            ('hospitals: dict + raw', legacy_hospitals, hosp_path),
+            ('hospitals: records', parse_hospitals_csv, hosp_path),
+            ('doctors: dict', legacy_doctors, doc_path),
+            ('doctors: records', parse_doctors_csv, doc_path),
+        ):
+            n, retained, peak, elapsed = measure(parse, path)
+            print(f'{label:26} {n:>8} {retained / 2**20:>12.1f} {peak / 2**20:>9.1f} '
+                  f'{retained / max(n, 1):>7.0f} {elapsed:>8.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
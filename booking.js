@@ -56,7 +56,9 @@
 
   confirmBooking.addEventListener('click', async function(){
     const hospitalId = this.dataset.hospitalId;
-    const scheduled_at = apptDate.value;
+    // datetime-local is the browser's local time; send it with its offset
+    // (as UTC) so the server converts it to its own local time
+    const scheduled_at = apptDate.value ? new Date(apptDate.value).toISOString() : '';
     if(!scheduled_at){ modalNotif.hidden=false; modalNotif.textContent='Please choose date and time'; modalNotif.className='notification error'; return }
     try{
       // Require user to be logged in
@@ -72,11 +74,13 @@
       this.disabled = true;
       modalNotif.hidden = false; modalNotif.textContent = 'Booking…'; modalNotif.className='notification info';
       // Send minimal payload: hospital_id, scheduled_at, and optional note; include user_id
+      // so an expired session gets a 401 instead of a guest booking
       const payload = { scheduled_at, user_id: window.currentUserId };
       if(hospitalId) payload.hospital_id = hospitalId;
       if(apptNote.value) payload.note = apptNote.value;
       const resp = await fetch('/api/book', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload)});
       const data = await resp.json();
+      if(resp.status === 401){ modalNotif.className='notification error'; modalNotif.textContent = 'Your session has expired, please log in again.'; try{ if(typeof window.openLoginModal === 'function') window.openLoginModal(); }catch(e){} return; }
       if(resp.ok){ modalNotif.className='notification success'; modalNotif.textContent = 'Booked — id: '+(data.appointment_id||data.id||'unknown'); if(typeof showNotification==='function') showNotification('Booking successful', 'success'); setTimeout(closeBookingModal, 1200); }
       else { modalNotif.className='notification error'; modalNotif.textContent = data.error || JSON.stringify(data); if(typeof showNotification==='function') showNotification(data.error || 'Booking failed', 'error'); }
     }catch(err){ modalNotif.className='notification error'; modalNotif.textContent = err.message || 'Booking failed'; if(typeof showNotification==='function') showNotification(err.message || 'Booking failed','error'); }
@@ -0,0 +1,100 @@
+# counters.py
+"""Booked-appointment counts per doctor, per hospital and per day.
+
+The CSV storage engine keeps one BookingCounters in step with its slot
+calendar: every time an appointment starts or stops occupying a slot (a new
+row, a cancellation, a history deletion -- from any worker, as read back
+from the files) its doctor, hospital and day count move by one, and the
+whole thing is rebuilt when a file is rewritten. Reads are dict lookups.
+
+`recount(rows)` builds the same counts from scratch and `diff()` lists where
+two sets of counts disagree, for the consistency check.
+"""
+import threading
+from collections import Counter
+
+from slots import parse_when
+
+
+def _norm(value):
+    try:
+        return int(value) if value is not None and str(value).isdigit() else value
+    except Exception:
+        return value
+
+
+def day_of(scheduled_at):
+    """'2031-01-02T10:30:00' -> '2031-01-02' (None if unparsable)."""
+    dt = parse_when(scheduled_at)
+    return dt.date().isoformat() if dt else None
+
+
+class BookingCounters:
+    def __init__(self):
+        self.by_doctor = Counter()
+        self.by_hospital = Counter()
+        self.by_day = Counter()
+        self.total = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def recount(cls, rows):
+        counters = cls()
+        for a in rows:
+            if a.get('status') == 'booked':
+                counters.add(a)
+        return counters
+
+    def add(self, row, n=1):
+        """Count `row` as booked (n=1) or no longer booked (n=-1)."""
+        doctor, hospital, day = _norm(row.get('doctor_id')), _norm(row.get('hospital_id')), day_of(row.get('scheduled_at'))
+        with self._lock:
+            self.total += n
+            for counter, key in ((self.by_doctor, doctor), (self.by_hospital, hospital), (self.by_day, day)):
+                if key is None:
+                    continue
+                counter[key] += n
+                if not counter[key]:
+                    del counter[key]
+
+    def clear(self):
+        with self._lock:
+            self.by_doctor.clear()
+            self.by_hospital.clear()
+            self.by_day.clear()
+            self.total = 0
+
+    def doctor(self, doctor_id):
+        return self.by_doctor.get(_norm(doctor_id), 0)
+
+    def hospital(self, hospital_id):
+        return self.by_hospital.get(_norm(hospital_id), 0)
+
+    def day(self, day):
+        return self.by_day.get(day, 0)
+
+    def summary(self, top=10):
+        with self._lock:
+            return {
+                'total': self.total,
+                'doctors': len(self.by_doctor),
+                'hospitals': len(self.by_hospital),
+                'top_doctors': [{'doctor_id': k, 'booked': v} for k, v in self.by_doctor.most_common(top)],
+                'top_hospitals': [{'hospital_id': k, 'booked': v} for k, v in self.by_hospital.most_common(top)],
+                'by_day': dict(sorted(self.by_day.items())),
+            }
+
+    def diff(self, other, limit=20):
+        """Up to `limit` mismatches {'scope', 'key', 'have', 'expected'} of
+        these counts against `other` (e.g. a fresh recount)."""
+        out = []
+        if self.total != other.total:
+            out.append({'scope': 'total', 'key': None, 'have': self.total, 'expected': other.total})
+        for scope in ('by_doctor', 'by_hospital', 'by_day'):
+            have, expected = getattr(self, scope), getattr(other, scope)
+            for key in sorted(set(have) | set(expected), key=str):
+                if have.get(key, 0) != expected.get(key, 0):
+                    out.append({'scope': scope, 'key': key, 'have': have.get(key, 0), 'expected': expected.get(key, 0)})
+                    if len(out) >= limit:
+                        return out
+        return out
@@ -0,0 +1,138 @@
+# csvtail.py
+"""Incremental reader for append-only CSV files (appointments.csv).
+
+`CsvTail` remembers how many bytes of the file it has consumed and, on each
+`refresh()`, parses only rows appended since then into its in-memory row list
+and per-column indexes. It falls back to a full reload when the file was
+rewritten rather than appended to: the inode changed, the file shrank, the
+header changed, or the bytes just before the consumed offset differ from what
+was read last time (an in-place rewrite that happened to grow the file).
+"""
+import csv
+import io
+import os
+import threading
+
+# bytes before the consumed offset that are re-checked to detect rewrites
+_GUARD_BYTES = 64
+
+
+def _to_int(value):
+    try:
+        return int(value) if value is not None and str(value).isdigit() else value
+    except Exception:
+        return value
+
+
+class CsvTail:
+    def __init__(self, path, columns, int_fields=(), index_fields=(), header_detect=None):
+        """`columns` are used for files without a header row. `int_fields` are
+        normalized with int() when numeric. `index_fields` get a
+        value -> [rows] index. `header_detect(first_line)` decides whether the
+        first line is a header (defaults to "contains any column name")."""
+        self.path = path
+        self.columns = list(columns)
+        self.int_fields = tuple(int_fields)
+        self.index_fields = tuple(index_fields)
+        self.header_detect = header_detect or (lambda line: any(c in line.lower() for c in self.columns))
+        self._lock = threading.Lock()
+        self.full_reloads = 0
+        self._reset()
+
+    def _reset(self):
+        self.rows = []
+        self.indexes = {f: {} for f in self.index_fields}
+        self.fieldnames = None
+        self.header_line = b''
+        self.offset = 0
+        self.inode = None
+        self.guard = b''
+
+    def invalidate(self):
+        """Forget everything; the next refresh() re-reads the whole file."""
+        with self._lock:
+            self._reset()
+
+    def _rewritten(self, f, st):
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            return True
+        f.seek(0)
+        if f.read(len(self.header_line)) != self.header_line:
+            return True
+        if self.guard:
+            f.seek(self.offset - len(self.guard))
+            if f.read(len(self.guard)) != self.guard:
+                return True
+        return False
+
+    def refresh(self):
+        """Bring the in-memory rows up to date with the file."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            with self._lock:
+                if self.inode is not None:
+                    self._reset()
+            return
+        if st.st_ino == self.inode and st.st_size == self.offset:
+            return
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if self.inode is not None and self._rewritten(f, st):
+                    self._reset()
+                if self.inode is None:
+                    self.inode = st.st_ino
+                    self.full_reloads += 1
+                f.seek(self.offset)
+                chunk = f.read(st.st_size - self.offset)
+            # only consume complete lines; a writer may be mid-row
+            end = chunk.rfind(b'\n') + 1
+            if end <= 0:
+                return
+            chunk = chunk[:end]
+            if self.fieldnames is None:
+                first_end = chunk.find(b'\n') + 1
+                first = chunk[:first_end]
+                if self.header_detect(first.decode('utf-8', 'replace')):
+                    self.fieldnames = next(csv.reader([first.decode('utf-8').strip('\r\n')]))
+                    self.header_line = first
+                    body = chunk[first_end:]
+                else:
+                    self.fieldnames = self.columns
+                    body = chunk
+            else:
+                body = chunk
+            self._parse(body.decode('utf-8'))
+            self.offset += end
+            self.guard = (self.guard + chunk)[-_GUARD_BYTES:]
+
+    def _parse(self, text):
+        for values in csv.reader(io.StringIO(text, newline='')):
+            if not values:
+                continue
+            while len(values) < len(self.fieldnames):
+                values.append('')
+            row = dict(zip(self.fieldnames, values))
+            for key in self.int_fields:
+                row[key] = _to_int(row.get(key))
+            self.rows.append(row)
+            for field, index in self.indexes.items():
+                index.setdefault(row.get(field), []).append(row)
+
+    def snapshot(self):
+        """Refresh, then return (full_reloads, rows) read under the lock; rows
+        only ever grow until the next full reload."""
+        self.refresh()
+        with self._lock:
+            return self.full_reloads, self.rows
+
+    # Readers: each call refreshes first, then returns copies of the row lists
+    # so callers are not affected by rows appended concurrently.
+    def all(self):
+        self.refresh()
+        return list(self.rows)
+
+    def lookup(self, field, value):
+        self.refresh()
+        return list(self.indexes[field].get(_to_int(value), ()))
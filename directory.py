@@ -0,0 +1,143 @@
+# directory.py
+"""Parsing of the hospital and doctor directory CSVs into compact records.
+
+Each row becomes a `__slots__` record instead of a dict: no per-row hash
+table, ids stored as ints, and repeated strings (specialty, qualification,
+town, district, ...) interned so every row with the same value shares one
+string object. The original CSV row (`raw`) is not kept. Records answer
+`row.get('name')` / `row['name']` like the dicts they replace, so callers
+need not care which layout they get.
+"""
+import csv
+import sys
+
+from geo import parse_coordinates
+
+
+class Record:
+    __slots__ = ()
+    fields = ()
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in self._field_set:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._field_set
+
+    def keys(self):
+        return self.fields
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self.fields}
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+class HospitalRecord(Record):
+    fields = ('id', 'name', 'locality', 'address', 'district', 'pincode', 'lat', 'lon')
+    __slots__ = fields
+    _field_set = frozenset(fields)
+
+    def __init__(self, id, name, locality, address, district, pincode, lat, lon):
+        self.id = id
+        self.name = name
+        self.locality = locality
+        self.address = address
+        self.district = district
+        self.pincode = pincode
+        self.lat = lat
+        self.lon = lon
+
+
+class DoctorRecord(Record):
+    # 'ward' is not stored (always None in the CSVs) but still answers get()
+    fields = ('id', 'hospital_id', 'name', 'specialty', 'is_available', 'ward', 'qualification',
+              'experience_years', 'email', 'phone')
+    __slots__ = ('id', 'hospital_id', 'name', 'specialty', 'is_available', 'qualification',
+                 'experience_years', 'email', 'phone')
+    _field_set = frozenset(fields)
+    ward = None
+
+    def __init__(self, id, hospital_id, name, specialty, is_available, qualification, experience_years, email, phone):
+        self.id = id
+        self.hospital_id = hospital_id
+        self.name = name
+        self.specialty = specialty
+        self.is_available = is_available
+        self.qualification = qualification
+        self.experience_years = experience_years
+        self.email = email
+        self.phone = phone
+
+
+def _intern(value):
+    return sys.intern(value) if value else value
+
+
+def _int_or_value(value):
+    text = (value or '').strip()
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def parse_hospitals_csv(path):
+    if not path.exists():
+        return []
+    cleaned = []
+    with path.open(newline='', encoding='utf-8') as f:
+        # stream the rows; only the cleaned record is kept
+        for r in csv.DictReader(f):
+            # pick sensible fields if available
+            hosp_id = r.get('Sr_No') or r.get('SrNo') or r.get('id')
+            name = r.get('Hospital_Name') or r.get('hospital_name') or r.get('HospitalName') or r.get('Hospital')
+            locality = r.get('Town') or r.get('Location') or r.get('Subdistrict') or r.get('District') or ''
+            address = r.get('Address_Original_First_Line') or r.get('Address') or r.get('Address_Original') or ''
+            # national directory format: 'Location_Coordinates' is "lat, lon"
+            coords = parse_coordinates(r.get('Location_Coordinates') or r.get('Location_Coordinate'))
+            if coords is None and r.get('Latitude') and r.get('Longitude'):
+                coords = parse_coordinates(f"{r.get('Latitude')},{r.get('Longitude')}")
+            cleaned.append(HospitalRecord(
+                int(hosp_id) if hosp_id and str(hosp_id).isdigit() else hosp_id,
+                name,
+                _intern(locality),
+                address,
+                _intern(r.get('District') or ''),
+                _intern((r.get('Pincode') or '').strip()),
+                coords[0] if coords else None,
+                coords[1] if coords else None,
+            ))
+    return cleaned
+
+
+def parse_doctors_csv(path):
+    if not path.exists():
+        return []
+    cleaned = []
+    with path.open(newline='', encoding='utf-8') as f:
+        for r in csv.DictReader(f):
+            # keep types conservative; many fields may be strings
+            exp = r.get('experience_years')
+            cleaned.append(DoctorRecord(
+                _int_or_value(r.get('id')),
+                _int_or_value(r.get('hospital_id')),
+                _intern(r.get('name')),  # names come from small first/last-name pools
+                _intern(r.get('specialty')),
+                str(r.get('is_available')).strip() in ('1', 'True', 'true', 't', 'yes'),
+                _intern(r.get('qualification')),
+                int(exp) if exp and str(exp).isdigit() else (None if not exp else exp),
+                r.get('email'),
+                r.get('phone'),
+            ))
+    return cleaned
@@ -0,0 +1,153 @@
+# doctorsearch.py
+"""Faceted doctor search across hospitals.
+
+Every doctor gets a position (its row number in the doctors file). For each
+value of each facet (specialty, qualification, availability, experience in
+years, hospital locality, hospital id) the index keeps a bitmap -- a Python
+int with bit `pos` set for every doctor that has that value. A filter is the
+OR of the bitmaps of the accepted values of a field, and a query is the AND
+of its field filters, so a query costs a few big-int operations over
+n/64 machine words regardless of how selective it is. Facet counts are
+popcounts of (the query without that field's filter) AND (each value's
+bitmap), so selecting one specialty still shows how many doctors the other
+specialties have.
+"""
+from search import normalize
+
+FACETS = ('specialty', 'qualification', 'is_available', 'experience', 'locality')
+# facet buckets reported for experience_years (filters use exact ranges)
+EXPERIENCE_BUCKETS = (('0-4', 0, 4), ('5-9', 5, 9), ('10-19', 10, 19), ('20+', 20, None))
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+if hasattr(int, 'bit_count'):  # Python 3.10+
+    _popcount = int.bit_count
+
+
+def _key(value):
+    return normalize(value).strip()
+
+
+class DoctorFacetIndex:
+    def __init__(self, doctors, hospitals_by_id, norm_id):
+        """`doctors` are the rows from load_doctors_csv(); `hospitals_by_id`
+        and `norm_id` come from app.directory_index()."""
+        self.doctors = doctors
+        self.all = (1 << len(doctors)) - 1
+        self.bitmaps = {f: {} for f in FACETS + ('hospital_id',)}
+        self.labels = {f: {} for f in FACETS}  # normalized value -> value as displayed
+        self.localities = []  # locality shown for each doctor
+        self.hospital_of = []  # norm_id(hospital_id) of each doctor
+        for pos, d in enumerate(doctors):
+            self.hospital_of.append(norm_id(d.get('hospital_id')))
+            hosp = hospitals_by_id.get(norm_id(d.get('hospital_id'))) or {}
+            locality = hosp.get('locality') or ''
+            self.localities.append(locality)
+            exp = d.get('experience_years')
+            values = {
+                'specialty': d.get('specialty'),
+                'qualification': d.get('qualification'),
+                'is_available': bool(d.get('is_available')),
+                'experience': exp if isinstance(exp, int) else None,
+                'locality': locality,
+                'hospital_id': norm_id(d.get('hospital_id')),
+            }
+            bit = 1 << pos
+            for field, value in values.items():
+                if value is None or value == '':
+                    continue
+                key = _key(value) if isinstance(value, str) else value
+                maps = self.bitmaps[field]
+                maps[key] = maps.get(key, 0) | bit
+                if field in self.labels:
+                    self.labels[field].setdefault(key, value)
+
+    # -- filters ----------------------------------------------------------
+    def _any_of(self, field, values):
+        maps = self.bitmaps[field]
+        bits = 0
+        for v in values:
+            bits |= maps.get(_key(v) if isinstance(v, str) else v, 0)
+        return bits
+
+    def _experience_between(self, lo, hi):
+        bits = 0
+        for years, bm in self.bitmaps['experience'].items():
+            if (lo is None or years >= lo) and (hi is None or years <= hi):
+                bits |= bm
+        return bits
+
+    def _filters(self, specialty=(), qualification=(), is_available=None, min_experience=None,
+                 max_experience=None, locality=(), hospital_id=()):
+        """facet -> bitmap of the doctors its filter accepts (only given filters)."""
+        out = {}
+        if specialty:
+            out['specialty'] = self._any_of('specialty', specialty)
+        if qualification:
+            out['qualification'] = self._any_of('qualification', qualification)
+        if is_available is not None:
+            out['is_available'] = self.bitmaps['is_available'].get(bool(is_available), 0)
+        if min_experience is not None or max_experience is not None:
+            out['experience'] = self._experience_between(min_experience, max_experience)
+        if locality:
+            out['locality'] = self._any_of('locality', locality)
+        if hospital_id:
+            out['hospital_id'] = self._any_of('hospital_id', hospital_id)
+        return out
+
+    def hospital_ids(self, **filters):
+        """Set of hospital ids with at least one doctor matching the filters."""
+        bits = self._and(self._filters(**filters).values(), self.all)
+        out = set()
+        while bits:
+            low = bits & -bits
+            out.add(self.hospital_of[low.bit_length() - 1])
+            bits ^= low
+        return out
+
+    @staticmethod
+    def _and(bitmaps, start):
+        bits = start
+        for bm in bitmaps:
+            bits &= bm
+        return bits
+
+    # -- query ------------------------------------------------------------
+    def search(self, after=-1, limit=50, facet_limit=20, **filters):
+        """Return (total, [(pos, doctor)], facets, more) for doctors matching
+        every given filter, in file order, starting after position `after`;
+        `more` tells whether matches follow the page."""
+        selected = self._filters(**filters)
+        matches = self._and(selected.values(), self.all)
+        # page: walk the set bits above `after`
+        page = []
+        bits = matches >> (after + 1) << (after + 1)
+        while bits and len(page) < limit:
+            low = bits & -bits
+            pos = low.bit_length() - 1
+            page.append((pos, self.doctors[pos]))
+            bits ^= low
+        return _popcount(matches), page, self._facets(selected, facet_limit), bool(bits)
+
+    def _facets(self, selected, facet_limit=20):
+        """facet -> [{'value', 'count'}], most common first (experience: in
+        bucket order), at most `facet_limit` values per facet."""
+        facets = {}
+        for field in FACETS:
+            # counts as if this field were not filtered on
+            base = self._and((bm for f, bm in selected.items() if f != field), self.all)
+            if field == 'experience':
+                facets[field] = [{'value': label, 'count': _popcount(base & self._experience_between(lo, hi))}
+                                 for label, lo, hi in EXPERIENCE_BUCKETS]
+                continue
+            counts = []
+            for key, bm in self.bitmaps[field].items():
+                n = _popcount(base & bm)
+                if n:
+                    counts.append({'value': self.labels[field][key], 'count': n})
+            counts.sort(key=lambda c: (-c['count'], str(c['value'])))
+            facets[field] = counts[:facet_limit]
+        return facets
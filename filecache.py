@@ -0,0 +1,73 @@
+# filecache.py
+"""Parse-once cache for file-backed data.
+
+Entries are keyed on the file path and validated against the file's
+(mtime_ns, size, inode) signature on every lookup, so a file is parsed again
+only after it actually changed (appended, rewritten or replaced). Values are
+shared between callers and must be treated as read-only.
+"""
+import os
+import threading
+from pathlib import Path
+
+
+def file_signature(path):
+    """Return (mtime_ns, size, inode) for `path`, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class FileCache:
+    def __init__(self):
+        self._entries = {}  # path -> (signature, value)
+        self._stats = {}  # path -> {'hits': n, 'misses': n}
+        self._lock = threading.Lock()
+
+    def _count(self, key, field):
+        stats = self._stats.setdefault(key, {'hits': 0, 'misses': 0})
+        stats[field] += 1
+
+    def get(self, path, parse):
+        """Return `parse(path)` for the current version of `path`.
+
+        The signature is taken before parsing, so a write racing with the parse
+        is picked up by the next lookup instead of being cached as current.
+        """
+        key = str(Path(path))
+        sig = file_signature(path)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == sig:
+            with self._lock:
+                self._count(key, 'hits')
+            return entry[1]
+        with self._lock:
+            # another thread may have parsed this version while we waited
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._count(key, 'hits')
+                return entry[1]
+            self._count(key, 'misses')
+            value = parse(path)
+            # swap the whole entry so readers never see a half-built value
+            self._entries[key] = (sig, value)
+            return value
+
+    def invalidate(self, path=None):
+        """Drop the cached value for `path` (or everything when path is None)."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(Path(path)), None)
+
+    def stats(self):
+        with self._lock:
+            per_file = {k: dict(v) for k, v in self._stats.items()}
+        return {
+            'hits': sum(v['hits'] for v in per_file.values()),
+            'misses': sum(v['misses'] for v in per_file.values()),
+            'files': per_file,
+        }
@@ -0,0 +1,141 @@
+# geo.py
+"""Nearest-hospital queries over a fixed-size lat/lon grid.
+
+Hospitals with coordinates are bucketed into cells of `cell_deg` degrees.
+A k-nearest query scans the query's cell and then rings of cells around it,
+stopping once the k-th best distance found is closer than anything an
+unscanned ring could hold; a radius query scans only the cells overlapping
+the circle's bounding box. Both touch a handful of cells instead of the whole
+directory. Distances are great-circle (haversine) kilometres.
+"""
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_coordinates(value):
+    """'19.1364, 72.8296' -> (19.1364, 72.8296); None if missing or invalid."""
+    if not value:
+        return None
+    parts = str(value).replace(';', ',').split(',')
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+
+class GeoGrid:
+    def __init__(self, points, cell_deg=0.1):
+        """`points` is an iterable of (lat, lon, item)."""
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.size = 0
+        for lat, lon, item in points:
+            self.cells.setdefault(self._cell(lat, lon), []).append((lat, lon, item))
+            self.size += 1
+        rows = [c[0] for c in self.cells] or [0]
+        cols = [c[1] for c in self.cells] or [0]
+        self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _ring(self, ci, cj, r):
+        if r == 0:
+            yield ci, cj
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def _ring_bound_km(self, lat, r):
+        """Lower bound on the distance to any point outside rings 0..r."""
+        # a point there differs by more than r cells in latitude or longitude;
+        # east-west spacing shrinks with latitude, so use the poleward edge
+        edge = min(89.9, abs(lat) + (r + 1) * self.cell_deg)
+        return r * self.cell_deg * KM_PER_DEG * math.cos(math.radians(edge))
+
+    def nearest(self, lat, lon, k=10, radius_km=None, accept=None):
+        """Up to `k` (distance_km, item) pairs, nearest first, optionally
+        within `radius_km` and limited to items for which `accept(item)`."""
+        if k <= 0 or not self.cells:
+            return []
+        ci, cj = self._cell(lat, lon)
+        best = []  # max-heap of (-distance, seq, item)
+        seq = 0
+
+        def consider(plat, plon, item):
+            nonlocal seq
+            if accept is not None and not accept(item):
+                return
+            d = haversine_km(lat, lon, plat, plon)
+            if radius_km is not None and d > radius_km:
+                return
+            seq += 1
+            if len(best) < k:
+                heapq.heappush(best, (-d, seq, item))
+            elif d < -best[0][0]:
+                heapq.heapreplace(best, (-d, seq, item))
+
+        probed = 0
+        last_ring = max(ci - self._bounds[0], self._bounds[1] - ci, cj - self._bounds[2], self._bounds[3] - cj)
+        for r in range(last_ring + 1):
+            bound = self._ring_bound_km(lat, r - 1)
+            if len(best) == k and -best[0][0] <= bound:
+                break
+            if radius_km is not None and bound > radius_km:
+                break
+            probed += 8 * r or 1
+            if probed > 2 * len(self.cells):
+                # far from the data or a very selective filter: probing empty
+                # cells now costs more than checking every point once
+                best, seq = [], 0
+                for points in self.cells.values():
+                    for point in points:
+                        consider(*point)
+                break
+            for cell in self._ring(ci, cj, r):
+                for point in self.cells.get(cell, ()):
+                    consider(*point)
+        return [(-nd, item) for nd, _, item in sorted(best, key=lambda t: (-t[0], t[1]))]
+
+    def within(self, lat, lon, radius_km, accept=None):
+        """All (distance_km, item) pairs within `radius_km`, nearest first."""
+        dlat = radius_km / KM_PER_DEG
+        edge = min(89.9, abs(lat) + dlat)
+        dlon = min(180.0, radius_km / (KM_PER_DEG * math.cos(math.radians(edge))))
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            # the box spans more cells than are populated: visit those instead
+            cells = self.cells.values()
+        else:
+            cells = (self.cells.get((i, j), ()) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+        out = []
+        for points in cells:
+            for plat, plon, item in points:
+                if accept is not None and not accept(item):
+                    continue
+                d = haversine_km(lat, lon, plat, plon)
+                if d <= radius_km:
+                    out.append((d, item))
+        out.sort(key=lambda t: t[0])
+        return out
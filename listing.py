@@ -0,0 +1,88 @@
+# listing.py
+"""Helpers for the list endpoints: opaque cursors, `fields=` projection and
+streamed JSON bodies.
+
+Cursors are URL-safe base64 of a small JSON object that only the endpoint
+that issued it interprets (e.g. the sort key of the last row returned).
+Streamed bodies are produced row by row from a generator, either as one JSON
+array written in pieces or as NDJSON (one object per line), so memory and
+time to first byte do not grow with the size of the result.
+"""
+import base64
+import json
+
+
+class BadRequest(ValueError):
+    """Invalid paging / projection parameters (reported as HTTP 400)."""
+
+
+def encode_cursor(state):
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        state = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise BadRequest('invalid cursor')
+    if not isinstance(state, dict):
+        raise BadRequest('invalid cursor')
+    return state
+
+
+def cursor_int(cursor, key, minimum=0):
+    """The int `cursor[key]`, rejecting forged or stale values below `minimum`."""
+    value = cursor.get(key)
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise BadRequest('invalid cursor')
+    return value
+
+
+def parse_fields(value, allowed):
+    """`fields=a,b` -> tuple of field names (None = all). Unknown names raise."""
+    if not value:
+        return None
+    fields = tuple(f.strip() for f in value.split(',') if f.strip())
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise BadRequest(f"unknown field(s): {', '.join(unknown)}; allowed: {', '.join(allowed)}")
+    return fields
+
+
+def parse_limit(value, default, maximum):
+    """`limit=` -> int in [1, maximum] (larger values are capped); `default`
+    when absent (may be None)."""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    if limit < 1:
+        raise BadRequest('limit must be positive')
+    return min(limit, maximum)
+
+
+def project(row, fields):
+    if fields is None:
+        return row
+    return {f: row.get(f) for f in fields}
+
+
+def json_array_chunks(rows, dumps):
+    """Yield a JSON array piece by piece."""
+    yield '['
+    first = True
+    for row in rows:
+        yield dumps(row) if first else ',' + dumps(row)
+        first = False
+    yield ']\n'
+
+
+def ndjson_lines(rows, dumps):
+    for row in rows:
+        yield dumps(row) + '\n'
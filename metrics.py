@@ -0,0 +1,37 @@
+# metrics.py
+"""Small thread-safe histograms for the admin stats endpoints."""
+import threading
+
+
+class Histogram:
+    def __init__(self, bounds):
+        """`bounds` are the inclusive upper edges of the buckets, ascending;
+        values above the last edge land in the '+Inf' bucket."""
+        self.bounds = list(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        with self._lock:
+            self._counts[i] += 1
+            self._count += 1
+            self._sum += value
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f'<={b}' for b in self.bounds] + ['+Inf']
+            return {
+                'count': self._count,
+                'sum': self._sum,
+                'mean': (self._sum / self._count) if self._count else None,
+                'max': self._max,
+                'buckets': dict(zip(labels, self._counts)),
+            }
@@ -1,6 +1,6 @@
 # models.py
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -19,7 +19,7 @@ class Hospital(Base):
     __tablename__ = 'hospitals'
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
-    locality = Column(String, nullable=False)
+    locality = Column(String, nullable=False, index=True)
     address = Column(String)
     phone = Column(String)
     website = Column(String)
@@ -33,7 +33,7 @@ class Ward(Base):
 class Doctor(Base):
     __tablename__ = 'doctors'
     id = Column(Integer, primary_key=True)
-    hospital_id = Column(Integer, ForeignKey('hospitals.id'))
+    hospital_id = Column(Integer, ForeignKey('hospitals.id'), index=True)
     ward_id = Column(Integer, ForeignKey('wards.id'))
     name = Column(String, nullable=False)
     specialty = Column(String)
@@ -45,10 +45,14 @@ class Doctor(Base):
 
 class Appointment(Base):
     __tablename__ = 'appointments'
+    # history is listed per user, availability per doctor and time
+    __table_args__ = (
+        Index('ix_appointments_doctor_scheduled', 'doctor_id', 'scheduled_at'),
+    )
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     doctor_id = Column(Integer, ForeignKey('doctors.id'))
-    hospital_id = Column(Integer, ForeignKey('hospitals.id'))
+    hospital_id = Column(Integer, ForeignKey('hospitals.id'), index=True)
     scheduled_at = Column(DateTime)
     status = Column(String, default='booked')
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,156 @@
+# namegen.py
+"""Deterministic doctor names, shared by app.py and the name scripts.
+
+Names are drawn with random.Random seeded per hospital. The seed is taken
+from a SHA-256 digest of the hospital id rather than hash(), which Python
+salts per process (PYTHONHASHSEED): with hash() every gunicorn worker and
+every restart generated different placeholder doctors, so the same URL gave
+different bodies and could not be cached. With a digest seed the output
+depends only on the input, in any process, and list responses carry strong
+ETags.
+
+  python namegen.py --check [--doctors doctors.csv]
+
+generates everything (placeholders for a range of hospitals, and both
+scripts' renaming of the doctors CSV) in two fresh interpreters with
+different hash seeds and fails unless the bytes are identical.
+"""
+import csv
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+
+FIRST_NAMES = ['Priya','Amit','Suman','Neha','Karan','Pooja','Vikram','Anita','Ritu','Siddharth','Isha','Rahul','Meera','Kavita','Ramesh']
+LAST_NAMES = ['Sharma','Singh','Patel','Iyer','Nair','Bose','Kumar','Verma','Reddy','Desai','Kapoor','Das','Menon','Chopra','Gupta']
+SPECIALTIES = ['General', 'Cardiology', 'ENT', 'Orthopedics', 'Dermatology', 'Pediatrics', 'Gynecology', 'Neurology']
+QUALIFICATIONS = ['MBBS', 'MD', 'DNB', 'MS', 'DM']
+
+NUMERIC_PATTERN = re.compile(r'^dr[\.\s]*\d+[-_]?\d*$', re.IGNORECASE)
+
+
+def stable_seed(*parts):
+    """32-bit seed from the str() of `parts`, the same in every process."""
+    digest = hashlib.sha256('\x1f'.join(str(p) for p in parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big')
+
+
+def pick_name(seed, first_names=FIRST_NAMES, last_names=LAST_NAMES):
+    """(first, last) for `seed`."""
+    rnd = random.Random(seed)
+    return rnd.choice(first_names), rnd.choice(last_names)
+
+
+def make_name(seed, first_names=FIRST_NAMES, last_names=LAST_NAMES):
+    fn, ln = pick_name(seed, first_names, last_names)
+    return f"Dr. {fn} {ln}"
+
+
+def is_numeric_name(name):
+    """True for missing or placeholder names ("Dr. 1-1", "Dr 12", "guest...", "123")."""
+    if not name:
+        return True
+    n = name.strip()
+    if NUMERIC_PATTERN.match(n.replace(' ', '').lower()):
+        return True
+    if n.lower().startswith('guest') or n.isdigit():
+        return True
+    return False
+
+
+def placeholder_doctor(hospital_id, n, doctor_id):
+    """Fields of the n-th placeholder doctor of a hospital."""
+    seed = stable_seed(hospital_id) + n + 1
+    fn, ln = pick_name(seed)
+    return {
+        'id': doctor_id,
+        'hospital_id': hospital_id,
+        'name': f"Dr. {fn} {ln}",
+        'specialty': SPECIALTIES[seed % len(SPECIALTIES)],
+        'is_available': True,
+        'ward': None,
+        'qualification': QUALIFICATIONS[seed % len(QUALIFICATIONS)],
+        'experience_years': (seed % 30) + 1,
+        'email': f"{fn.lower()}.{ln.lower()}{doctor_id}@example.com",
+        'phone': f"90000{(doctor_id % 100000):05d}",
+    }
+
+
+def _hospital_key(row):
+    hid = row.get('hospital_id') or row.get('hospital') or row.get('hospitalId') or ''
+    return int(hid) if str(hid).isdigit() else str(hid)
+
+
+def rename_doctors(rows, first_names=FIRST_NAMES, last_names=LAST_NAMES):
+    """Replace numeric/placeholder names in the doctor `rows` (in place) and
+    shuffle the names within each hospital, deterministically per hospital."""
+    groups = {}
+    for r in rows:
+        groups.setdefault(_hospital_key(r), []).append(r)
+    for hid, items in groups.items():
+        base = stable_seed(hid)
+        names = [it.get('name') or '' for it in items]
+        names = [make_name(base + idx, first_names, last_names) if is_numeric_name(nm) else nm
+                 for idx, nm in enumerate(names)]
+        random.Random(base).shuffle(names)
+        for it, nm in zip(items, names):
+            it['name'] = nm
+    return rows
+
+
+# -- cross-process check ---------------------------------------------------
+def _sample(doctors_csv, hospitals):
+    """Everything this module generates, as bytes."""
+    from create_doctors_shuffled import FIRST_NAMES as shuffled_first, LAST_NAMES as shuffled_last
+    from shuffle_doctor_names import FIRST_NAMES as rename_first, LAST_NAMES as rename_last
+
+    out = {'placeholders': [placeholder_doctor(h, n, h * 16 + n) for h in range(hospitals) for n in range(10)]}
+    if doctors_csv and os.path.exists(doctors_csv):
+        for label, first, last in (('create_doctors_shuffled', shuffled_first, shuffled_last),
+                                   ('shuffle_doctor_names', rename_first, rename_last)):
+            with open(doctors_csv, newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+            out[label] = [r.get('name') for r in rename_doctors(rows, first, last)]
+    return json.dumps(out, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def check(doctors_csv='doctors.csv', hospitals=2000, hash_seeds=('1', '2')):
+    """Run _sample in fresh interpreters with different PYTHONHASHSEEDs;
+    returns the digest of each run's output."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = f'import sys, namegen; sys.stdout.buffer.write(namegen._sample({doctors_csv!r}, {hospitals}))'
+    digests = []
+    for hash_seed in hash_seeds:
+        env = dict(os.environ, PYTHONHASHSEED=hash_seed, PYTHONPATH=here)
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, check=True)
+        digests.append(hashlib.sha256(result.stdout).hexdigest())
+    return digests
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Deterministic doctor name generation')
+    parser.add_argument('--check', action='store_true',
+                        help='verify the output is byte-identical across processes')
+    parser.add_argument('--doctors', default='doctors.csv', help='doctor CSV to rename in the check')
+    parser.add_argument('--hospitals', type=int, default=2000, help='hospitals to generate placeholders for')
+    args = parser.parse_args(argv)
+    if not args.check:
+        parser.print_help()
+        return 0
+    digests = check(args.doctors, args.hospitals)
+    for seed, digest in zip(('1', '2'), digests):
+        print(f'PYTHONHASHSEED={seed}: {digest}')
+    if len(set(digests)) != 1:
+        print('FAIL: output differs between processes')
+        return 1
+    print('ok: identical output')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# passwords.py
+"""Password hashing and checking off the request threads.
+
+werkzeug's scrypt (N=32768) costs tens of milliseconds of CPU per hash or
+check and holds the GIL meanwhile, stalling every other request of the
+worker. PasswordHasher runs it in a small process pool instead:
+
+- at most `workers + queue` calls are admitted at once; the next caller
+  waits up to `admit_wait` seconds for a place and then gets PasswordsBusy
+  (a 503 with Retry-After), so a login storm is shed quickly instead of
+  piling up in front of booking requests;
+- calls the app makes for itself (`admit=False`, e.g. creating the guest
+  user while booking) skip admission but still run in the pool;
+- new hashes use the cost `profile` (a name from PROFILES or any werkzeug
+  method string); checks use the parameters stored in the hash, so
+  changing the profile does not invalidate existing passwords.
+
+The pool is started on first use in each process, so forked web workers do
+not share one. Its processes import the main module (as with any non-fork
+start method), so scripts using a hasher need an `if __name__ == '__main__'`
+guard. With workers=0 hashing runs inline (still admission-limited).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import Histogram
+
+PROFILES = {
+    'default': 'scrypt:32768:8:1',  # werkzeug's default, as in users.csv
+    'strong': 'scrypt:65536:8:1',
+    'fast': 'scrypt:16384:8:1',
+    'pbkdf2': 'pbkdf2:sha256:600000',
+}
+
+
+class PasswordsBusy(Exception):
+    """Too many password hashes / checks already pending."""
+
+    retry_after = 1
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _check(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def _pool_context():
+    # forkserver children start clean: none of the web worker's threads,
+    # locks or loaded directories are copied into them. By default the fork
+    # server would import __main__ (app.py) first; it only needs this module.
+    try:
+        ctx = multiprocessing.get_context('forkserver')
+    except ValueError:  # Windows
+        return None
+    ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, queue=16, admit_wait=0.0, profile='default'):
+        self.workers = workers
+        self.queue = queue
+        self.admit_wait = admit_wait
+        self.method = PROFILES.get(profile, profile)
+        self._slots = threading.BoundedSemaphore(max(1, workers) + queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._counts = {'hashed': 0, 'checked': 0, 'rejected': 0, 'in_flight': 0}
+        self._latency = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+
+    def hash(self, password, admit=True):
+        """werkzeug-format hash of `password` with the configured profile."""
+        result = self._run(_hash, (password, self.method), admit)
+        self._count('hashed')
+        return result
+
+    def check(self, pwhash, password, admit=True):
+        if not pwhash or password is None:
+            return False
+        result = self._run(_check, (pwhash, password), admit)
+        self._count('checked')
+        return result
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return dict(counts, workers=self.workers, queue=self.queue, method=self.method,
+                    latency_ms=self._latency.snapshot())
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pool_pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # -- internals --------------------------------------------------------
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def _executor(self):
+        with self._lock:
+            # a pool inherited through fork belongs to the parent
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=_pool_context())
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _admit(self):
+        if self.admit_wait > 0:
+            return self._slots.acquire(timeout=self.admit_wait)
+        return self._slots.acquire(blocking=False)
+
+    def _run(self, fn, args, admit):
+        if admit and not self._admit():
+            self._count('rejected')
+            raise PasswordsBusy('too many password checks in progress')
+        self._count('in_flight')
+        t0 = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            pool = self._executor()
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # a pool process died (e.g. killed for memory): replace the pool once
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                return self._executor().submit(fn, *args).result()
+        finally:
+            self._latency.observe((time.perf_counter() - t0) * 1000)
+            self._count('in_flight', -1)
+            if admit:
+                self._slots.release()
@@ -0,0 +1,165 @@
+# search.py
+"""Ranked hospital search over an in-memory inverted index.
+
+Names, towns, districts and addresses are normalized (lowercase, accents
+stripped) and split into tokens. The index maps:
+
+- token -> {hospital position: field weight} (postings)
+- prefix -> [tokens] for every token prefix up to PREFIX_MAX characters,
+  so a partially typed word is a dict lookup
+- one-character deletions of each token -> [tokens], so a query word with
+  one typo (missing, extra, wrong or swapped letter) still finds its token
+
+A query costs a few dict lookups per query word plus work proportional to
+the postings it touches; the directory is never scanned. Every query word
+must match (exactly, as a prefix or fuzzily); hospitals are ranked by the
+sum over query words of match quality x field weight.
+"""
+import heapq
+import itertools
+import re
+import unicodedata
+
+PREFIX_MIN = 1
+PREFIX_MAX = 12
+FUZZY_MIN_LEN = 4  # shorter words are too ambiguous for typo matching
+
+# how much a match in each field counts
+FIELD_WEIGHTS = {'name': 3.0, 'locality': 2.0, 'district': 1.5, 'address': 1.0}
+# how much each kind of match counts
+EXACT, PREFIX, FUZZY = 1.0, 0.6, 0.4
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _deletes(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a, b):
+    """Damerau-Levenshtein distance <= 1."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb:
+        a, b = b, a
+    # b is one longer: skipping one character of b must give a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class HospitalSearchIndex:
+    def __init__(self, hospitals):
+        """`hospitals` are the rows from load_hospitals_csv()."""
+        self.hospitals = hospitals
+        self.postings = {}
+        self.prefixes = {}
+        self.deletes = {}
+        self.sort_names = [normalize(h.get('name')) for h in hospitals]  # tie-break
+        for pos, h in enumerate(hospitals):
+            fields = {
+                'name': h.get('name'),
+                'locality': h.get('locality'),
+                'district': h.get('district'),
+                'address': h.get('address'),
+            }
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for tok in tokenize(text):
+                    docs = self.postings.setdefault(tok, {})
+                    if docs.get(pos, 0) < weight:
+                        docs[pos] = weight
+        for tok in self.postings:
+            for n in range(PREFIX_MIN, min(len(tok), PREFIX_MAX) + 1):
+                self.prefixes.setdefault(tok[:n], []).append(tok)
+            if len(tok) >= FUZZY_MIN_LEN:
+                for d in _deletes(tok):
+                    self.deletes.setdefault(d, []).append(tok)
+
+    def _candidates(self, word):
+        """token -> match quality for one query word."""
+        out = {}
+        if len(word) <= PREFIX_MAX:
+            for tok in self.prefixes.get(word, ()):
+                out[tok] = PREFIX
+        else:
+            # longer than the indexed prefixes: check the tokens sharing them
+            for tok in self.prefixes.get(word[:PREFIX_MAX], ()):
+                if tok.startswith(word):
+                    out[tok] = PREFIX
+        if word in self.postings:
+            out[word] = EXACT
+        if len(word) >= FUZZY_MIN_LEN:
+            word_deletes = _deletes(word)
+            # extra letter in the query: the token is one of its deletions
+            for d in word_deletes:
+                if d in self.postings and d not in out:
+                    out[d] = FUZZY
+            # missing, wrong or swapped letter: shared deletion keys
+            seen = set()
+            for key in word_deletes | {word}:
+                for tok in self.deletes.get(key, ()):
+                    if tok not in out and tok not in seen:
+                        seen.add(tok)
+                        if _within_one_edit(word, tok):
+                            out[tok] = FUZZY
+        return out
+
+    def _score(self, words):
+        scores = None
+        for word in words:
+            word_scores = {}
+            for tok, quality in self._candidates(word).items():
+                for pos, weight in self.postings[tok].items():
+                    s = quality * weight
+                    if s > word_scores.get(pos, 0):
+                        word_scores[pos] = s
+            if scores is None:
+                scores = word_scores
+            else:
+                # every query word must match: intersect, smaller side first
+                if len(word_scores) < len(scores):
+                    scores, word_scores = word_scores, scores
+                scores = {pos: s + word_scores[pos] for pos, s in scores.items() if pos in word_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def search(self, query, limit=50, offset=0):
+        """Return (total, rows) for the ranked matches of `query`, best first,
+        rows[offset:offset + limit]. With `limit=None` rows is an iterator
+        over all matches from `offset` on (for streaming)."""
+        if offset < 0 or (limit is not None and limit < 1):
+            # a negative slice start would page from the end of the list
+            raise ValueError(f'invalid page: offset={offset}, limit={limit}')
+        words = tokenize(query)
+        if not words:
+            if limit is None:
+                return len(self.hospitals), itertools.islice(self.hospitals, offset, None)
+            return len(self.hospitals), self.hospitals[offset:offset + limit]
+        scores = self._score(words)
+        key = lambda item: (-item[1], self.sort_names[item[0]], item[0])
+        if limit is None:
+            ranked = sorted(scores.items(), key=key)
+            return len(scores), (self.hospitals[pos] for pos, _ in itertools.islice(ranked, offset, None))
+        # only the top offset + limit are ordered: O(matches * log(page end))
+        top = heapq.nsmallest(offset + limit, scores.items(), key=key)
+        return len(scores), [self.hospitals[pos] for pos, _ in top[offset:]]
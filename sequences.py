@@ -0,0 +1,212 @@
+# sequences.py
+"""Persistent id sequences for the CSV tables.
+
+Each table has a small `<table>.seq` file holding the last id handed out. It
+is seeded once from the table's max existing id and afterwards only that
+file is read and rewritten (under an fcntl lock, so gunicorn workers never
+hand out the same id). With `block_size` > 1 a process reserves a block of ids
+at a time and serves them from memory; ids stay unique, but ids reserved by a
+process that exits unused are skipped.
+
+Renumber the duplicate ids already present in the CSV files (run while the
+app is stopped; later duplicates get fresh ids, the first occurrence keeps
+its id). The change log, appointments.changes.csv, is folded in first.
+Appointments of a user id that several users shared are listed in
+appointments.owners-to-check.csv, since their owner cannot be told:
+
+  python sequences.py repair
+"""
+import csv
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+def lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def max_numeric_id(rows, key='id'):
+    ids = [int(r.get(key)) for r in rows if r.get(key) is not None and str(r.get(key)).isdigit()]
+    return max(ids) if ids else 0
+
+
+class Sequence:
+    def __init__(self, path, seed, block_size=1):
+        """`seed()` returns the current max id; it is only called while the
+        sequence file is missing or empty."""
+        self.path = Path(path)
+        self.seed = seed
+        self.block_size = max(1, int(block_size))
+        self._lock = threading.Lock()
+        self._next = None
+        self._limit = None
+
+    def next_id(self):
+        return self.next_ids(1)
+
+    def next_ids(self, count):
+        """Reserve `count` consecutive ids and return the first; one file
+        update at most, however many ids are taken."""
+        with self._lock:
+            if self._next is None or self._next + count - 1 > self._limit:
+                if count > self.block_size:
+                    # too big for a block: take exactly this range, keep the block
+                    return self._reserve(count)
+                self._next = self._reserve(self.block_size)
+                self._limit = self._next + self.block_size - 1
+            value = self._next
+            self._next += count
+            return value
+
+    def _update(self, fn):
+        """Apply `fn(last) -> new_last` to the on-disk value under the file lock."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+', encoding='utf-8') as f:
+            lock_file(f)
+            try:
+                text = f.read().strip()
+                last = int(text) if text.isdigit() else int(self.seed() or 0)
+                new_last = fn(last)
+                f.seek(0)
+                f.truncate()
+                f.write(f'{new_last}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                unlock_file(f)
+        return last
+
+    def _reserve(self, count):
+        return self._update(lambda last: last + count) + 1
+
+    def reseed(self, at_least):
+        """Make sure the next id handed out is greater than `at_least`."""
+        with self._lock:
+            self._update(lambda last: max(last, at_least))
+            self._next = self._limit = None
+
+
+def renumber_duplicate_ids(path, columns, header_detect):
+    """Give every repeated id in the CSV at `path` a fresh id (max + 1, ...).
+
+    The first row with a given id keeps it. The original file is kept as a
+    timestamped backup. Returns (renumbered, max_id), `renumbered` being the
+    (old id, new id) of every row that got a fresh id.
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0, 0
+    with path.open(newline='', encoding='utf-8') as f:
+        first = f.readline()
+        f.seek(0)
+        rows = [r for r in csv.reader(f) if r]
+    header = rows.pop(0) if rows and header_detect(first) else None
+    id_col = header.index('id') if header and 'id' in header else columns.index('id')
+    max_id = max((int(r[id_col]) for r in rows if len(r) > id_col and r[id_col].isdigit()), default=0)
+    seen = set()
+    renumbered = []
+    for r in rows:
+        while len(r) <= id_col:
+            r.append('')
+        if r[id_col] in seen or not r[id_col].isdigit():
+            max_id += 1
+            renumbered.append((r[id_col], str(max_id)))
+            r[id_col] = str(max_id)
+        seen.add(r[id_col])
+    if renumbered:
+        ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        shutil.copy2(path, path.with_name(f'{path.stem}.bak.{ts}{path.suffix}'))
+        tmp_path = path.with_name(path.name + '.tmp')
+        with tmp_path.open('w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if header:
+                writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+    return renumbered, max_id
+
+
+def ambiguous_owners(users_path, appts_path, renumbered_users):
+    """Appointments whose owner repair cannot tell: their user_id was shared
+    by several users, and it stays with the first of them. Returns one dict
+    per appointment, with `candidates` ("username:id ...") to pick from."""
+    shared = {}
+    for old, new in renumbered_users:
+        if old.isdigit():
+            shared.setdefault(old, [old]).append(new)
+    if not shared:
+        return []
+    with Path(users_path).open(newline='', encoding='utf-8') as f:
+        usernames = {u.get('id'): u.get('username') for u in csv.DictReader(f)}
+    out = []
+    with Path(appts_path).open(newline='', encoding='utf-8') as f:
+        for a in csv.DictReader(f):
+            ids = shared.get(a.get('user_id'))
+            if ids:
+                out.append({'appointment_id': a.get('id'), 'user_id': a.get('user_id'),
+                            'scheduled_at': a.get('scheduled_at'), 'status': a.get('status'),
+                            'candidates': ' '.join(f'{usernames.get(i)}:{i}' for i in ids)})
+    return out
+
+
+def main(argv=None):
+    import argparse
+
+    from backups import BackupManager
+    from storage import USERS_HEADER, APPTS_HEADER, CsvStorage
+
+    parser = argparse.ArgumentParser(description='Id sequence utilities')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_repair = sub.add_parser('repair', help='renumber duplicate ids and reseed the sequences')
+    p_repair.add_argument('--users', default='users.csv')
+    p_repair.add_argument('--appointments', default='appointments.csv')
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'repair':
+        tables = [
+            (args.users, USERS_HEADER, lambda line: 'username' in line.lower() or 'id' in line.lower()),
+            (args.appointments, APPTS_HEADER, lambda line: 'user_id' in line.lower() or 'id' in line.lower()),
+        ]
+        storage = CsvStorage(args.users, args.appointments, backups=BackupManager.from_env(args.appointments))
+        # the app's write locks keep workers that are still running out.
+        # Delete records in appointments.changes.csv are keyed by
+        # (appointment_id, user_id), so fold the log in first: a renumbered
+        # row would no longer match its record and come back.
+        with storage.users_writer.exclusive(), storage.appts_writer.exclusive(), storage.changes_writer.exclusive():
+            folded = storage.compact()
+            if folded:
+                print(f'{storage.changes_csv}: folded {folded} change records into {args.appointments}')
+            renumbered = {}
+            for path, columns, header_detect in tables:
+                renumbered[path], max_id = renumber_duplicate_ids(path, columns, header_detect)
+                Sequence(Path(path).with_suffix('.seq'), seed=lambda: 0).reseed(max_id)
+                print(f'{path}: renumbered {len(renumbered[path])} rows, next id {max_id + 1}')
+            # user_id references cannot be rewritten: an appointment of a
+            # shared id may belong to any of the users that had it
+            unclear = ambiguous_owners(args.users, args.appointments, renumbered[args.users])
+        if unclear:
+            report = Path(args.appointments).with_name(f'{Path(args.appointments).stem}.owners-to-check.csv')
+            with report.open('w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(unclear[0]))
+                writer.writeheader()
+                writer.writerows(unclear)
+            print(f'{report}: {len(unclear)} appointments still point at the first user with a shared id; '
+                  'check each against its candidates and correct its user_id')
+
+
+if __name__ == '__main__':
+    main()
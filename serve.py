@@ -0,0 +1,80 @@
+# serve.py
+"""Production server: gunicorn with preload-and-fork.
+
+The master imports the app, runs `app.warm_up()` (directories parsed or
+mapped, every index built, storage caches loaded) and then `gc.freeze()`s
+everything allocated so far before forking the workers. Frozen objects are
+never visited by the cyclic garbage collector again, so the collector does
+not write to their headers and the pages they live on stay shared
+copy-on-write between all workers instead of being copied into each one.
+Workers are ready (`/readyz` returns 200) as soon as they are forked.
+
+  python app.py                                  # uses this module
+  gunicorn -c serve.py app:app                   # same, via the gunicorn CLI
+
+Settings: BIND (default 127.0.0.1:5000), WEB_CONCURRENCY (workers, default
+2 x CPUs + 1), GUNICORN_TIMEOUT (seconds, default 30).
+"""
+import gc
+import multiprocessing
+import os
+import sys
+
+# gunicorn config (read when this file is passed with -c)
+bind = os.environ.get('BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '0')) or multiprocessing.cpu_count() * 2 + 1
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+preload_app = True
+
+
+def _app_module():
+    # the module gunicorn preloaded (or that app.py registered when run directly)
+    return sys.modules.get('app') or __import__('app')
+
+
+def when_ready(server):
+    """Master, after the app is loaded and before any worker is forked."""
+    module = _app_module()
+    state = module.warm_up()
+    server.log.info('warm-up done in %s ms (%s hospitals, %s doctors)',
+                    state.get('warmup_ms'), state.get('hospitals'), state.get('doctors'))
+    # move everything allocated so far out of the collector's reach
+    gc.collect()
+    gc.freeze()
+    server.log.info('gc.freeze(): %d objects frozen', gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    _app_module().STORAGE.after_fork()
+
+
+def main(module, bind=None, workers=None):
+    """Run `module.app` under gunicorn with the settings above."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:  # e.g. on Windows, where gunicorn does not run
+        print('Warning: gunicorn is not available; falling back to the Flask development server')
+        module.warm_up()
+        module.app.run()
+        return
+    # hooks look the module up by name; make `python app.py` share this one
+    sys.modules.setdefault('app', module)
+
+    options = {
+        'bind': bind or globals()['bind'],
+        'workers': workers or globals()['workers'],
+        'timeout': timeout,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return module.app
+
+    Server().run()
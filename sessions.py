@@ -0,0 +1,77 @@
+# sessions.py
+"""Signed, stateless session tokens.
+
+/api/login issues a token holding the user's id and username, timestamped
+and signed with the app secret (itsdangerous), so any worker can check it
+without a session store. Checking one is an HMAC plus one user lookup; the
+result is kept in an LRU keyed by the token, so later requests with the
+same token are a dict hit until the token expires.
+
+Tokens cannot be revoked individually: logging out drops the cookie (and
+this worker's cache entry); changing APP_SECRET invalidates all of them.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class SessionTokens:
+    def __init__(self, secret, load_user, max_age=7 * 24 * 3600, cache_size=10000):
+        """`load_user(user_id)` returns the user row or None (a token for a
+        user that no longer exists is rejected)."""
+        self.serializer = URLSafeTimedSerializer(secret, salt='session-token')
+        self.load_user = load_user
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # token -> (session, expires_at)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def issue(self, user):
+        return self.serializer.dumps({'uid': user.get('id'), 'u': user.get('username')})
+
+    def verify(self, token):
+        """The session {'user_id', 'username', 'user', 'expires_at'} for a
+        valid, unexpired token, else None."""
+        if not token:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(token)
+            if entry is not None:
+                if entry[1] > now:
+                    self._cache.move_to_end(token)
+                    self._hits += 1
+                    return entry[0]
+                del self._cache[token]
+            self._misses += 1
+        try:
+            data, signed_at = self.serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+        except BadSignature:  # also covers expired tokens
+            return None
+        if not isinstance(data, dict):
+            return None
+        user = self.load_user(data.get('uid'))
+        if not user or user.get('username') != data.get('u'):
+            return None
+        expires_at = signed_at.timestamp() + self.max_age
+        session = {'user_id': user.get('id'), 'username': user.get('username'), 'user': user,
+                   'expires_at': expires_at}
+        with self._lock:
+            self._cache[token] = (session, expires_at)
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return session
+
+    def forget(self, token):
+        with self._lock:
+            self._cache.pop(token, None)
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._cache), 'hits': self._hits, 'misses': self._misses,
+                    'max_age_s': self.max_age}
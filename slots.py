@@ -0,0 +1,133 @@
+# slots.py
+"""Per-doctor slot calendar.
+
+Time is cut into fixed slots (`slot_minutes`, default 30) inside working
+hours. A booking occupies the slot its `scheduled_at` falls into. For every
+doctor the calendar keeps a sorted list of booked slot keys (minutes since
+1970-01-01, floored to the slot), so conflict checks are a bisect, O(log n),
+and free slots in a range are found by walking the candidate slots against
+the booked keys in that range.
+
+The CSV storage engine keeps one calendar in sync with appointments.csv and
+its change log; the SQLite engine only uses the slot arithmetic and answers
+the same questions from its (doctor_id, scheduled_at) index.
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class SlotTaken(Exception):
+    """The doctor already has a booking in the requested slot."""
+
+
+def _norm(doctor_id):
+    try:
+        return int(doctor_id) if doctor_id is not None and str(doctor_id).isdigit() else doctor_id
+    except Exception:
+        return doctor_id
+
+
+def parse_when(value):
+    """ISO string / datetime -> naive datetime in the server's local time, or
+    None. Values with an offset are converted, so 10:00Z and 15:30+05:30 are
+    the same slot; naive values are taken as local time already."""
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class SlotCalendar:
+    def __init__(self, slot_minutes=30, day_start=9 * 60, day_end=17 * 60):
+        """`day_start` / `day_end` are minutes after midnight."""
+        self.slot_minutes = slot_minutes
+        self.day_start = day_start
+        self.day_end = day_end
+        self._booked = {}  # doctor_id -> sorted [slot_key]
+        self._lock = threading.Lock()
+
+    def slot_key(self, when):
+        dt = parse_when(when)
+        if dt is None:
+            return None
+        minutes = int((dt - _EPOCH).total_seconds() // 60)
+        return minutes - minutes % self.slot_minutes
+
+    def slot_start(self, key):
+        return _EPOCH + timedelta(minutes=key)
+
+    def is_slot_start(self, when):
+        """True if `when` is exactly the start of a slot inside working hours."""
+        dt = parse_when(when)
+        if dt is None:
+            return False
+        key = self.slot_key(dt)
+        if self.slot_start(key) != dt:
+            return False
+        minute_of_day = key % (24 * 60)
+        return self.day_start <= minute_of_day and minute_of_day + self.slot_minutes <= self.day_end
+
+    def clear(self):
+        with self._lock:
+            self._booked = {}
+
+    def add(self, doctor_id, key):
+        if key is None:
+            return
+        with self._lock:
+            insort(self._booked.setdefault(_norm(doctor_id), []), key)
+
+    def remove(self, doctor_id, key):
+        if key is None:
+            return
+        with self._lock:
+            keys = self._booked.get(_norm(doctor_id))
+            if keys:
+                i = bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    del keys[i]
+
+    def is_free(self, doctor_id, key):
+        keys = self._booked.get(_norm(doctor_id), ())
+        i = bisect_left(keys, key)
+        return i == len(keys) or keys[i] != key
+
+    def booked_between(self, doctor_id, start_key, end_key):
+        """Sorted booked keys with start_key <= key < end_key."""
+        keys = self._booked.get(_norm(doctor_id), ())
+        return keys[bisect_left(keys, start_key):bisect_left(keys, end_key)]
+
+    def free_slots(self, booked, start, end, limit=None):
+        """Free slot start times in [start, end) given the sorted `booked`
+        keys for that range (from `booked_between` or a storage query)."""
+        key = self.slot_key(start)
+        if self.slot_start(key) < parse_when(start):
+            key += self.slot_minutes
+        end_key = self.slot_key(end)
+        out = []
+        i = 0
+        while key < end_key:
+            minute_of_day = key % (24 * 60)
+            if minute_of_day < self.day_start:
+                key += self.day_start - minute_of_day
+                continue
+            if minute_of_day + self.slot_minutes > self.day_end:
+                # jump to the next day's opening
+                key += 24 * 60 - minute_of_day + self.day_start
+                continue
+            i = bisect_left(booked, key, i)
+            if i == len(booked) or booked[i] != key:
+                out.append(self.slot_start(key))
+                if limit and len(out) >= limit:
+                    break
+            key += self.slot_minutes
+        return out
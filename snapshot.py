@@ -0,0 +1,318 @@
+# snapshot.py
+"""Binary, memory-mapped snapshots of the directory CSVs.
+
+Parsing hospital_directory.csv / doctors.csv is the main startup cost of a
+worker. A snapshot is the parsed result (the records from directory.py)
+written once to `<csv>.snap` in a column layout that workers mmap instead of
+parsing: opening one is a header read, pages are loaded on first touch, and
+all workers on a host share the same page-cache copy.
+
+Layout (little-endian, sections 8-byte aligned):
+
+  header   MAGIC, FORMAT_VERSION, metadata length
+  metadata JSON: record kind, row count, the source CSV's (size, mtime_ns),
+           section offsets, max integer id
+  columns  per record field: one tag byte per row (None/int/str/float/bool)
+           and one 8-byte payload per row (the int, the float's bits, the
+           bool, or an index into the string table)
+  strings  deduplicated UTF-8 strings: int64 offsets + one blob
+  indexes  for `id` (and doctors' `hospital_id`): the integer keys sorted,
+           with the row positions in that order, for binary search
+
+A snapshot records the signature of the CSV it was built from; when the CSV
+changes (size or mtime), the next load rebuilds it under a lock file, so
+only one process does the work. Rows are materialized as records on access.
+
+  python snapshot.py build     # prebuild, e.g. as a deploy step
+"""
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+from directory import DoctorRecord, HospitalRecord, parse_doctors_csv, parse_hospitals_csv
+from sequences import lock_file, unlock_file
+
+MAGIC = b'DIRSNAP\0'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sII')  # magic, version, metadata length
+
+# tags of the per-cell type byte
+_NONE, _INT, _STR, _FLOAT, _BOOL = range(5)
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+KINDS = {
+    'hospitals': (HospitalRecord, parse_hospitals_csv, ('id',)),
+    'doctors': (DoctorRecord, parse_doctors_csv, ('id', 'hospital_id')),
+}
+
+
+def snapshot_path(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + '.snap')
+
+
+def source_signature(csv_path):
+    st = os.stat(csv_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _pad(n):
+    return (n + 7) & ~7
+
+
+# -- building -------------------------------------------------------------
+def build_snapshot(csv_path, kind, out_path=None):
+    """Parse `csv_path` and write its snapshot; returns the snapshot path."""
+    record_cls, parse, indexed = KINDS[kind]
+    csv_path = Path(csv_path)
+    out_path = Path(out_path) if out_path else snapshot_path(csv_path)
+    sig = source_signature(csv_path)  # taken first: a racing write forces a rebuild
+    rows = parse(csv_path)
+    columns = record_cls.__slots__  # also the constructor's argument order
+    n = len(rows)
+
+    strings, string_ids = [], {}
+    sections = []  # (name, bytes)
+    for col in columns:
+        tags = bytearray(n)
+        payload = [0] * n
+        for i, rec in enumerate(rows):
+            v = getattr(rec, col)
+            if v is None:
+                continue
+            if isinstance(v, bool):
+                tags[i], payload[i] = _BOOL, int(v)
+            elif isinstance(v, int) and _INT64_MIN <= v <= _INT64_MAX:
+                tags[i], payload[i] = _INT, v
+            elif isinstance(v, float):
+                tags[i], payload[i] = _FLOAT, struct.unpack('<q', struct.pack('<d', v))[0]
+            else:
+                s = str(v)
+                sid = string_ids.get(s)
+                if sid is None:
+                    sid = string_ids[s] = len(strings)
+                    strings.append(s)
+                tags[i], payload[i] = _STR, sid
+        sections.append((f'tags:{col}', bytes(tags)))
+        sections.append((f'data:{col}', struct.pack(f'<{n}q', *payload)))
+
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = [0]
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    sections.append(('str:offsets', struct.pack(f'<{len(offsets)}q', *offsets)))
+    sections.append(('str:blob', b''.join(encoded)))
+
+    max_id = 0
+    unindexed = {}  # col -> rows whose key is set but not an int (not in the index)
+    for col in indexed:
+        keyed = []
+        unindexed[col] = 0
+        for i, rec in enumerate(rows):
+            v = getattr(rec, col)
+            if isinstance(v, int) and not isinstance(v, bool) and _INT64_MIN <= v <= _INT64_MAX:
+                keyed.append((v, i))
+            elif v not in (None, ''):
+                unindexed[col] += 1
+        keyed.sort()
+        sections.append((f'keys:{col}', struct.pack(f'<{len(keyed)}q', *(k for k, _ in keyed))))
+        sections.append((f'rows:{col}', struct.pack(f'<{len(keyed)}q', *(i for _, i in keyed))))
+        if col == 'id' and keyed:
+            max_id = max(0, keyed[-1][0])
+
+    # section offsets are relative to the (8-byte aligned) end of the metadata
+    layout, pos = {}, 0
+    for name, data in sections:
+        layout[name] = [pos, len(data)]
+        pos = _pad(pos + len(data))
+    meta = {'kind': kind, 'rows': n, 'columns': list(columns), 'indexed': list(indexed),
+            'source': sig, 'max_id': max_id, 'unindexed': unindexed, 'strings': len(strings), 'sections': layout}
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    base = _pad(_HEADER.size + len(meta_bytes))
+
+    tmp = out_path.with_name(out_path.name + f'.{os.getpid()}.tmp')
+    with tmp.open('wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta_bytes)))
+        f.write(meta_bytes)
+        f.write(b'\0' * (base - _HEADER.size - len(meta_bytes)))
+        for name, data in sections:
+            f.write(data)
+            f.write(b'\0' * (_pad(len(data)) - len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, out_path)
+    return out_path
+
+
+# -- reading --------------------------------------------------------------
+class SnapshotIndex:
+    """Read-only mapping view over a sorted key index of a SnapshotTable.
+    `unique` views return the first row with the key (like dict.setdefault
+    while building), others return the list of rows in file order."""
+
+    def __init__(self, table, col, unique):
+        self.table = table
+        self.keys = table._section(f'keys:{col}', 'q')
+        self.rows = table._section(f'rows:{col}', 'q')
+        self.unique = unique
+
+    def _range(self, key):
+        if not isinstance(key, int) or isinstance(key, bool):
+            return 0, 0
+        lo = bisect_left(self.keys, key)
+        return lo, bisect_right(self.keys, key, lo)
+
+    def get(self, key, default=None):
+        lo, hi = self._range(key)
+        if lo == hi:
+            return default
+        if self.unique:
+            return self.table[self.rows[lo]]
+        return [self.table[self.rows[i]] for i in range(lo, hi)]
+
+    def __contains__(self, key):
+        lo, hi = self._range(key)
+        return lo != hi
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+
+_MISSING = object()
+
+
+class SnapshotTable:
+    """A sequence of records backed by an mmap'd snapshot file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with self.path.open('rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path}: not a version {FORMAT_VERSION} directory snapshot')
+        self.meta = json.loads(bytes(self._mm[_HEADER.size:_HEADER.size + meta_len]).decode('utf-8'))
+        self._base = _pad(_HEADER.size + meta_len)
+        self._view = memoryview(self._mm)
+        self.record_cls = KINDS[self.meta['kind']][0]
+        self.columns = self.meta['columns']
+        self._n = self.meta['rows']
+        self._tags = [self._section(f'tags:{c}', 'B') for c in self.columns]
+        self._ints = [self._section(f'data:{c}', 'q') for c in self.columns]
+        self._floats = [self._section(f'data:{c}', 'd') for c in self.columns]
+        self._str_offsets = self._section('str:offsets', 'q')
+        self._str_blob = self._section('str:blob', 'B')
+        self._strings = {}  # decoded on first use, shared by all rows
+
+    def _section(self, name, fmt):
+        start, length = self.meta['sections'][name]
+        start += self._base
+        return self._view[start:start + length].cast(fmt)
+
+    def _string(self, sid):
+        s = self._strings.get(sid)
+        if s is None:
+            s = bytes(self._str_blob[self._str_offsets[sid]:self._str_offsets[sid + 1]]).decode('utf-8')
+            s = self._strings.setdefault(sid, s)
+        return s
+
+    def _value(self, col, i):
+        tag = self._tags[col][i]
+        if tag == _INT:
+            return self._ints[col][i]
+        if tag == _STR:
+            return self._string(self._ints[col][i])
+        if tag == _BOOL:
+            return bool(self._ints[col][i])
+        if tag == _FLOAT:
+            return self._floats[col][i]
+        return None
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self.record_cls(*[self._value(c, i) for c in range(len(self.columns))])
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def __bool__(self):
+        return self._n > 0
+
+    def index(self, col, unique=False):
+        """Mapping view keyed on `col`, or None if the column has keys that
+        are not integers (the caller then builds a dict itself)."""
+        if self.meta['unindexed'].get(col, 1):
+            return None
+        return SnapshotIndex(self, col, unique)
+
+
+def load_snapshot(csv_path, kind):
+    """Return a SnapshotTable for the current version of `csv_path`,
+    (re)building the snapshot first if it is missing, stale or from another
+    format version. Returns None if the CSV does not exist."""
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        return None
+    snap = snapshot_path(csv_path)
+    table = _open_current(snap, csv_path)
+    if table is not None:
+        return table
+    lock_path = snap.with_name(snap.name + '.lock')
+    with open(lock_path, 'a') as lf:
+        lock_file(lf)
+        try:
+            # another process may have rebuilt it while we waited
+            table = _open_current(snap, csv_path)
+            if table is None:
+                build_snapshot(csv_path, kind, snap)
+                table = SnapshotTable(snap)
+        finally:
+            unlock_file(lf)
+    return table
+
+
+def _open_current(snap, csv_path):
+    try:
+        table = SnapshotTable(snap)
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    if table.meta.get('source') != source_signature(csv_path):
+        return None
+    return table
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build binary snapshots of the directory CSVs')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_build = sub.add_parser('build', help='(re)build the snapshots next to the CSVs')
+    p_build.add_argument('--hospitals', default='hospital_directory.csv')
+    p_build.add_argument('--doctors', nargs='*', default=['doctors.csv', 'doctors_shuffled.csv'])
+    args = parser.parse_args(argv)
+
+    for path, kind in [(args.hospitals, 'hospitals')] + [(d, 'doctors') for d in args.doctors]:
+        if not Path(path).exists():
+            continue
+        out = build_snapshot(path, kind)
+        table = SnapshotTable(out)
+        print(f'{out}: {len(table)} rows, {table.meta["strings"]} strings, {out.stat().st_size} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1123 @@
+# storage.py
+"""Storage engines for users and appointments.
+
+`CsvStorage` keeps the flat-file layout the app has always used (users.csv and
+appointments.csv). `SqliteStorage` keeps the same rows in a SQLite database in
+WAL mode, using the SQLAlchemy models from models.py. app.py only talks to the
+engine returned by `make_storage()`, so switching backends is a config change.
+
+Both engines return plain dicts shaped like the CSV rows, so route handlers do
+not need to know which one is active.
+
+One-shot import of the CSV files into SQLite (safe to re-run; rows that were
+already imported are skipped, so it can be run again right before switching):
+
+  python storage.py import-csv --db hospital.db
+"""
+import csv
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from backups import BackupManager, change_log_path
+from counters import BookingCounters
+from csvtail import CsvTail
+from sequences import Sequence, max_numeric_id
+from slots import SlotCalendar, SlotTaken, parse_when
+from writecoord import WriteCoordinator
+
+USERS_HEADER = ['id', 'username', 'password_hash', 'full_name', 'phone']
+APPTS_HEADER = ['id', 'user_id', 'doctor_id', 'hospital_id', 'scheduled_at', 'status', 'created_at']
+# appointments.changes.csv: status changes / deletions merged over appointments.csv on read
+CHANGES_HEADER = ['appointment_id', 'user_id', 'op', 'status', 'at']
+
+
+def ensure_csv(path: Path, headers):
+    if not path.exists():
+        with path.open('w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+
+
+def _to_int(value):
+    """Return `value` as int when it is a digit string/int, otherwise unchanged."""
+    try:
+        return int(value) if value is not None and str(value).isdigit() else value
+    except Exception:
+        return value
+
+
+def _same_id(a, b):
+    return a == b or str(a) == str(b)
+
+
+def _candidates(item):
+    """Doctors an appointment item may be booked with, in order of preference."""
+    return list(item.get('doctor_ids') or [item['doctor_id']])
+
+
+def _slot_taken_error(item):
+    doctors = _candidates(item)
+    if len(doctors) == 1:
+        return SlotTaken(f"doctor {doctors[0]} is already booked at {item['scheduled_at']}")
+    return SlotTaken(f"no doctor at hospital {item['hospital_id']} is free at {item['scheduled_at']}")
+
+
+class Storage:
+    """Interface shared by all storage engines.
+
+    The query helpers below are implemented on top of `load_appointments()`;
+    engines with real indexes override them.
+    """
+
+    name = 'base'
+
+    # users
+    def load_users(self):
+        raise NotImplementedError
+
+    def create_user(self, username, password_hash, full_name='', phone=''):
+        raise NotImplementedError
+
+    def find_user_by_username(self, username):
+        for u in self.load_users():
+            if u.get('username') == username:
+                return u
+        return None
+
+    def find_user_by_id(self, user_id):
+        for u in self.load_users():
+            if _same_id(u.get('id'), user_id):
+                return u
+        return None
+
+    def users_with_id(self, user_id):
+        """How many users have this id: more than one only in old CSV files
+        with duplicate ids (see `sequences.py repair`)."""
+        return sum(1 for u in self.load_users() if _same_id(u.get('id'), user_id))
+
+    # appointments
+    def load_appointments(self):
+        raise NotImplementedError
+
+    def append_appointment(self, user_id, doctor_id, hospital_id, scheduled_at_iso, status='booked',
+                           require_free_slot=False):
+        """Store a new appointment. With `require_free_slot`, raise SlotTaken
+        (and store nothing) if the doctor already has a booking in that slot;
+        the check and the write are atomic."""
+        raise NotImplementedError
+
+    def append_appointments(self, items, require_free_slot=False):
+        """Store several appointments: dicts with user_id, doctor_id,
+        hospital_id, scheduled_at (ISO) and optionally status. Instead of
+        doctor_id an item may give `doctor_ids`, candidates in order of
+        preference: the first one free in that slot is booked. Returns one
+        result per item, the stored row or, with `require_free_slot`, the
+        SlotTaken error if its slot is taken (by a stored booking or an
+        earlier item). Engines write them all at once; this fallback books
+        them one by one."""
+        out = []
+        for item in items:
+            result = None
+            for doctor_id in _candidates(item):
+                try:
+                    result = self.append_appointment(item['user_id'], doctor_id, item['hospital_id'],
+                                                     item['scheduled_at'], status=item.get('status', 'booked'),
+                                                     require_free_slot=require_free_slot)
+                    break
+                except SlotTaken as e:
+                    result = e
+            out.append(_slot_taken_error(item) if isinstance(result, SlotTaken) else result)
+        return out
+
+    def save_appointments(self, appts_list):
+        raise NotImplementedError
+
+    def get_appointment(self, appt_id):
+        for a in self.load_appointments():
+            if _same_id(a.get('id'), appt_id):
+                return a
+        return None
+
+    def appointments_for_user(self, user_id):
+        return [a for a in self.load_appointments() if _same_id(a.get('user_id'), user_id)]
+
+    def appointments_for_doctor(self, doctor_id):
+        return [a for a in self.load_appointments() if _same_id(a.get('doctor_id'), doctor_id)]
+
+    def set_appointment_status(self, appt_id, status):
+        """Update one appointment's status. Returns the updated row or None."""
+        # copy rows: loaded rows may be shared with a cache
+        appts = [dict(a) for a in self.load_appointments()]
+        target = None
+        for a in appts:
+            if _same_id(a.get('id'), appt_id):
+                target = a
+                break
+        if not target:
+            return None
+        target['status'] = status
+        self.save_appointments(appts)
+        return target
+
+    def set_appointments_status(self, appt_ids, status):
+        """Update several appointments with one write. Returns
+        {appt_id: updated row or None} for the requested ids."""
+        appts = [dict(a) for a in self.load_appointments()]
+        wanted = {str(i) for i in appt_ids}
+        found = {}
+        for a in appts:
+            key = str(a.get('id'))
+            if key in wanted and key not in found:
+                a['status'] = status
+                found[key] = a
+        if found:
+            self.save_appointments(appts)
+        return {i: found.get(str(i)) for i in appt_ids}
+
+    def delete_appointments_for_user(self, user_id):
+        """Remove every appointment of `user_id`. Returns the remaining count."""
+        remaining = [a for a in self.load_appointments() if not _same_id(a.get('user_id'), user_id)]
+        self.save_appointments(remaining)
+        return len(remaining)
+
+    def clear_appointments(self):
+        self.save_appointments([])
+
+    # slots (see slots.py); `calendar` provides the slot arithmetic
+    calendar = None
+
+    def booked_slot_keys(self, doctor_id, start_key, end_key):
+        """Sorted slot keys in [start_key, end_key) with a booked appointment."""
+        raise NotImplementedError
+
+    def is_slot_free(self, doctor_id, scheduled_at):
+        key = self.calendar.slot_key(scheduled_at)
+        return not self.booked_slot_keys(doctor_id, key, key + self.calendar.slot_minutes)
+
+    def free_slots(self, doctor_id, start, end, limit=None):
+        cal = self.calendar
+        booked = self.booked_slot_keys(doctor_id, cal.slot_key(start), cal.slot_key(end) + cal.slot_minutes)
+        return cal.free_slots(booked, start, end, limit=limit)
+
+    def next_free_slot(self, doctor_id, after, horizon_days=60):
+        start = parse_when(after)
+        found = self.free_slots(doctor_id, start, start + timedelta(days=horizon_days), limit=1)
+        return found[0] if found else None
+
+    def booked_slot_keys_many(self, doctor_ids, start_key, end_key):
+        """{doctor_id: booked slot keys in [start_key, end_key)} for several doctors."""
+        return {d: self.booked_slot_keys(d, start_key, end_key) for d in doctor_ids}
+
+    def availability_many(self, doctor_ids, start, end, after, horizon_days=60):
+        """{doctor_id: {'booked_count', 'free_slots', 'next_free_slot'}}:
+        free slots in [start, end) and the first free slot after `after`
+        (within `horizon_days`), from one read of the bookings for all of
+        `doctor_ids`."""
+        cal = self.calendar
+        norm = [_to_int(d) for d in doctor_ids]
+        horizon = after + timedelta(days=horizon_days)
+        lo, hi = min(start, after), max(end, horizon)
+        booked = self.booked_slot_keys_many(norm, cal.slot_key(lo), cal.slot_key(hi) + cal.slot_minutes)
+        counts = self.booked_counts(norm)
+        out = {}
+        for d, key in zip(doctor_ids, norm):
+            keys = booked.get(key, [])
+            nxt = cal.free_slots(keys, after, horizon, limit=1)
+            out[d] = {'booked_count': counts.get(key, 0),
+                      'free_slots': cal.free_slots(keys, start, end) if end > start else [],
+                      'next_free_slot': nxt[0] if nxt else None}
+        return out
+
+    # booked counts (see counters.py)
+    def booked_count(self, doctor_id):
+        return sum(1 for a in self.appointments_for_doctor(doctor_id) if a.get('status') == 'booked')
+
+    def booked_counts(self, doctor_ids):
+        """{doctor_id: booked appointments} for several doctors."""
+        return {d: self.booked_count(d) for d in doctor_ids}
+
+    def booking_counters(self):
+        """BookingCounters for the current appointments. Recounted here;
+        engines that keep them up to date override this."""
+        return BookingCounters.recount(self.load_appointments())
+
+    def check_counters(self):
+        """Mismatches between booking_counters() and a full recount ([] if consistent)."""
+        for _ in range(2):
+            # a booking landing between the two reads shows up as a mismatch
+            # that is gone on the second try
+            mismatches = self.booking_counters().diff(BookingCounters.recount(self.load_appointments()))
+            if not mismatches:
+                break
+        return mismatches
+
+    # process lifecycle (see serve.py)
+    def warm_up(self):
+        """Load whatever the engine caches in memory, before workers fork."""
+
+    def after_fork(self):
+        """Drop state that must not be shared with the parent process."""
+
+
+class CsvStorage(Storage):
+    """users.csv / appointments.csv.
+
+    users.csv is parsed through the optional `FileCache` (re-parsed only after
+    it changed on disk); appointments.csv through a `CsvTail`. Returned rows
+    are shared with those caches and must not be mutated by callers.
+
+    Cancellations and history deletions are not written into appointments.csv
+    directly: they are appended to appointments.changes.csv and merged over
+    the base rows on read. `compact()` folds the change log into a fresh
+    appointments.csv; it runs in a background thread once the log reaches
+    `compact_threshold` records.
+    """
+
+    name = 'csv'
+
+    def __init__(self, users_csv, appts_csv, cache=None, id_block_size=1, group_window=0.0, group_max_rows=64,
+                 compact_threshold=1000, backups=None, calendar=None):
+        self.users_csv = Path(users_csv)
+        self.appts_csv = Path(appts_csv)
+        self.cache = cache
+        self.appointments = CsvTail(self.appts_csv, APPTS_HEADER,
+                                    int_fields=('id', 'user_id', 'doctor_id', 'hospital_id'),
+                                    index_fields=('id', 'user_id', 'doctor_id'))
+        self.changes_csv = change_log_path(self.appts_csv)
+        self.changes = CsvTail(self.changes_csv, CHANGES_HEADER, int_fields=('appointment_id', 'user_id'))
+        self.changes_writer = WriteCoordinator(self.changes_csv, header=CHANGES_HEADER)
+        self.compact_threshold = compact_threshold
+        self.backups = backups or BackupManager(self.appts_csv)
+        self._compacting = threading.Lock()
+        self._users_index = None  # (users list, by_id, by_username, users per id)
+        self._users_index_lock = threading.Lock()
+        # change log folded into {appointment_id: status} and {(appointment_id, user_id)}
+        self._overlay_lock = threading.Lock()
+        self._overlay_key = None
+        self._overlay_pos = 0
+        self._status_by_id = {}
+        self._deleted = set()
+        # booked slots per doctor and booked counts, kept in sync with both
+        # files (see _sync_calendar)
+        self.calendar = calendar or SlotCalendar()
+        self.counters = BookingCounters()
+        self._calendar_lock = threading.Lock()
+        self._calendar_key = None
+        self._calendar_pos = 0
+        self._calendar_changes_pos = 0
+        self._calendar_booked = {}  # id(row) -> row currently occupies its slot
+        self.users_writer = WriteCoordinator(self.users_csv, header=USERS_HEADER)
+        # ids come from users.seq / appointments.seq; seeded from the CSV once
+        self.user_ids = Sequence(self.users_csv.with_suffix('.seq'),
+                                 seed=lambda: max_numeric_id(self.load_users()), block_size=id_block_size)
+        self.appt_ids = Sequence(self.appts_csv.with_suffix('.seq'),
+                                 seed=lambda: max_numeric_id(self.appointments.all()), block_size=id_block_size)
+        # bookings arrive in bursts; group_window > 0 lets them share one fsync
+        # (and one appointments.seq update: the writer numbers each batch)
+        self.appts_writer = WriteCoordinator(self.appts_csv, header=APPTS_HEADER,
+                                             group_window=group_window, max_batch=group_max_rows,
+                                             ids=self.appt_ids, id_column=APPTS_HEADER.index('id'))
+
+    def _cached(self, path, parse):
+        if self.cache is None:
+            return parse(path)
+        return self.cache.get(path, parse)
+
+    def _written(self, path):
+        # our own writes can land within the filesystem's mtime granularity,
+        # so drop the entry explicitly instead of relying on the signature
+        if self.cache is not None:
+            self.cache.invalidate(path)
+
+    def load_users(self):
+        return self._cached(self.users_csv, self._parse_users)
+
+    def _user_index(self):
+        """(by_id, by_username, users per id) over the loaded users, rebuilt
+        when the cache hands out a new list. The first row wins, as with a
+        scan."""
+        users = self.load_users()
+        with self._users_index_lock:
+            if self._users_index is None or self._users_index[0] is not users:
+                by_id, by_name, id_counts = {}, {}, Counter()
+                for u in users:
+                    by_id.setdefault(u.get('id'), u)
+                    by_name.setdefault(u.get('username'), u)
+                    id_counts[u.get('id')] += 1
+                self._users_index = (users, by_id, by_name, id_counts)
+            return self._users_index[1:]
+
+    def find_user_by_username(self, username):
+        return self._user_index()[1].get(username)
+
+    def find_user_by_id(self, user_id):
+        return self._user_index()[0].get(_to_int(user_id))
+
+    def users_with_id(self, user_id):
+        return self._user_index()[2].get(_to_int(user_id), 0)
+
+    @staticmethod
+    def _parse_users(path):
+        if not path.exists():
+            return []
+        with path.open(newline='', encoding='utf-8') as f:
+            first = f.readline()
+            f.seek(0)
+            # if file has header (contains 'username' or 'id'), use DictReader
+            if 'username' in first.lower() or 'id' in first.lower():
+                reader = csv.DictReader(f)
+                users = list(reader)
+            else:
+                # no header - fall back to positional columns: id,username,password_hash,full_name,phone
+                reader = csv.reader(f)
+                users = []
+                for row in reader:
+                    if not row:
+                        continue
+                    # pad row
+                    while len(row) < 5:
+                        row.append('')
+                    users.append({'id': row[0], 'username': row[1], 'password_hash': row[2], 'full_name': row[3], 'phone': row[4]})
+        # normalize ids
+        for u in users:
+            u['id'] = _to_int(u.get('id'))
+        return users
+
+    def create_user(self, username, password_hash, full_name='', phone=''):
+        row = {'id': self.user_ids.next_id(), 'username': username, 'password_hash': password_hash, 'full_name': full_name, 'phone': phone}
+        self.users_writer.append([[row['id'], row['username'], row['password_hash'], row['full_name'], row['phone']]])
+        self._written(self.users_csv)
+        return row
+
+    # appointments.csv is append-only between rewrites, so it is read
+    # incrementally (see csvtail.py) and looked up through per-column indexes;
+    # the change log is merged over whatever rows a lookup returns.
+    def _overlay(self):
+        """Return (status_by_id, deleted) for the change log, folding in only
+        records appended since the last call."""
+        reloads, rows = self.changes.snapshot()
+        with self._overlay_lock:
+            key = (reloads, id(rows))
+            if key != self._overlay_key:
+                self._overlay_key = key
+                self._overlay_pos = 0
+                self._status_by_id = {}
+                self._deleted = set()
+            end = len(rows)
+            for c in rows[self._overlay_pos:end]:
+                if c.get('op') == 'status':
+                    self._status_by_id[c.get('appointment_id')] = c.get('status')
+                elif c.get('op') == 'delete':
+                    self._deleted.add((c.get('appointment_id'), c.get('user_id')))
+            self._overlay_pos = end
+            return self._status_by_id, self._deleted
+
+    def _merged(self, rows):
+        status_by_id, deleted = self._overlay()
+        if not status_by_id and not deleted:
+            return rows
+        by_id = self.appointments.indexes['id']
+        out = []
+        for a in rows:
+            if (a.get('id'), a.get('user_id')) in deleted:
+                continue
+            status = status_by_id.get(a.get('id'))
+            # like a rewrite, a status change applies to the first row with that id
+            if status is not None and by_id.get(a.get('id'), [None])[0] is a:
+                a = dict(a, status=status)
+            out.append(a)
+        return out
+
+    def load_appointments(self):
+        return self._merged(self.appointments.all())
+
+    def get_appointment(self, appt_id):
+        rows = self._merged(self.appointments.lookup('id', appt_id))
+        return rows[0] if rows else None
+
+    def appointments_for_user(self, user_id):
+        return self._merged(self.appointments.lookup('user_id', user_id))
+
+    def appointments_for_doctor(self, doctor_id):
+        return self._merged(self.appointments.lookup('doctor_id', doctor_id))
+
+    def append_appointment(self, user_id, doctor_id, hospital_id, scheduled_at_iso, status='booked',
+                           require_free_slot=False):
+        result = self.append_appointments([{'user_id': user_id, 'doctor_id': doctor_id, 'hospital_id': hospital_id,
+                                            'scheduled_at': scheduled_at_iso, 'status': status}],
+                                          require_free_slot=require_free_slot)[0]
+        if isinstance(result, SlotTaken):
+            raise result
+        return result
+
+    def append_appointments(self, items, require_free_slot=False):
+        created_at = datetime.utcnow().isoformat()
+        # ids are left empty: appts_writer numbers the whole batch at once
+        rows = [{'id': None, 'user_id': it['user_id'], 'doctor_id': _candidates(it)[0],
+                 'hospital_id': it['hospital_id'], 'scheduled_at': it['scheduled_at'],
+                 'status': it.get('status', 'booked'), 'created_at': created_at} for it in items]
+        if not rows:
+            return []
+        values = [[row[k] for k in APPTS_HEADER] for row in rows]
+        results = list(rows)
+        check = None
+        if require_free_slot:
+            def check(batch_state):
+                # runs under the appointments write lock, so no other worker
+                # can append between this check and our write
+                self._sync_calendar()
+                reserved = batch_state.setdefault('slots', set())
+                doctor_column = APPTS_HEADER.index('doctor_id')
+                keep = []
+                for i, row in enumerate(rows):
+                    key = self.calendar.slot_key(row['scheduled_at'])
+                    free = [d for d in _candidates(items[i])
+                            if (_to_int(d), key) not in reserved and self.calendar.is_free(_to_int(d), key)]
+                    if not free:
+                        results[i] = _slot_taken_error(items[i])
+                        continue
+                    row['doctor_id'] = values[i][doctor_column] = free[0]
+                    reserved.add((_to_int(free[0]), key))
+                    keep.append(values[i])
+                return keep
+        self.appts_writer.append(values, check=check)
+        id_column = APPTS_HEADER.index('id')
+        for row, value in zip(rows, values):
+            row['id'] = value[id_column]
+        return results
+
+    def _sync_calendar(self):
+        """Fold rows and change records added since the last call into the
+        slot calendar and the booking counters; rebuild both if either file
+        was rewritten."""
+        # take the change log first: every row a change refers to is then
+        # already in the base snapshot taken after it
+        c_reloads, changes = self.changes.snapshot()
+        reloads, rows = self.appointments.snapshot()
+        with self._calendar_lock:
+            key = (reloads, id(rows), c_reloads, id(changes))
+            if key != self._calendar_key:
+                self._calendar_key = key
+                self.calendar.clear()
+                self.counters.clear()
+                self._calendar_pos = self._calendar_changes_pos = 0
+                self._calendar_booked = {}
+            end = len(rows)
+            for a in rows[self._calendar_pos:end]:
+                self._set_slot(a, a.get('status') == 'booked')
+            self._calendar_pos = end
+            c_end = len(changes)
+            by_id = self.appointments.indexes['id']
+            for c in changes[self._calendar_changes_pos:c_end]:
+                matches = by_id.get(c.get('appointment_id'), [])
+                if c.get('op') == 'status' and matches:
+                    self._set_slot(matches[0], c.get('status') == 'booked')
+                elif c.get('op') == 'delete':
+                    for a in matches:
+                        if a.get('user_id') == c.get('user_id'):
+                            self._set_slot(a, False)
+            self._calendar_changes_pos = c_end
+
+    def _set_slot(self, row, booked):
+        if self._calendar_booked.get(id(row), False) == booked:
+            return
+        self._calendar_booked[id(row)] = booked
+        self.counters.add(row, 1 if booked else -1)
+        key = self.calendar.slot_key(row.get('scheduled_at'))
+        if booked:
+            self.calendar.add(row.get('doctor_id'), key)
+        else:
+            self.calendar.remove(row.get('doctor_id'), key)
+
+    def booked_slot_keys(self, doctor_id, start_key, end_key):
+        self._sync_calendar()
+        return self.calendar.booked_between(doctor_id, start_key, end_key)
+
+    def booked_slot_keys_many(self, doctor_ids, start_key, end_key):
+        self._sync_calendar()
+        return {d: self.calendar.booked_between(d, start_key, end_key) for d in doctor_ids}
+
+    def booked_count(self, doctor_id):
+        self._sync_calendar()
+        return self.counters.doctor(doctor_id)
+
+    def booked_counts(self, doctor_ids):
+        self._sync_calendar()
+        return {d: self.counters.doctor(d) for d in doctor_ids}
+
+    def booking_counters(self):
+        self._sync_calendar()
+        return self.counters
+
+    def warm_up(self):
+        self._user_index()
+        self._overlay()
+        self._sync_calendar()
+        # snapshots a previous run hardlinked but did not get to finish
+        try:
+            self.backups.recover()
+        except Exception as e:
+            print(f"Warning: failed to recover appointments backups: {e}")
+
+    def _log_changes(self, records):
+        at = datetime.utcnow().isoformat()
+        self.changes_writer.append([[r['appointment_id'], r['user_id'], r['op'], r.get('status', ''), at] for r in records])
+        self.changes.refresh()
+        if len(self.changes.rows) >= self.compact_threshold:
+            self.compact_in_background()
+
+    def set_appointment_status(self, appt_id, status):
+        target = self.get_appointment(appt_id)
+        if not target:
+            return None
+        self._log_changes([{'appointment_id': target.get('id'), 'user_id': target.get('user_id'), 'op': 'status', 'status': status}])
+        return dict(target, status=status)
+
+    def set_appointments_status(self, appt_ids, status):
+        targets = {i: self.get_appointment(i) for i in appt_ids}
+        records, seen = [], set()
+        for t in targets.values():
+            if t and t.get('id') not in seen:
+                seen.add(t.get('id'))
+                records.append({'appointment_id': t.get('id'), 'user_id': t.get('user_id'), 'op': 'status', 'status': status})
+        if records:
+            self._log_changes(records)
+        return {i: dict(t, status=status) if t else None for i, t in targets.items()}
+
+    def delete_appointments_for_user(self, user_id):
+        rows = self.appointments_for_user(user_id)
+        if rows:
+            self._log_changes([{'appointment_id': a.get('id'), 'user_id': a.get('user_id'), 'op': 'delete'} for a in rows])
+        return len(self.load_appointments())
+
+    def save_appointments(self, appts_list):
+        """Persist appointments list back to CSV. Overwrites `appointments.csv`.
+        `appts_list` is a list of dicts with keys matching the header.
+        """
+        # appends and change records from every worker wait until the new
+        # file is in place and the (now folded-in) change log is emptied
+        with self.appts_writer.exclusive(), self.changes_writer.exclusive():
+            self._rewrite_appointments(appts_list)
+            self._reset_changes()
+
+    def compact(self):
+        """Fold the change log into a fresh appointments.csv. Returns the
+        number of change records folded."""
+        with self.appts_writer.exclusive(), self.changes_writer.exclusive():
+            folded = len(self.changes.all())
+            if folded:
+                self._rewrite_appointments(self.load_appointments())
+                self._reset_changes()
+            return folded
+
+    def compact_in_background(self):
+        if not self._compacting.acquire(blocking=False):
+            return  # already running in this process
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Warning: appointments compaction failed: {e}")
+            finally:
+                self._compacting.release()
+
+        threading.Thread(target=run, name='appointments-compaction', daemon=True).start()
+
+    def _reset_changes(self):
+        tmp_path = self.changes_csv.with_name(self.changes_csv.name + '.tmp')
+        with tmp_path.open('w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(CHANGES_HEADER)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.changes_csv)
+        self.changes.invalidate()
+
+    def _rewrite_appointments(self, appts_list):
+        # Snapshot the current file before overwriting it. This only hardlinks
+        # it; compression, deltas and retention run on the backup thread.
+        try:
+            self.backups.before_rewrite()
+        except Exception as e:
+            # If backup fails, log and continue to attempt to save (do not silently drop changes)
+            print(f"Warning: failed to create appointments backup: {e}")
+
+        # write a new file and swap it in, so readers (and the tail reader)
+        # see either the old or the new file, never a half-written one
+        tmp_path = self.appts_csv.with_name(self.appts_csv.name + '.tmp')
+        with tmp_path.open('w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(APPTS_HEADER)
+            for a in appts_list:
+                writer.writerow([a.get(k, '') for k in APPTS_HEADER])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.appts_csv)
+        self.appointments.invalidate()
+
+
+def _parse_dt(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _fmt_dt(value):
+    return value.isoformat() if value else ''
+
+
+def _sqlite_pragmas(dbapi_conn, conn_record):
+    cur = dbapi_conn.cursor()
+    # WAL lets readers proceed while a writer commits; NORMAL sync is durable
+    # across application crashes and only risks the last commit on power loss.
+    cur.execute('PRAGMA journal_mode=WAL')
+    cur.execute('PRAGMA synchronous=NORMAL')
+    cur.execute('PRAGMA busy_timeout=5000')
+    cur.close()
+
+
+def _sqlite_manual_begin(dbapi_conn, conn_record):
+    # stop pysqlite from issuing its own (deferred) BEGIN before the first
+    # write; the 'begin' listener below opens the transaction instead
+    dbapi_conn.isolation_level = None
+
+
+def _sqlite_begin_immediate(conn):
+    # take the write lock up front, so a slot check and its insert cannot
+    # interleave with another process's
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class SqliteStorage(Storage):
+    """Users and appointments in SQLite (WAL mode) via the models in models.py."""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path, calendar=None):
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.orm import sessionmaker
+        from models import Base
+
+        self.calendar = calendar or SlotCalendar()
+        self._book_lock = threading.Lock()
+        self.db_path = Path(db_path)
+        self.engine = create_engine(f'sqlite:///{self.db_path}', connect_args={'check_same_thread': False})
+        event.listen(self.engine, 'connect', _sqlite_pragmas)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        # bookings that must find their slot free run in BEGIN IMMEDIATE
+        # transactions on their own engine; reads and other writes stay deferred
+        self.booking_engine = create_engine(f'sqlite:///{self.db_path}', connect_args={'check_same_thread': False})
+        event.listen(self.booking_engine, 'connect', _sqlite_pragmas)
+        event.listen(self.booking_engine, 'connect', _sqlite_manual_begin)
+        event.listen(self.booking_engine, 'begin', _sqlite_begin_immediate)
+        self.BookingSession = sessionmaker(bind=self.booking_engine, expire_on_commit=False)
+
+    def after_fork(self):
+        # pooled connections opened in the parent must not be used by the child
+        self.engine.dispose(close=False)
+        self.booking_engine.dispose(close=False)
+
+    @staticmethod
+    def _user_dict(u):
+        return {'id': u.id, 'username': u.username, 'password_hash': u.password_hash, 'full_name': u.full_name or '', 'phone': u.phone or ''}
+
+    @staticmethod
+    def _appt_dict(a):
+        return {
+            'id': a.id,
+            'user_id': a.user_id,
+            'doctor_id': a.doctor_id,
+            'hospital_id': a.hospital_id,
+            'scheduled_at': _fmt_dt(a.scheduled_at),
+            'status': a.status,
+            'created_at': _fmt_dt(a.created_at),
+        }
+
+    @staticmethod
+    def _appt_model(a):
+        from models import Appointment
+        return Appointment(
+            id=_to_int(a.get('id')) or None,
+            user_id=_to_int(a.get('user_id')) or None,
+            doctor_id=_to_int(a.get('doctor_id')) or None,
+            hospital_id=_to_int(a.get('hospital_id')) or None,
+            scheduled_at=_parse_dt(a.get('scheduled_at')),
+            status=a.get('status') or 'booked',
+            created_at=_parse_dt(a.get('created_at')) or datetime.utcnow(),
+        )
+
+    # users
+    def load_users(self):
+        from models import User
+        with self.Session() as s:
+            return [self._user_dict(u) for u in s.query(User).order_by(User.id)]
+
+    def find_user_by_username(self, username):
+        from models import User
+        with self.Session() as s:
+            u = s.query(User).filter(User.username == username).one_or_none()
+            return self._user_dict(u) if u else None
+
+    def find_user_by_id(self, user_id):
+        from models import User
+        user_id = _to_int(user_id)
+        if not isinstance(user_id, int):
+            return None
+        with self.Session() as s:
+            u = s.get(User, user_id)
+            return self._user_dict(u) if u else None
+
+    def users_with_id(self, user_id):
+        return 1 if self.find_user_by_id(user_id) else 0  # primary key
+
+    def create_user(self, username, password_hash, full_name='', phone=''):
+        from models import User
+        with self.Session.begin() as s:
+            u = User(username=username, password_hash=password_hash, full_name=full_name, phone=phone)
+            s.add(u)
+            s.flush()
+            return self._user_dict(u)
+
+    # appointments
+    def load_appointments(self):
+        from models import Appointment
+        with self.Session() as s:
+            return [self._appt_dict(a) for a in s.query(Appointment).order_by(Appointment.id)]
+
+    def get_appointment(self, appt_id):
+        from models import Appointment
+        appt_id = _to_int(appt_id)
+        if not isinstance(appt_id, int):
+            return None
+        with self.Session() as s:
+            a = s.get(Appointment, appt_id)
+            return self._appt_dict(a) if a else None
+
+    def appointments_for_user(self, user_id):
+        from models import Appointment
+        with self.Session() as s:
+            q = s.query(Appointment).filter(Appointment.user_id == _to_int(user_id))
+            return [self._appt_dict(a) for a in q]
+
+    def appointments_for_doctor(self, doctor_id):
+        from models import Appointment
+        with self.Session() as s:
+            q = s.query(Appointment).filter(Appointment.doctor_id == _to_int(doctor_id))
+            return [self._appt_dict(a) for a in q]
+
+    def booked_slot_keys(self, doctor_id, start_key, end_key):
+        from models import Appointment
+        cal = self.calendar
+        with self.Session() as s:
+            # range scan on ix_appointments_doctor_scheduled
+            q = (s.query(Appointment.scheduled_at)
+                 .filter(Appointment.doctor_id == _to_int(doctor_id),
+                         Appointment.scheduled_at >= cal.slot_start(start_key),
+                         Appointment.scheduled_at < cal.slot_start(end_key),
+                         Appointment.status == 'booked')
+                 .order_by(Appointment.scheduled_at))
+            return sorted({cal.slot_key(when) for (when,) in q})
+
+    def booked_slot_keys_many(self, doctor_ids, start_key, end_key):
+        from models import Appointment
+        cal = self.calendar
+        ids = [d for d in (_to_int(d) for d in doctor_ids) if isinstance(d, int)]
+        out = {d: set() for d in doctor_ids}
+        if ids:
+            with self.Session() as s:
+                q = (s.query(Appointment.doctor_id, Appointment.scheduled_at)
+                     .filter(Appointment.doctor_id.in_(ids),
+                             Appointment.scheduled_at >= cal.slot_start(start_key),
+                             Appointment.scheduled_at < cal.slot_start(end_key),
+                             Appointment.status == 'booked'))
+                for doctor_id, when in q:
+                    out.setdefault(doctor_id, set()).add(cal.slot_key(when))
+        return {d: sorted(keys) for d, keys in out.items()}
+
+    def booked_counts(self, doctor_ids):
+        from sqlalchemy import func
+
+        from models import Appointment
+        ids = [d for d in (_to_int(d) for d in doctor_ids) if isinstance(d, int)]
+        out = {d: 0 for d in doctor_ids}
+        if ids:
+            with self.Session() as s:
+                q = (s.query(Appointment.doctor_id, func.count(Appointment.id))
+                     .filter(Appointment.doctor_id.in_(ids), Appointment.status == 'booked')
+                     .group_by(Appointment.doctor_id))
+                out.update(q)
+        return out
+
+    def append_appointment(self, user_id, doctor_id, hospital_id, scheduled_at_iso, status='booked',
+                           require_free_slot=False):
+        row = {'user_id': user_id, 'doctor_id': doctor_id, 'hospital_id': hospital_id,
+               'scheduled_at': scheduled_at_iso, 'status': status, 'created_at': datetime.utcnow().isoformat()}
+        if require_free_slot:
+            # the check and the insert share a BEGIN IMMEDIATE transaction:
+            # writers in other processes wait (busy_timeout) until it commits
+            with self._book_lock:
+                return self._insert_appointment(row, check_slot=True)
+        return self._insert_appointment(row)
+
+    def _insert_appointment(self, row, check_slot=False):
+        with (self.BookingSession if check_slot else self.Session).begin() as s:
+            if check_slot and self._slot_taken(s, row):
+                raise SlotTaken(f"doctor {row['doctor_id']} is already booked at {row['scheduled_at']}")
+            return self._add_appointment(s, row)
+
+    def _slot_taken(self, s, row):
+        from models import Appointment
+        cal = self.calendar
+        key = cal.slot_key(row['scheduled_at'])
+        return (s.query(Appointment.id)
+                .filter(Appointment.doctor_id == _to_int(row['doctor_id']),
+                        Appointment.scheduled_at >= cal.slot_start(key),
+                        Appointment.scheduled_at < cal.slot_start(key + cal.slot_minutes),
+                        Appointment.status == 'booked')
+                .first()) is not None
+
+    def _add_appointment(self, s, row):
+        a = self._appt_model(row)
+        s.add(a)
+        s.flush()
+        return self._appt_dict(a)
+
+    def append_appointments(self, items, require_free_slot=False):
+        created_at = datetime.utcnow().isoformat()
+        results = []
+        # one transaction; rows flushed earlier in it count for later slot checks
+        with self._book_lock, (self.BookingSession if require_free_slot else self.Session).begin() as s:
+            for it in items:
+                row = {'user_id': it['user_id'], 'doctor_id': _candidates(it)[0], 'hospital_id': it['hospital_id'],
+                       'scheduled_at': it['scheduled_at'], 'status': it.get('status', 'booked'),
+                       'created_at': created_at}
+                if require_free_slot:
+                    free = next((d for d in _candidates(it) if not self._slot_taken(s, dict(row, doctor_id=d))), None)
+                    if free is None:
+                        results.append(_slot_taken_error(it))
+                        continue
+                    row['doctor_id'] = free
+                results.append(self._add_appointment(s, row))
+        return results
+
+    def save_appointments(self, appts_list):
+        from models import Appointment
+        with self.Session.begin() as s:
+            s.query(Appointment).delete()
+            s.add_all([self._appt_model(a) for a in appts_list])
+
+    def set_appointment_status(self, appt_id, status):
+        from models import Appointment
+        appt_id = _to_int(appt_id)
+        if not isinstance(appt_id, int):
+            return None
+        with self.Session.begin() as s:
+            a = s.get(Appointment, appt_id)
+            if not a:
+                return None
+            a.status = status
+            return self._appt_dict(a)
+
+    def set_appointments_status(self, appt_ids, status):
+        from models import Appointment
+        out = {}
+        with self.Session.begin() as s:
+            for i in appt_ids:
+                appt_id = _to_int(i)
+                a = s.get(Appointment, appt_id) if isinstance(appt_id, int) else None
+                if a:
+                    a.status = status
+                out[i] = self._appt_dict(a) if a else None
+        return out
+
+    def delete_appointments_for_user(self, user_id):
+        from models import Appointment
+        with self.Session.begin() as s:
+            s.query(Appointment).filter(Appointment.user_id == _to_int(user_id)).delete()
+            return s.query(Appointment).count()
+
+    def clear_appointments(self):
+        from models import Appointment
+        with self.Session.begin() as s:
+            s.query(Appointment).delete()
+
+
+def make_storage(engine, users_csv, appts_csv, db_path, cache=None, id_block_size=1,
+                 group_window=0.0, group_max_rows=64, compact_threshold=1000, backups=None, calendar=None):
+    """Return the storage engine named by `engine` ('csv' or 'sqlite').
+    `calendar` (a SlotCalendar) sets the slot rules for both engines.
+    `cache` (a FileCache), `id_block_size`, the group-commit settings,
+    `compact_threshold` and `backups` (a BackupManager) are used by the CSV
+    engine only; SQLite allocates ids and updates rows in place itself.
+    """
+    if engine == 'sqlite':
+        return SqliteStorage(db_path, calendar=calendar)
+    if engine == 'csv':
+        return CsvStorage(users_csv, appts_csv, cache=cache, id_block_size=id_block_size,
+                          group_window=group_window, group_max_rows=group_max_rows,
+                          compact_threshold=compact_threshold, backups=backups, calendar=calendar)
+    raise ValueError(f'unknown storage engine: {engine!r}')
+
+
+def import_csv(sqlite_storage, csv_storage, hospitals=None, doctors=None):
+    """Copy CSV-backed data into `sqlite_storage` without losing rows.
+
+    Users are matched on username and appointments on their natural key
+    (user, doctor, hospital, scheduled_at, created_at), so running the import
+    twice only copies rows appended in between. Rows whose id is already taken
+    (the CSV files contain duplicate ids) get a fresh id, above every id in
+    either source, instead of being dropped; appointments follow their user
+    to its new id. Appointments with a non-integer user, doctor or hospital
+    id are skipped and reported. `hospitals` / `doctors` are the cleaned rows
+    from app.py's loaders; they are upserted by id. Returns a dict of
+    per-table counts.
+    """
+    from models import User, Hospital, Doctor, Appointment
+
+    counts = {'users': 0, 'appointments': 0, 'hospitals': 0, 'doctors': 0, 'renumbered': 0, 'skipped': 0}
+    with sqlite_storage.Session.begin() as s:
+        for h in hospitals or []:
+            hid = _to_int(h.get('id'))
+            if not isinstance(hid, int):
+                continue
+            s.merge(Hospital(id=hid, name=h.get('name') or '', locality=h.get('locality') or '', address=h.get('address')))
+            counts['hospitals'] += 1
+        for d in doctors or []:
+            did = _to_int(d.get('id'))
+            if not isinstance(did, int):
+                continue
+            hid = _to_int(d.get('hospital_id'))
+            exp = d.get('experience_years')
+            s.merge(Doctor(
+                id=did,
+                hospital_id=hid if isinstance(hid, int) else None,
+                name=d.get('name') or '',
+                specialty=d.get('specialty'),
+                is_available=1 if d.get('is_available') else 0,
+                qualification=d.get('qualification'),
+                experience_years=exp if isinstance(exp, int) else None,
+                email=d.get('email'),
+                phone=d.get('phone'),
+            ))
+            counts['doctors'] += 1
+
+        csv_users = csv_storage.load_users()
+        csv_appts = csv_storage.load_appointments()
+        db_user_ids = {name: uid for uid, name in s.query(User.id, User.username)}
+        taken_user_ids = set(db_user_ids.values())
+        # fresh ids start above every id in the database *and* the CSVs, so a
+        # renumbered row never takes an id a later row is entitled to
+        next_user_id = max(taken_user_ids | {i for i in (_to_int(u.get('id')) for u in csv_users)
+                                             if isinstance(i, int)}
+                           | {i for i in (_to_int(a.get('user_id')) for a in csv_appts) if isinstance(i, int)},
+                           default=0) + 1
+        # CSV user id -> database user id. A duplicated id belongs to its
+        # first row (as with `sequences.py repair`).
+        user_ids = {}
+        for u in csv_users:
+            name = u.get('username')
+            if not name:
+                continue
+            old_id = _to_int(u.get('id'))
+            if name in db_user_ids:  # imported earlier, or a repeated username
+                user_ids.setdefault(old_id, db_user_ids[name])
+                continue
+            uid = old_id
+            if not isinstance(uid, int) or uid in taken_user_ids:
+                uid = next_user_id
+                next_user_id += 1
+                counts['renumbered'] += 1
+            s.add(User(id=uid, username=name, password_hash=u.get('password_hash') or '',
+                       full_name=u.get('full_name') or '', phone=u.get('phone') or ''))
+            user_ids.setdefault(old_id, uid)
+            taken_user_ids.add(uid)
+            db_user_ids[name] = uid
+            counts['users'] += 1
+
+        def natural_key(a):
+            return (str(a.get('user_id') or ''), str(a.get('doctor_id') or ''), str(a.get('hospital_id') or ''),
+                    _fmt_dt(_parse_dt(a.get('scheduled_at'))), _fmt_dt(_parse_dt(a.get('created_at'))))
+
+        taken_appt_ids = set()
+        known_appts = set()
+        for a in s.query(Appointment):
+            taken_appt_ids.add(a.id)
+            known_appts.add(natural_key(SqliteStorage._appt_dict(a)))
+        next_appt_id = max(taken_appt_ids | {i for i in (_to_int(a.get('id')) for a in csv_appts)
+                                             if isinstance(i, int)}, default=0) + 1
+        for a in csv_appts:
+            row = dict(a)
+            user_id = _to_int(row.get('user_id'))
+            row['user_id'] = user_ids.get(user_id, user_id)
+            bad = [k for k in ('user_id', 'doctor_id', 'hospital_id') if not isinstance(_to_int(row.get(k)), int)]
+            if bad:
+                print(f"Warning: skipping appointment {row.get('id')!r}: non-integer {', '.join(bad)}")
+                counts['skipped'] += 1
+                continue
+            key = natural_key(row)
+            if key in known_appts:
+                continue
+            aid = _to_int(row.get('id'))
+            if not isinstance(aid, int) or aid in taken_appt_ids:
+                aid = next_appt_id
+                next_appt_id += 1
+                counts['renumbered'] += 1
+            row['id'] = aid
+            s.add(SqliteStorage._appt_model(row))
+            taken_appt_ids.add(aid)
+            known_appts.add(key)
+            counts['appointments'] += 1
+    return counts
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Storage engine utilities')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_import = sub.add_parser('import-csv', help='copy users/appointments/doctors/hospitals CSVs into SQLite')
+    p_import.add_argument('--db', default='hospital.db')
+    p_import.add_argument('--users', default='users.csv')
+    p_import.add_argument('--appointments', default='appointments.csv')
+    p_import.add_argument('--skip-directory', action='store_true', help='do not import hospitals/doctors')
+    p_compact = sub.add_parser('compact', help='fold appointments.changes.csv into appointments.csv')
+    p_compact.add_argument('--users', default='users.csv')
+    p_compact.add_argument('--appointments', default='appointments.csv')
+    p_check = sub.add_parser('check-counters', help='compare the booking counters with a full recount')
+    p_check.add_argument('--users', default='users.csv')
+    p_check.add_argument('--appointments', default='appointments.csv')
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'import-csv':
+        hospitals = doctors = None
+        if not args.skip_directory:
+            # reuse the app's directory loaders so the import sees the same rows the API serves
+            import app as app_module
+            hospitals = app_module.load_hospitals_csv()
+            doctors = app_module.load_doctors_csv()
+        counts = import_csv(SqliteStorage(args.db), CsvStorage(args.users, args.appointments), hospitals, doctors)
+        print('Imported ' + ', '.join(f'{k}={v}' for k, v in counts.items()) + f' into {args.db}')
+    elif args.cmd == 'compact':
+        folded = CsvStorage(args.users, args.appointments).compact()
+        print(f'Folded {folded} change records into {args.appointments}')
+    elif args.cmd == 'check-counters':
+        storage = CsvStorage(args.users, args.appointments)
+        mismatches = storage.check_counters()
+        for m in mismatches:
+            print(f"{m['scope']} {m['key']}: counted {m['have']}, recount {m['expected']}")
+        print(f"{storage.counters.total} booked appointments, {len(mismatches)} mismatches")
+        return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
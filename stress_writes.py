@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Stress check for the CSV write path: no appointment rows may be lost.
+
+Runs several worker processes, each with several threads booking
+appointments through `CsvStorage`, while a canceller repeatedly cancels
+appointments and compacts the change log (rewriting appointments.csv). At the end every booked row must be present exactly once,
+ids must be unique, and every cancellation must still be in effect.
+
+  python stress_writes.py --procs 4 --threads 8 --per-thread 50
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from storage import CsvStorage
+
+
+def _worker(tmpdir, proc_no, threads, per_thread, group_ms):
+    storage = CsvStorage(Path(tmpdir) / 'users.csv', Path(tmpdir) / 'appointments.csv',
+                         group_window=group_ms / 1000.0)
+
+    def book(thread_no):
+        for i in range(per_thread):
+            # the scheduled_at value encodes who wrote the row so it can be found again
+            storage.append_appointment(1, proc_no, 1, f'p{proc_no}-t{thread_no}-{i}')
+
+    ts = [threading.Thread(target=book, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    if group_ms:
+        stats = storage.appts_writer.stats()
+        print(f"proc {proc_no}: {stats['batch_size']['count']} commits, "
+              f"mean batch {stats['batch_size']['mean']:.1f} rows, "
+              f"mean latency {stats['commit_latency_ms']['mean']:.2f} ms")
+
+
+def _canceller(tmpdir, stop, cancelled):
+    # a low compaction threshold makes the change log get folded into
+    # appointments.csv (a full rewrite) while bookings are being appended
+    storage = CsvStorage(Path(tmpdir) / 'users.csv', Path(tmpdir) / 'appointments.csv', compact_threshold=10)
+    while not stop.is_set():
+        rows = storage.load_appointments()
+        target = next((a for a in rows if a.get('status') == 'booked'), None)
+        if target and storage.set_appointment_status(target['id'], 'cancelled'):
+            cancelled.append(target['scheduled_at'])
+    storage.compact()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--procs', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=50)
+    parser.add_argument('--group-ms', type=float, default=0.0, help='group commit window for the bookers')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        stop = threading.Event()
+        cancelled = []
+        canceller = threading.Thread(target=_canceller, args=(tmpdir, stop, cancelled))
+        canceller.start()
+        procs = [multiprocessing.Process(target=_worker, args=(tmpdir, p, args.threads, args.per_thread, args.group_ms))
+                 for p in range(args.procs)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        stop.set()
+        canceller.join()
+
+        rows = CsvStorage(Path(tmpdir) / 'users.csv', Path(tmpdir) / 'appointments.csv').load_appointments()
+        expected = {f'p{p}-t{t}-{i}' for p in range(args.procs) for t in range(args.threads) for i in range(args.per_thread)}
+        written = [a['scheduled_at'] for a in rows]
+        ids = [a['id'] for a in rows]
+        by_key = {a['scheduled_at']: a for a in rows}
+        problems = []
+        if set(written) != expected or len(written) != len(expected):
+            problems.append(f'{len(expected - set(written))} rows lost, {len(written) - len(set(written))} duplicated')
+        if len(set(ids)) != len(ids):
+            problems.append(f'{len(ids) - len(set(ids))} duplicate ids')
+        lost_cancels = [k for k in cancelled if by_key.get(k, {}).get('status') != 'cancelled']
+        if lost_cancels:
+            problems.append(f'{len(lost_cancels)} cancellations lost')
+
+    print(f'{len(expected)} bookings, {len(cancelled)} concurrent cancels')
+    if problems:
+        print('FAILED: ' + '; '.join(problems))
+        return 1
+    print('OK: no rows or cancellations lost, ids unique')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
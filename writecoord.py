@@ -0,0 +1,203 @@
+# writecoord.py
+"""Serialized, durable writes to the CSV files.
+
+A `WriteCoordinator` owns one data file. Every writer (in any process) takes
+an advisory fcntl lock on a sidecar `<file>.lock` before touching the data
+file; the sidecar is used because read-modify-write operations replace the
+data file, which would drop a lock held on the file itself.
+
+Appends go through an in-process queue: the first thread to arrive becomes
+the leader, writes every row queued so far, fsyncs once and wakes the other
+callers, whose rows were part of that batch. Read-modify-write operations
+(cancel, clear history) run inside `exclusive()`, which blocks appends from
+all processes until the rewrite is in place.
+
+With `ids` (a Sequence) rows whose `id_column` is empty get their ids under
+the write lock, one contiguous range per batch: a batch costs one sequence
+update however many rows it has, ids follow file order, and rows rejected by
+a check use none.
+
+Group commit: with `group_window` > 0 the leader waits up to that many
+seconds (or until `max_batch` rows are queued) before writing, so a burst of
+bookings shares one write and one fsync. Callers still return only after
+their batch is durable. Batch sizes and enqueue-to-durable latencies are
+recorded in histograms (`stats()`).
+"""
+import csv
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import Histogram
+from sequences import lock_file, unlock_file
+
+BATCH_SIZE_BOUNDS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+LATENCY_MS_BOUNDS = [0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000]
+
+
+class _Ticket:
+    __slots__ = ('rows', 'check', 'done', 'error', 'enqueued')
+
+    def __init__(self, rows, check=None):
+        self.rows = rows
+        self.check = check
+        self.done = False
+        self.error = None
+        self.enqueued = time.monotonic()
+
+
+class WriteCoordinator:
+    def __init__(self, path, header=None, group_window=0.0, max_batch=64, ids=None, id_column=0):
+        """`header` is written first when the data file is missing or empty.
+        `group_window` is in seconds; `max_batch` caps the rows per write."""
+        self.path = Path(path)
+        self.header = header
+        self.ids = ids
+        self.id_column = id_column
+        self.group_window = group_window
+        self.max_batch = max(1, int(max_batch))
+        self.batch_sizes = Histogram(BATCH_SIZE_BOUNDS)
+        self.commit_latency_ms = Histogram(LATENCY_MS_BOUNDS)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self._mutex = threading.RLock()
+        self._depth = 0
+        self._owner = None
+        self._lock_file = None
+        self._cond = threading.Condition()
+        self._pending = []
+        self._leader_active = False
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the process-wide and cross-process write lock (re-entrant)."""
+        with self._mutex:
+            if self._depth == 0:
+                self._lock_file = open(self.lock_path, 'a')
+                lock_file(self._lock_file)
+                self._owner = threading.get_ident()
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    unlock_file(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def append(self, rows, check=None):
+        """Append `rows` (lists of values) and return once they are fsynced.
+
+        `check(batch_state)` runs under the write lock right before the rows
+        are written; if it raises, these rows are skipped and the exception
+        is re-raised to this caller only. It may instead return the subset
+        of `rows` to write (the same list objects, so ids filled in from
+        `ids` are visible to the caller). `batch_state` is a dict shared by the checks of
+        one batch (e.g. to see slots reserved earlier in it).
+        """
+        ticket = _Ticket(rows, check)
+        if self._owner == threading.get_ident():
+            # called inside exclusive(): the batch leader would wait for our
+            # lock, so write directly
+            self._commit([ticket], leader=False)
+        else:
+            with self._cond:
+                self._pending.append(ticket)
+                # wake a leader that is collecting a group
+                self._cond.notify_all()
+            while True:
+                with self._cond:
+                    while not ticket.done and self._leader_active:
+                        self._cond.wait()
+                    if ticket.done:
+                        break
+                    # nobody is writing: lead a batch of what is queued
+                    self._leader_active = True
+                    self._gather()
+                    batch = self._take_batch()
+                self._commit(batch)
+        if ticket.error:
+            raise ticket.error
+
+    def _queued_rows(self):
+        return sum(len(t.rows) for t in self._pending)
+
+    def _gather(self):
+        # called with self._cond held
+        if self.group_window <= 0:
+            return
+        deadline = time.monotonic() + self.group_window
+        while self._queued_rows() < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+    def _take_batch(self):
+        # called with self._cond held; always takes at least one ticket
+        batch = []
+        rows = 0
+        while self._pending and (not batch or rows + len(self._pending[0].rows) <= self.max_batch):
+            t = self._pending.pop(0)
+            batch.append(t)
+            rows += len(t.rows)
+        return batch
+
+    def _commit(self, batch, leader=True):
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            for t in batch:
+                t.error = t.error or e
+        now = time.monotonic()
+        self.batch_sizes.observe(sum(len(t.rows) for t in batch))
+        for t in batch:
+            self.commit_latency_ms.observe((now - t.enqueued) * 1000.0)
+        with self._cond:
+            for t in batch:
+                t.done = True
+            if leader:
+                self._leader_active = False
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            'group_window_ms': self.group_window * 1000.0,
+            'max_batch': self.max_batch,
+            'batch_size': self.batch_sizes.snapshot(),
+            'commit_latency_ms': self.commit_latency_ms.snapshot(),
+        }
+
+    def _write_batch(self, batch):
+        with self.exclusive():
+            state = {}
+            accepted = []
+            for t in batch:
+                if t.check is not None:
+                    try:
+                        rows = t.check(state)
+                    except Exception as e:
+                        t.error = e
+                        continue
+                    if rows is not None:
+                        t.rows = rows
+                accepted.append(t)
+            if not accepted:
+                return
+            if self.ids is not None:
+                missing = [r for t in accepted for r in t.rows if r[self.id_column] in (None, '')]
+                if missing:
+                    first = self.ids.next_ids(len(missing))
+                    for offset, r in enumerate(missing):
+                        r[self.id_column] = first + offset
+            with self.path.open('a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if self.header and f.tell() == 0:
+                    writer.writerow(self.header)
+                for t in accepted:
+                    writer.writerows(t.rows)
+                f.flush()
+                os.fsync(f.fileno())